@@ -0,0 +1,77 @@
+import os
+import asyncio
+import logging
+import contextvars
+
+# Break-limit breach alerts: when a saved slip moves a number's session total past the break
+# limit (or one of the warning levels below it), the admin is told. Checks compare the
+# number's total before and after the slip, so they cost O(1) per bet; alerts raised within
+# BREACH_DEBOUNCE seconds are sent together as one message.
+BREACH_WARN_LEVELS = sorted(int(level) for level in os.getenv("BREACH_WARN_LEVELS", "80").split(",") if level.strip())  # Percent of the limit
+BREACH_DEBOUNCE = float(os.getenv("BREACH_DEBOUNCE", "3"))  # Seconds to gather alerts before sending
+
+logger = logging.getLogger(__name__)
+
+class BreachAlerts:
+    def __init__(self, send):
+        self.send = send  # async send(text), delivers to the admin
+        self.pending = {}  # {date_key: {number: (level, total, limit)}}, highest level reached since the last alert
+        self.flusher = None
+        self.stats = {'crossings': 0, 'alerts': 0}
+
+    # Levels (percent of the limit) and their amounts, lowest first; 100 is the limit itself
+    @staticmethod
+    def thresholds(limit):
+        return [(level, limit * level // 100) for level in BREACH_WARN_LEVELS if level < 100] + [(100, limit)]
+
+    # `changes` is {number: (total before the slip, total after)} for the numbers a slip touched.
+    # A level is crossed when the total goes from at most its amount to over it, as /break counts
+    def check(self, date_key, limit, changes):
+        if limit is None:
+            return
+        for number, (before, after) in changes.items():
+            if after <= before:
+                continue
+            crossed = None
+            for level, amount in self.thresholds(limit):
+                if before <= amount < after:
+                    crossed = level
+            if crossed is None:
+                continue
+            self.stats['crossings'] += 1
+            session = self.pending.setdefault(date_key, {})
+            previous = session.get(number)
+            session[number] = (max(crossed, previous[0]) if previous else crossed, after, limit)
+        if self.pending and self.flusher is None:
+            # A fresh context keeps the delayed send out of the slip's trace
+            self.flusher = asyncio.get_running_loop().create_task(self._flush_later(), context=contextvars.Context())
+
+    # Forget gathered alerts for a session (its limit changed or its data was deleted)
+    def discard(self, date_key):
+        self.pending.pop(date_key, None)
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(BREACH_DEBOUNCE)
+        finally:
+            self.flusher = None
+        pending, self.pending = self.pending, {}
+        for date_key, numbers in pending.items():
+            try:
+                await self.send(self.format(date_key, numbers))
+                self.stats['alerts'] += 1
+            except Exception as e:
+                logger.error("Error sending breach alert: %s", e)
+
+    @staticmethod
+    def format(date_key, numbers):
+        limit = next(iter(numbers.values()))[2]
+        msg = [f"🚨 {date_key} Break limit ({limit})"]
+        over = sorted((number, total) for number, (level, total, _) in numbers.items() if level >= 100)
+        if over:
+            msg.append("Limit ကျော်ဂဏန်းများ:")
+            msg.extend(f"{number:02d} ➤ {total} (+{total - limit})" for number, total in over)
+        for warn in sorted({level for level, _, _ in numbers.values() if level < 100}, reverse=True):
+            near = sorted((number, total) for number, (level, total, _) in numbers.items() if level == warn)
+            msg.append(f"⚠️ {warn}% ကျော်: " + ", ".join(f"{number:02d} ➤ {total}" for number, total in near))
+        return "\n".join(msg)
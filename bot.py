@@ -3,7 +3,7 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler,
-    CallbackQueryHandler, ContextTypes, filters
+    CallbackQueryHandler, TypeHandler, ContextTypes, filters
 )
 from datetime import datetime, time, timedelta
 from tabulate import tabulate
@@ -11,24 +11,52 @@ import pytz
 import re
 import calendar
 import asyncio
+import math
+import contextvars
+from time import perf_counter
 
 # Import database functions
 from database import (
     init_db, save_user_bet, get_user_bets, delete_user_bet,
     save_break_limit, get_break_limit,
-    save_power_number, get_power_number,
-    save_user_com_za, get_user_com_za, get_all_users,
-    get_available_dates, delete_date_data
+    save_power_number, get_power_number, get_power_numbers,
+    get_user_history_page, session_order,
+    save_user_com_za, get_user_com_za, get_users_com_za, get_all_users, get_session_bets,
+    get_available_dates, delete_date_data,
+    get_query_stats, get_slow_queries, get_explain_plans, reset_query_stats, SLOW_QUERY_MS
 )
+from sender import enqueue_message, send_message, get_send_stats, reply_lines, edit_lines, iter_chunks, MAX_MESSAGE_LENGTH
+from reports import DOCUMENT_FORMATS, document_filename, csv_document, text_document
+from ratelimit import TokenBucket
+from metrics import timed, timed_handlers, count_bets, register_gauge, ErrorLogCounter, start_metrics_server, METRICS_PORT
+from tracing import start_span, end_span, hold_trace, resume_trace, release_trace, TracingRequest
+from profiler import start_profile, stop_profile, is_running as profile_running, note_update
+from logconfig import setup_logging, bind as bind_log_fields
+from state import SessionStore, get_store_stats
+from recorder import record_update, header_pending, RECORD_UPDATES_PATH
+from settlement import build_frame, settle, settlement_rows, settlement_totals, DEFAULT_COM_ZA
+from risk import RiskBook, RISK_BOOK_MAX, BREAKOPT_MAX_LOSS, candidate_limits, evaluate_limits, suggest_limit
+from alerts import BreachAlerts
+from caps import StakeCaps, CAP_KINDS
+from liveledger import LiveLedger
+import journal
+from journal import open_journal, close_journal, after_flush, JOURNAL_PATH
+from export import export_bets, discard_export, EXPORT_FORMATS, EXPORT_MAX_SEND_BYTES
+
+# With a journal open, reads and deletes wait until every acknowledged bet is in the database
+get_user_bets = after_flush(get_user_bets)
+delete_user_bet = after_flush(delete_user_bet)
+get_available_dates = after_flush(get_available_dates)
+delete_date_data = after_flush(delete_date_data)
+get_user_history_page = after_flush(get_user_history_page)
+get_session_bets = after_flush(get_session_bets)
 
 # Environment variables
 TOKEN = os.getenv("BOT_TOKEN")
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")  # e.g. http://127.0.0.1:8081/bot for a local Bot API server
 
-# Logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Logging (queued and written by a background thread)
+setup_logging(extra_handlers=[ErrorLogCounter()])
 logger = logging.getLogger(__name__)
 
 # Timezone setup
@@ -37,16 +65,153 @@ MYANMAR_TIMEZONE = pytz.timezone('Asia/Yangon')
 # Globals (for non-persistent data)
 admin_id = None
 date_control = {}  # {date_key: True/False}
-overbuy_list = {}  # {date_key: {username: {num: amount}}}
-message_store = {}  # {(user_id, message_id): (sent_message_id, bets, total_amount, date_key)}
-overbuy_selections = {}  # {date_key: {username: {num: amount}}}
 current_working_date = None  # For admin date selection
 closed_numbers = set()  # Store closed numbers
+stake_caps = StakeCaps()  # Per-user / per-number stake caps (see caps.py)
+
+# Session state: bounded, and evicted once the session is long settled (see state.py)
+MESSAGE_STORE_MAX = int(os.getenv("MESSAGE_STORE_MAX", "20000"))
+OVERBUY_STORE_MAX = int(os.getenv("OVERBUY_STORE_MAX", "64"))  # Dates kept in overbuy_list/overbuy_selections
+SELECTION_STORE_MAX = int(os.getenv("SELECTION_STORE_MAX", "500"))
+POSTHIS_PAGE_SESSIONS = int(os.getenv("POSTHIS_PAGE_SESSIONS", "3"))  # Sessions per /posthis history page
+overbuy_list = SessionStore("overbuy_list", OVERBUY_STORE_MAX, lambda date_key, _: date_key)  # {date_key: {username: {num: amount}}}
+message_store = SessionStore("message_store", MESSAGE_STORE_MAX, lambda _, value: value[3])  # {(user_id, message_id): (sent_message_id, bet_groups, total_amount, date_key, username, notes)}
+overbuy_selections = SessionStore("overbuy_selections", OVERBUY_STORE_MAX, lambda date_key, _: date_key)  # {date_key: {username: {num: amount}}}
+risk_books = SessionStore("risk_books", RISK_BOOK_MAX, lambda date_key, _: date_key)  # {date_key: RiskBook}
+break_limit_cache = SessionStore("break_limits", OVERBUY_STORE_MAX, lambda date_key, _: date_key)  # {date_key: limit or None}
+power_number_cache = SessionStore("power_numbers", OVERBUY_STORE_MAX, lambda date_key, _: date_key)  # {date_key: number or None}
+selection_store = SessionStore("selections", SELECTION_STORE_MAX)  # {(user_id, 'dateall'|'datedelete'): {date_key: selected}}
+
+# Slip ingestion limits: per-user token buckets (one token per slip line) and a bounded queue
+INGEST_USER_RATE = float(os.getenv("INGEST_USER_RATE", "2"))
+INGEST_USER_BURST = float(os.getenv("INGEST_USER_BURST", "60"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+ingest_buckets = {}  # {user_id: TokenBucket}
+ingest_queue = None  # asyncio.Queue of (update, context, held trace), created on first use
+ingest_worker = None
+ingest_stats = {'accepted': 0, 'rate_limited': 0, 'shed': 0}
+ingest_rejections = {}  # {username: rejected count}
+
+# Store one slip's [(number, amount)] bets: through the journal when one is open, else row by row
+async def save_bets(username, date_key, bets):
+    # With a break limit set or a live ledger open, the session's risk book tracks number
+    # totals for breach alerts and ledger edits; it is loaded before the save so this slip is
+    # counted exactly once
+    if date_key in live_ledger.messages or await session_break_limit(date_key) is not None:
+        await load_risk_book(date_key)
+    if journal.journal is not None:
+        await journal.journal.append(username, date_key, bets)
+    else:
+        for num, amt in bets:
+            await save_user_bet(username, date_key, num, amt)
+    await record_risk(username, date_key, bets)
+
+# Keep a loaded risk book (risk.py) in step with the bets just saved
+async def record_risk(username, date_key, bets):
+    book = risk_books.get(date_key)
+    if book is not None:
+        rates = None if username in book.stakes else await get_user_com_za(username)
+        touched = {num for num, _ in bets}
+        before = {num: int(book.numbers[num]) for num in touched}
+        book.add(username, bets, rates)
+        breach_alerts.check(date_key, break_limit_cache.get(date_key),
+                            {num: (before[num], int(book.numbers[num])) for num in touched})
+    live_ledger.mark(date_key)
+
+# Break limit of a session, read from the database once and then kept current by /break
+async def session_break_limit(date_key):
+    if date_key not in break_limit_cache:
+        break_limit_cache[date_key] = await get_break_limit(date_key)
+    return break_limit_cache.get(date_key)
+
+async def notify_admin(text):
+    if admin_id is not None and alert_bot is not None:
+        await send_message(alert_bot, admin_id, text)
+
+# Power number of a session, read from the database once and then kept current by /pnumber
+async def session_power_number(date_key):
+    if date_key not in power_number_cache:
+        power_number_cache[date_key] = await get_power_number(date_key)
+    return power_number_cache.get(date_key)
+
+# Live ledger text from the session's risk book, which holds every number's running total
+async def render_live_ledger(date_key):
+    book = await load_risk_book(date_key)
+    lines = ledger_lines(date_key, book.numbers.tolist(), await session_power_number(date_key))
+    if lines is None:
+        lines = [f"📒 {date_key} လက်ကျန်ငွေစာရင်း", f"ℹ️ {date_key} အတွက် လက်ရှိတွင် လောင်းကြေးမရှိပါ"]
+    return "🔄 Live\n" + "\n".join(lines)
+
+async def edit_live_ledger(chat_id, message_id, text):
+    await alert_bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+
+alert_bot = None  # Bot that sends breach alerts and live ledger edits, set by build_application
+breach_alerts = BreachAlerts(notify_admin)
+live_ledger = LiveLedger(render_live_ledger, edit_live_ledger)
+
+# The session's risk book, built from the database the first time it is asked for. Nothing
+# between the read and storing the book suspends (queries run on the event loop), so every
+# bet is either in the read or recorded into the stored book afterwards.
+async def load_risk_book(date_key):
+    book = risk_books.get(date_key)
+    if book is None:
+        frame = build_frame(await get_session_bets([date_key]), [date_key])
+        book = RiskBook.from_frame(date_key, frame, await get_users_com_za(frame['users']))
+        risk_books[date_key] = book
+    return book
 
 def reverse_number(n):
     s = str(n).zfill(2)
     return int(s[::-1])
 
+COMPACT_GROUP_SIZE = 8  # Numbers shown per amount in a slip confirmation before it is cut short
+
+# Group "NN-amount" bets by amount: {amount: bytes(numbers)} in first-seen order.
+# Numbers are 0-99, so each one fits in a single byte.
+def group_bets(bets):
+    groups = {}
+    for bet in bets:
+        num, amt = bet.split('-')
+        groups.setdefault(int(amt), bytearray()).append(int(num))
+    return {amt: bytes(nums) for amt, nums in groups.items()}
+
+def iter_grouped_bets(groups):
+    for amt, nums in groups.items():
+        for num in nums:
+            yield num, amt
+
+# One line per distinct amount, e.g. "12 21 34 43 ... @1000 (×24)"
+def format_bet_groups(groups):
+    lines = []
+    for amt, nums in groups.items():
+        text = " ".join(f"{n:02d}" for n in nums[:COMPACT_GROUP_SIZE])
+        if len(nums) > COMPACT_GROUP_SIZE:
+            text += " ..."
+        count = f" (×{len(nums)})" if len(nums) > 1 else ""
+        lines.append(f"{text} @{amt}{count}")
+    return lines
+
+# `notes` are the slip's blocked/capped lines, shown under either view
+def bet_reply_lines(groups, total_amount, full=False, notes=()):
+    lines = []
+    if groups:
+        if full:
+            lines = [f"{num:02d}-{amt}" for num, amt in iter_grouped_bets(groups)]
+        else:
+            lines = format_bet_groups(groups)
+        lines.append(f"စုစုပေါင်း {total_amount} ကျပ်")
+    lines.extend(notes)
+    return lines
+
+def bet_reply_markup(user_id, message_id, date_key, username, groups, full=False):
+    keyboard = [[InlineKeyboardButton("🗑 Delete", callback_data=f"delete:{user_id}:{message_id}:{date_key}:{username}")]]
+    if any(len(nums) > COMPACT_GROUP_SIZE for nums in groups.values()):
+        if full:
+            keyboard[0].append(InlineKeyboardButton("🔼 Compact", callback_data=f"bets_view:compact:{user_id}:{message_id}"))
+        else:
+            keyboard[0].append(InlineKeyboardButton("📋 Show all", callback_data=f"bets_view:full:{user_id}:{message_id}"))
+    return InlineKeyboardMarkup(keyboard)
+
 def get_time_segment():
     now = datetime.now(MYANMAR_TIMEZONE).time()
     return "AM" if now < time(12, 0) else "PM"
@@ -55,6 +220,7 @@ def get_current_date_key():
     now = datetime.now(MYANMAR_TIMEZONE)
     return f"{now.strftime('%d/%m/%Y')} {get_time_segment()}"
 
+@timed
 async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = []
     if update.effective_user.id == admin_id:
@@ -76,6 +242,7 @@ async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
     await update.message.reply_text("မီနူးကိုရွေးချယ်ပါ", reply_markup=reply_markup)
 
+@timed
 async def handle_menu_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
     command_map = {
@@ -132,6 +299,7 @@ async def handle_menu_selection(update: Update, context: ContextTypes.DEFAULT_TY
         elif command == "/numclose":
             await numclose(update, context)
 
+@timed
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id, current_working_date
     
@@ -140,16 +308,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await init_db()
         logger.info("Database initialized successfully")
     except Exception as e:
-        logger.error(f"Failed to initialize database: {str(e)}")
+        logger.error("Failed to initialize database: %s", e)
         await update.message.reply_text("❌ Database initialization failed. Please check logs.")
         return
     
     admin_id = update.effective_user.id
     current_working_date = get_current_date_key()
-    logger.info(f"Admin set to: {admin_id}")
+    logger.info("Admin set to: %s", admin_id)
     await update.message.reply_text("🤖 Bot started. Admin privileges granted!")
     await show_menu(update, context)
 
+@timed
 async def dateopen(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id
     if update.effective_user.id != admin_id:
@@ -158,9 +327,10 @@ async def dateopen(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     key = get_current_date_key()
     date_control[key] = True
-    logger.info(f"Ledger opened for {key}")
+    logger.info("Ledger opened for %s", key)
     await update.message.reply_text(f"✅ {key} စာရင်းဖွင့်ပြီးပါပြီ")
 
+@timed
 async def dateclose(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id
     if update.effective_user.id != admin_id:
@@ -169,9 +339,10 @@ async def dateclose(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     key = get_current_date_key()
     date_control[key] = False
-    logger.info(f"Ledger closed for {key}")
+    logger.info("Ledger closed for %s", key)
     await update.message.reply_text(f"✅ {key} စာရင်းပိတ်လိုက်ပါပြီ")
 
+@timed
 async def numclose(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id, closed_numbers
     if update.effective_user.id != admin_id:
@@ -242,6 +413,7 @@ async def numclose(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     new_numbers.add(reverse_number(num_int))
 
         closed_numbers.update(new_numbers)
+        live_ledger.mark_all()
         
         nums_str = " ".join(f"{n:02d}" for n in sorted(closed_numbers))
         keyboard = [[InlineKeyboardButton("🗑 Delete All", callback_data="numclose_delete_all")]]
@@ -253,18 +425,121 @@ async def numclose(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     except Exception as e:
-        logger.error(f"Error in numclose: {str(e)}")
+        logger.error("Error in numclose: %s", e)
         await update.message.reply_text("❌ Error processing numbers. Please check your input.")
 
+@timed
 async def numclose_delete_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     global closed_numbers
     closed_numbers = set()
+    live_ledger.mark_all()
     await query.edit_message_text("✅ All closed numbers have been cleared")
 
+@timed
+async def caps(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global admin_id
+    if update.effective_user.id != admin_id:
+        await update.message.reply_text("❌ Admin only command")
+        return
+    
+    usage = (
+        "ℹ️ Usage: /caps user NAME|* AMOUNT|off\n"
+        "/caps number NN|* AMOUNT|off\n"
+        "/caps user_number NAME|* AMOUNT|off\n"
+        "/caps clear"
+    )
+    args = context.args
+    if args and args[0].lower() == "clear":
+        stake_caps.clear()
+        await update.message.reply_text("✅ Caps အားလုံးဖျက်ပြီးပါပြီ")
+        return
+    if args:
+        kind = args[0].lower()
+        try:
+            if kind not in CAP_KINDS or len(args) != 3:
+                raise ValueError
+            key = args[1]
+            if kind == "number" and key != '*':
+                key = int(key)
+                if not 0 <= key <= 99:
+                    raise ValueError
+            amount = None if args[2].lower() == "off" else int(args[2])
+            if amount is not None and amount < 0:
+                raise ValueError
+        except ValueError:
+            await update.message.reply_text(usage)
+            return
+        stake_caps.set(kind, key, amount)
+    
+    lines = stake_caps.describe()
+    if not lines:
+        await update.message.reply_text(f"ℹ️ Cap မသတ်မှတ်ရသေးပါ\n{usage}")
+        return
+    await update.message.reply_text("✂️ Stake caps (per session)\n" + "\n".join(lines))
+
+def get_ingest_queue():
+    global ingest_queue, ingest_worker
+    if ingest_queue is None:
+        ingest_queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    if ingest_worker is None or ingest_worker.done():
+        # A fresh context keeps the worker from inheriting the first caller's trace
+        ingest_worker = asyncio.get_running_loop().create_task(run_ingest_worker(), context=contextvars.Context())
+    return ingest_queue
+
+async def run_ingest_worker():
+    while True:
+        update, context, held_trace = await ingest_queue.get()
+        trace = resume_trace(held_trace)
+        try:
+            await process_message(update, context)
+        except Exception as e:
+            logger.error("Error in ingest worker: %s", e)
+        finally:
+            release_trace(trace)
+            ingest_queue.task_done()
+
+def get_ingest_bucket(user_id):
+    bucket = ingest_buckets.get(user_id)
+    if bucket is None:
+        if len(ingest_buckets) >= 1000:
+            for uid in [u for u, b in ingest_buckets.items() if b.is_idle()]:
+                del ingest_buckets[uid]
+        bucket = ingest_buckets[user_id] = TokenBucket(INGEST_USER_RATE, INGEST_USER_BURST)
+    return bucket
+
+# Admit a slip through the user's token bucket and the global queue; the worker does the rest
+@timed
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    text = update.message.text or ""
+    
+    if user and user.id != admin_id:
+        cost = min(INGEST_USER_BURST, max(1, sum(1 for line in text.split('\n') if line.strip())))
+        bucket = get_ingest_bucket(user.id)
+        if not bucket.try_take(cost):
+            ingest_stats['rate_limited'] += 1
+            name = user.username or str(user.id)
+            ingest_rejections[name] = ingest_rejections.get(name, 0) + 1
+            await update.message.reply_text(
+                f"⏳ မက်ဆေ့ဂျ်များ အလွန်မြန်နေပါသည်။ {math.ceil(bucket.wait_time(cost))} စက္ကန့်အကြာ ပြန်ပို့ပါ"
+            )
+            return
+    
+    held_trace = hold_trace()
+    try:
+        get_ingest_queue().put_nowait((update, context, held_trace))
+        ingest_stats['accepted'] += 1
+    except asyncio.QueueFull:
+        release_trace(held_trace[0])
+        ingest_stats['shed'] += 1
+        logger.warning("Ingest queue full, asking user to retry")
+        await update.message.reply_text("⏳ စနစ်အလုပ်များနေပါသည်။ ခဏအကြာ ပြန်ပို့ပါ")
+
+@timed
+async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user = update.effective_user
         text = update.message.text
@@ -290,6 +565,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         username = target_username if target_username else user.username
 
         key = get_current_date_key()
+        bind_log_fields(date_key=key)
         if not date_control.get(key, False):
             await update.message.reply_text("❌ စာရင်းပိတ်ထားပါသည်")
             return
@@ -298,6 +574,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("⚠️ မက်ဆေ့ဂျ်မရှိပါ")
             return
 
+        parse_span = start_span("parse")
         lines = text.split('\n')
         all_bets = []
         total_amount = 0
@@ -488,42 +765,56 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         all_bets.append(f"{num:02d}-{amount}")
                         total_amount += amount
 
-        if not all_bets and not blocked_bets:
+        end_span(parse_span, lines=len(lines), bets=len(all_bets), blocked=len(blocked_bets))
+        
+        # Caps are checked against the session's running totals; what does not fit is cut back
+        capped_bets = []
+        if stake_caps.active() and all_bets:
+            book = await load_risk_book(key)
+            accepted, capped_bets = stake_caps.apply(book, username, [(int(num), int(amt)) for num, amt in (bet.split('-') for bet in all_bets)])
+            all_bets = [f"{num:02d}-{amt}" for num, amt in accepted]
+            total_amount = sum(amt for _, amt in accepted)
+        
+        count_bets(len(all_bets), len(blocked_bets) + sum(1 for _, _, got in capped_bets if not got))
+        if not all_bets and not blocked_bets and not capped_bets:
             await update.message.reply_text("⚠️ အချက်အလက်များကိုစစ်ဆေးပါ\nဥပမာ: 12-1000,12/34-1000 \n 12r1000,12r1000-500")
             return
 
         # Save all bets to database
+        slip_bets = []
         for bet in all_bets:
             num, amt = bet.split('-')
-            num = int(num)
-            amt = int(amt)
-            
-            await save_user_bet(username, key, num, amt)
+            slip_bets.append((int(num), int(amt)))
+        if slip_bets:
+            await save_bets(username, key, slip_bets)
 
-        response_parts = []
-        if all_bets:
-            response_parts.append("\n".join(all_bets))
-            response_parts.append(f"စုစုပေါင်း {total_amount} ကျပ်")
+        # Confirm compactly: one line per distinct amount, full list on demand
+        bet_groups = group_bets(all_bets)
+        notes = []
         
         if blocked_bets:
-            blocked_nums = ", ".join(set(bet.split('-')[0] for bet in blocked_bets))
-            response_parts.append(f"\n🚫 ပိတ်ထားသောဂဏန်းများ: {blocked_nums} (မရပါ)")
+            blocked_nums = ", ".join(dict.fromkeys(bet.split('-')[0] for bet in blocked_bets))
+            notes.append(f"\n🚫 ပိတ်ထားသောဂဏန်းများ: {blocked_nums} (မရပါ)")
+        
+        if capped_bets:
+            capped = ", ".join(f"{num:02d} ({asked}→{got})" for num, asked, got in capped_bets)
+            notes.append(f"\n✂️ Cap ပြည့်သွားသောဂဏန်းများ: {capped}")
 
-        keyboard = [[InlineKeyboardButton("🗑 Delete", callback_data=f"delete:{user.id}:{update.message.message_id}:{key}:{username}")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = bet_reply_markup(user.id, update.message.message_id, key, username, bet_groups)
         
         sent_message = await update.message.reply_text(
-            "\n".join(response_parts),
+            "\n".join(bet_reply_lines(bet_groups, total_amount, notes=notes)),
             reply_markup=reply_markup
         )
         
-        message_store[(user.id, update.message.message_id)] = (sent_message.message_id, all_bets, total_amount, key, username)
+        message_store[(user.id, update.message.message_id)] = (sent_message.message_id, bet_groups, total_amount, key, username, notes)
             
     except Exception as e:
-        logger.error(f"Error in handle_message: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in process_message: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
         
         
+@timed
 async def delete_bet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -546,9 +837,10 @@ async def delete_bet(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("⚠️ သေချာလား? ဒီလောင်းကြေးကိုဖျက်မှာလား?", reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Error in delete_bet: {str(e)}")
+        logger.error("Error in delete_bet: %s", e)
         await query.edit_message_text("❌ Error occurred while processing deletion")
 
+@timed
 async def confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -562,23 +854,23 @@ async def confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text("❌ ဒေတာမတွေ့ပါ")
             return
             
-        sent_message_id, bets, total_amount, _, _ = message_store[(user_id, message_id)]
+        sent_message_id, bet_groups, total_amount, _, _, _ = message_store[(user_id, message_id)]
         
         # Delete each bet from database
-        for bet in bets:
-            num, amt = bet.split('-')
-            num = int(num)
-            amt = int(amt)
-            
+        for num, amt in iter_grouped_bets(bet_groups):
             await delete_user_bet(username, date_key, num, amt)
+        # A delete can remove matching bets of other slips too; rebuild the risk book when next needed
+        risk_books.pop(date_key)
+        live_ledger.mark(date_key)
         
         del message_store[(user_id, message_id)]
         await query.edit_message_text("✅ လောင်းကြေးဖျက်ပြီးပါပြီ")
         
     except Exception as e:
-        logger.error(f"Error in confirm_delete: {str(e)}")
+        logger.error("Error in confirm_delete: %s", e)
         await query.edit_message_text("❌ Error occurred while deleting bet")
 
+@timed
 async def cancel_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -589,18 +881,67 @@ async def cancel_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message_id = int(message_id_str)
         
         if (user_id, message_id) in message_store:
-            sent_message_id, bets, total_amount, _, _ = message_store[(user_id, message_id)]
-            response = "\n".join(bets) + f"\nစုစုပေါင်း {total_amount} ကျပ်"
-            keyboard = [[InlineKeyboardButton("🗑 Delete", callback_data=f"delete:{user_id}:{message_id}:{date_key}:{username}")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            sent_message_id, bet_groups, total_amount, _, _, notes = message_store[(user_id, message_id)]
+            response = "\n".join(bet_reply_lines(bet_groups, total_amount, notes=notes))
+            reply_markup = bet_reply_markup(user_id, message_id, date_key, username, bet_groups)
             await query.edit_message_text(response, reply_markup=reply_markup)
         else:
             await query.edit_message_text("ℹ️ ဖျက်ခြင်းကိုပယ်ဖျက်လိုက်ပါပြီ")
             
     except Exception as e:
-        logger.error(f"Error in cancel_delete: {str(e)}")
+        logger.error("Error in cancel_delete: %s", e)
         await query.edit_message_text("❌ Error occurred while canceling deletion")
 
+@timed
+async def show_bets(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    try:
+        _, mode, user_id_str, message_id_str = query.data.split(':')
+        user_id = int(user_id_str)
+        message_id = int(message_id_str)
+        
+        if (user_id, message_id) not in message_store:
+            await query.edit_message_text("❌ ဒေတာမတွေ့ပါ")
+            return
+            
+        sent_message_id, bet_groups, total_amount, date_key, username, notes = message_store[(user_id, message_id)]
+        full = mode == "full"
+        reply_markup = bet_reply_markup(user_id, message_id, date_key, username, bet_groups, full=full)
+        await edit_lines(query, bet_reply_lines(bet_groups, total_amount, full=full, notes=notes), reply_markup=reply_markup)
+        
+    except Exception as e:
+        logger.error("Error in show_bets: %s", e)
+        await query.edit_message_text("❌ Error occurred")
+
+# /ledger lines from the session's total on each number; None when no number has a positive total
+def ledger_lines(date_key, number_totals, pnum):
+    lines = [f"📒 {date_key} လက်ကျန်ငွေစာရင်း"]
+    total_all_numbers = 0
+    
+    for i in range(100):
+        total = number_totals[i]
+        if total > 0:
+            if pnum is not None and i == pnum:
+                lines.append(f"🔴 {i:02d} ➤ {total} 🔴")
+            elif i in closed_numbers:
+                lines.append(f"🚫 {i:02d} ➤ {total} (Closed)")
+            else:
+                lines.append(f"{i:02d} ➤ {total}")
+            total_all_numbers += total
+    
+    if len(lines) == 1:
+        return None
+    if pnum is not None:
+        lines.append(f"\n🔴 Power Number: {pnum:02d} ➤ {number_totals[pnum]}")
+    if closed_numbers:
+        closed_str = " ".join(f"{n:02d}" for n in sorted(closed_numbers))
+        lines.append(f"\n🔒 Closed Numbers: {closed_str}")
+    lines.append(f"\n💰 စုစုပေါင်း: {total_all_numbers} ကျပ်")
+    return lines
+
+@timed
 async def ledger_summary(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id, current_working_date, closed_numbers
     try:
@@ -609,6 +950,7 @@ async def ledger_summary(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
             
         date_key = current_working_date if current_working_date else get_current_date_key()
+        bind_log_fields(date_key=date_key)
         
         # Get all bets for this date from database
         bets = await get_user_bets(date_key=date_key)
@@ -618,45 +960,73 @@ async def ledger_summary(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
             
         # Calculate totals per number
-        number_totals = {}
+        number_totals = [0] * 100
         for bet in bets:
-            num = bet['number']
-            amt = bet['amount']
-            number_totals[num] = number_totals.get(num, 0) + amt
+            number_totals[bet['number']] += bet['amount']
         
-        lines = [f"📒 {date_key} လက်ကျန်ငွေစာရင်း"]
-        total_all_numbers = 0
-        
-        for i in range(100):
-            total = number_totals.get(i, 0)
-            if total > 0:
-                pnum = await get_power_number(date_key)
-                if pnum is not None and i == pnum:
-                    lines.append(f"🔴 {i:02d} ➤ {total} 🔴")
-                elif i in closed_numbers:
-                    lines.append(f"🚫 {i:02d} ➤ {total} (Closed)")
-                else:
-                    lines.append(f"{i:02d} ➤ {total}")
-                total_all_numbers += total
-
-        if len(lines) == 1:
+        lines = ledger_lines(date_key, number_totals, await get_power_number(date_key))
+        if lines is None:
             await update.message.reply_text(f"ℹ️ {date_key} အတွက် လက်ရှိတွင် လောင်းကြေးမရှိပါ")
         else:
-            pnum = await get_power_number(date_key)
-            if pnum is not None:
-                lines.append(f"\n🔴 Power Number: {pnum:02d} ➤ {number_totals.get(pnum, 0)}")
-            
-            if closed_numbers:
-                closed_str = " ".join(f"{n:02d}" for n in sorted(closed_numbers))
-                lines.append(f"\n🔒 Closed Numbers: {closed_str}")
+            await reply_lines(update.message, lines)
+    except Exception as e:
+        logger.error("Error in ledger: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
+
+
+@timed
+async def liveledger(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global admin_id, current_working_date
+    try:
+        if update.effective_user.id != admin_id:
+            await update.message.reply_text("❌ Admin only command")
+            return
             
-            lines.append(f"\n💰 စုစုပေါင်း: {total_all_numbers} ကျပ်")
-            await update.message.reply_text("\n".join(lines))
+        date_key = current_working_date if current_working_date else get_current_date_key()
+        bind_log_fields(date_key=date_key)
+        mode = context.args[0].lower() if context.args else None
+        
+        if mode == "on":
+            # A new message replaces any earlier one for the session (e.g. after it was deleted)
+            previous = live_ledger.stop(date_key)
+            if previous:
+                await unpin_live_ledger(context.bot, *previous)
+            text = await render_live_ledger(date_key)
+            sent = await update.message.reply_text(text)
+            live_ledger.start(date_key, sent.chat_id, sent.message_id, text)
+            try:
+                await context.bot.pin_chat_message(sent.chat_id, sent.message_id, disable_notification=True)
+            except Exception as e:
+                logger.error("Error pinning live ledger: %s", e)
+            return
+        if mode == "off":
+            previous = live_ledger.stop(date_key)
+            if previous is None:
+                await update.message.reply_text(f"ℹ️ {date_key} အတွက် Live ledger မဖွင့်ထားပါ")
+                return
+            await unpin_live_ledger(context.bot, *previous)
+            await update.message.reply_text(f"✅ {date_key} Live ledger ပိတ်လိုက်ပါပြီ")
+            return
+        
+        stats = live_ledger.stats
+        sessions = ", ".join(live_ledger.messages.keys()) or "-"
+        await update.message.reply_text(
+            "ℹ️ Usage: /liveledger on|off\n"
+            f"🔄 Live: {sessions}\n"
+            f"Edits: {stats['edits']} for {stats['marks']} changes "
+            f"(unchanged: {stats['unchanged']}, failed: {stats['failed']}, flood waits: {stats['retry_after']})"
+        )
     except Exception as e:
-        logger.error(f"Error in ledger: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in liveledger: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+async def unpin_live_ledger(bot, chat_id, message_id):
+    try:
+        await bot.unpin_chat_message(chat_id, message_id=message_id)
+    except Exception as e:
+        logger.error("Error unpinning live ledger: %s", e)
         
+@timed
 async def break_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id, current_working_date
     try:
@@ -666,6 +1036,7 @@ async def break_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Determine which date to work on
         date_key = current_working_date if current_working_date else get_current_date_key()
+        bind_log_fields(date_key=date_key)
             
         if not context.args:
             limit = await get_break_limit(date_key)
@@ -678,6 +1049,8 @@ async def break_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             new_limit = int(context.args[0])
             await save_break_limit(date_key, new_limit)
+            break_limit_cache[date_key] = new_limit
+            breach_alerts.discard(date_key)
             await update.message.reply_text(f"✅ {date_key} အတွက် Break limit ကို {new_limit} အဖြစ်သတ်မှတ်ပြီးပါပြီ")
             
             # Get all bets for this date to show over-limit numbers
@@ -704,15 +1077,16 @@ async def break_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if not found:
                 await update.message.reply_text(f"ℹ️ {date_key} အတွက် ဘယ်ဂဏန်းမှ limit ({new_limit}) မကျော်ပါ")
             else:
-                await update.message.reply_text("\n".join(msg))
+                await reply_lines(update.message, msg)
                 
         except ValueError:
             await update.message.reply_text("⚠️ Limit amount ထည့်ပါ (ဥပမာ: /break 5000)")
             
     except Exception as e:
-        logger.error(f"Error in break: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in break: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def overbuy(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id, current_working_date
     try:
@@ -722,6 +1096,7 @@ async def overbuy(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Determine which date to work on
         date_key = current_working_date if current_working_date else get_current_date_key()
+        bind_log_fields(date_key=date_key)
             
         if not context.args:
             await update.message.reply_text("ℹ️ /overbuy ကာဒိုင်အမည်ထည့်ပါ")
@@ -776,9 +1151,10 @@ async def overbuy(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("\n".join(msg), reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Error in overbuy: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in overbuy: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def overbuy_select(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -830,9 +1206,10 @@ async def overbuy_select(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("\n".join(msg), reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Error in overbuy_select: {str(e)}")
+        logger.error("Error in overbuy_select: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def overbuy_select_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -889,9 +1266,10 @@ async def overbuy_select_all(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.edit_message_text("\n".join(msg), reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Error in overbuy_select_all: {str(e)}")
+        logger.error("Error in overbuy_select_all: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def overbuy_unselect_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -946,9 +1324,10 @@ async def overbuy_unselect_all(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.edit_message_text("\n".join(msg), reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Error in overbuy_unselect_all: {str(e)}")
+        logger.error("Error in overbuy_unselect_all: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def overbuy_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -973,10 +1352,10 @@ async def overbuy_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         total_amount = 0
         bets = []
         for num, amt in selected_numbers.items():
-            # Save negative amount to represent overbuy
-            await save_user_bet(username, date_key, num, -amt)
             bets.append(f"{num:02d}-{amt}")
             total_amount += amt
+        # Save negative amounts to represent overbuy
+        await save_bets(username, date_key, [(num, -amt) for num, amt in selected_numbers.items()])
         
         # Initialize overbuy_list for date if needed
         if date_key not in overbuy_list:
@@ -987,9 +1366,10 @@ async def overbuy_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(response)
         
     except Exception as e:
-        logger.error(f"Error in overbuy_confirm: {str(e)}")
+        logger.error("Error in overbuy_confirm: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def pnumber(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id, current_working_date
     try:
@@ -999,6 +1379,7 @@ async def pnumber(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Determine which date to work on
         date_key = current_working_date if current_working_date else get_current_date_key()
+        bind_log_fields(date_key=date_key)
             
         if not context.args:
             pnum = await get_power_number(date_key)
@@ -1015,6 +1396,8 @@ async def pnumber(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
                 
             await save_power_number(date_key, num)
+            power_number_cache[date_key] = num
+            live_ledger.mark(date_key)
             await update.message.reply_text(f"✅ {date_key} အတွက် Power Number ကို {num:02d} အဖြစ်သတ်မှတ်ပြီး")
             
             # Show report for this date
@@ -1037,7 +1420,7 @@ async def pnumber(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             if msg:
                 msg.append(f"\n🔴 {date_key} အတွက် Power Number စုစုပေါင်း: {total_power}")
-                await update.message.reply_text("\n".join(msg))
+                await reply_lines(update.message, msg)
             else:
                 await update.message.reply_text(f"ℹ️ {date_key} အတွက် {num:02d} အတွက် လောင်းကြေးမရှိပါ")
                 
@@ -1045,9 +1428,10 @@ async def pnumber(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("⚠️ ဂဏန်းမှန်မှန်ထည့်ပါ (ဥပမာ: /pnumber 15)")
             
     except Exception as e:
-        logger.error(f"Error in pnumber: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in pnumber: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def comandza(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id
     try:
@@ -1063,9 +1447,10 @@ async def comandza(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard = [[InlineKeyboardButton(u, callback_data=f"comza:{u}")] for u in users]
         await update.message.reply_text("👉 User ကိုရွေးပါ", reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
-        logger.error(f"Error in comandza: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in comandza: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def comza_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         query = update.callback_query
@@ -1073,9 +1458,10 @@ async def comza_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['selected_user'] = query.data.split(":")[1]
         await query.edit_message_text(f"👉 {context.user_data['selected_user']} ကိုရွေးထားသည်။ 15/80 လို့ထည့်ပါ")
     except Exception as e:
-        logger.error(f"Error in comza_input: {str(e)}")
-        await query.edit_message_text(f"❌ Error: {str(e)}")
+        logger.error("Error in comza_input: %s", e)
+        await query.edit_message_text(f"❌ Error: {e}")
 
+@timed
 async def comza_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user = context.user_data.get('selected_user')
@@ -1097,6 +1483,8 @@ async def comza_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     raise ValueError
                     
                 await save_user_com_za(user, com, za)
+                for book in risk_books.values():
+                    book.set_rates(user, com, za)
                 del context.user_data['selected_user']
                 await update.message.reply_text(f"✅ Com {com}%, Za {za} မှတ်ထားပြီး")
             except:
@@ -1104,9 +1492,10 @@ async def comza_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await update.message.reply_text("⚠️ ဖော်မတ်မှားနေပါသည်။ 15/80 လို့ထည့်ပါ")
     except Exception as e:
-        logger.error(f"Error in comza_text: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in comza_text: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def total(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id, current_working_date
     try:
@@ -1116,6 +1505,7 @@ async def total(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Determine which date to work on
         date_key = current_working_date if current_working_date else get_current_date_key()
+        bind_log_fields(date_key=date_key)
             
         pnum = await get_power_number(date_key)
         if pnum is None:
@@ -1123,62 +1513,44 @@ async def total(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
             
         # Get all bets for this date
-        bets = await get_user_bets(date_key=date_key)
+        bets = await get_session_bets([date_key])
         if not bets:
             await update.message.reply_text(f"ℹ️ {date_key} အတွက် လောင်းကြေးမရှိပါ")
             return
             
         msg = [f"📊 {date_key} အတွက် စုပေါင်းရလဒ်"]
-        total_net = 0
         
-        # Group bets by user
-        user_totals = {}
-        user_power = {}
+        # Settle every user at once (see settlement.py)
+        frame = build_frame(bets, [date_key])
+        result = settle(frame, {date_key: pnum}, await get_users_com_za(frame['users']))
+        total_net = settlement_totals(result)['net']
         
-        for bet in bets:
-            user = bet['username']
-            num = bet['number']
-            amt = bet['amount']
-            
-            # Total amount
-            user_totals[user] = user_totals.get(user, 0) + amt
-            
-            # Power number amount
-            if num == pnum:
-                user_power[user] = user_power.get(user, 0) + amt
-        
-        # Calculate for each user
-        for user, total_amt in user_totals.items():
-            com, za = await get_user_com_za(user)
-            commission_amt = (total_amt * com) // 100
-            after_com = total_amt - commission_amt
-            win_amt = user_power.get(user, 0) * za
-            
-            net = after_com - win_amt
+        for row in settlement_rows(result):
+            net = row['net']
             status = "ဒိုင်ကပေးရမည်" if net < 0 else "ဒိုင်ကရမည်"
             
             user_report = (
-                f"👤 {user}\n"
-                f"💵 စုစုပေါင်း: {total_amt}\n"
-                f"📊 Com({com}%) ➤ {commission_amt}\n"
-                f"💰 Com ပြီး: {after_com}\n"
-                f"🔢 Power Number({pnum:02d}) ➤ {user_power.get(user, 0)}\n"
-                f"🎯 Za({za}) ➤ {win_amt}\n"
+                f"👤 {row['username']}\n"
+                f"💵 စုစုပေါင်း: {row['total']}\n"
+                f"📊 Com({row['com']}%) ➤ {row['commission']}\n"
+                f"💰 Com ပြီး: {row['after_com']}\n"
+                f"🔢 Power Number({pnum:02d}) ➤ {row['power']}\n"
+                f"🎯 Za({row['za']}) ➤ {row['win']}\n"
                 f"📈 ရလဒ်: {abs(net)} ({status})\n"
                 "-----------------"
             )
             msg.append(user_report)
-            total_net += net
 
         if len(msg) > 1:
             msg.append(f"\n📊 စုစုပေါင်းရလဒ်: {abs(total_net)} ({'ဒိုင်အရှုံး' if total_net < 0 else 'ဒိုင်အမြတ်'})")
-            await update.message.reply_text("\n".join(msg))
+            await reply_lines(update.message, msg)
         else:
             await update.message.reply_text(f"ℹ️ {date_key} အတွက် ဒေတာမရှိပါ")
     except Exception as e:
-        logger.error(f"Error in total: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in total: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def tsent(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id, current_working_date
     try:
@@ -1188,6 +1560,7 @@ async def tsent(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Determine which date to work on
         date_key = current_working_date if current_working_date else get_current_date_key()
+        bind_log_fields(date_key=date_key)
             
         # Get all bets for this date
         bets = await get_user_bets(date_key=date_key)
@@ -1203,6 +1576,33 @@ async def tsent(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 user_bets[user] = []
             user_bets[user].append((bet['number'], bet['amount']))
         
+        # /tsent csv or /tsent file sends a single document instead of chat messages
+        fmt = DOCUMENT_FORMATS.get(context.args[0].lower()) if context.args else None
+        if fmt:
+            if fmt == "csv":
+                document = csv_document(
+                    ["username", "date", "number", "amount"],
+                    ((user, date_key, f"{num:02d}", amt) for user, rows in user_bets.items() for num, amt in rows)
+                )
+            else:
+                document = text_document(
+                    (
+                        f"👤 {user} - {date_key}:",
+                        ["Number", "Amount"],
+                        ((f"{num:02d}", amt) for num, amt in rows),
+                        f"💵 စုစုပေါင်း: {sum(amt for _, amt in rows)}"
+                    )
+                    for user, rows in user_bets.items()
+                )
+            await update.message.reply_document(
+                document,
+                filename=document_filename(f"tsent {date_key}", fmt),
+                caption=f"✅ {date_key} အတွက် စာရင်းများ ({len(user_bets)} users)"
+            )
+            return
+        
+        # Pack every report into as few messages as possible
+        reports = []
         for user, bets in user_bets.items():
             user_report = [f"👤 {user} - {date_key}:"]
             total_amt = 0
@@ -1212,13 +1612,15 @@ async def tsent(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 total_amt += amt
             
             user_report.append(f"💵 စုစုပေါင်း: {total_amt}")
-            await update.message.reply_text("\n".join(user_report))
+            reports.extend(user_report)
         
-        await update.message.reply_text(f"✅ {date_key} အတွက် စာရင်းများအားလုံး ပေးပို့ပြီးပါပြီ")
+        reports.append(f"✅ {date_key} အတွက် စာရင်းများအားလုံး ပေးပို့ပြီးပါပြီ")
+        await reply_lines(update.message, reports)
     except Exception as e:
-        logger.error(f"Error in tsent: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in tsent: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
         
+@timed
 async def alldata(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id
     try:
@@ -1241,20 +1643,24 @@ async def alldata(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard = [[InlineKeyboardButton("➕ Add User", callback_data="add_user")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await update.message.reply_text(
+        await send_message(
+            context.bot,
+            update.effective_chat.id,
             "\n".join(msg),
             reply_markup=reply_markup
         )
     except Exception as e:
-        logger.error(f"Error in alldata: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in alldata: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def add_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     await query.edit_message_text("ℹ️ User အသစ်ထည့်ရန်:\nဖော်မတ်: `<အမည်>@<Com>@<Za>`\nဥပမာ: `မမ@15@80`")
 
+@timed
 async def handle_new_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         text = update.message.text
@@ -1267,8 +1673,13 @@ async def handle_new_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         za = int(za_str)
         
         await save_user_com_za(username, com, za)
+        for book in risk_books.values():
+            book.set_rates(username, com, za)
         
-        await update.message.reply_text(
+        # Both replies go through the send scheduler so they are paced together
+        confirmation = enqueue_message(
+            context.bot,
+            update.effective_chat.id,
             f"✅ User အသစ်ထည့်ပြီးပါပြီ!\n"
             f"👤 {username}\n"
             f"   - Com: {com}%\n"
@@ -1276,13 +1687,418 @@ async def handle_new_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
         await alldata(update, context)
+        await confirmation
         
     except Exception as e:
-        logger.error(f"Error adding user: {str(e)}")
+        logger.error("Error adding user: %s", e)
         await update.message.reply_text("❌ Error! ဖော်မတ်မှားနေပါသည်။ ဥပမာ: `မမ@15@80`")
 
+@timed
+async def sendstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global admin_id
+    if update.effective_user.id != admin_id:
+        await update.message.reply_text("❌ Admin only command")
+        return
+
+    stats = get_send_stats()
+    await update.message.reply_text(
+        "📤 Send queue\n"
+        f"Queue depth: {stats['queue_depth']} ({stats['queued_messages']} messages)\n"
+        f"Oldest waiting: {stats['oldest_wait']:.2f}s\n"
+        f"Sent: {stats['sent']} (merged: {stats['coalesced']}, failed: {stats['failed']})\n"
+        f"Delay avg/max/last: {stats['delay_avg']:.2f}s / {stats['delay_max']:.2f}s / {stats['delay_last']:.2f}s\n"
+        f"Flood waits: {stats['retry_after']} (paused for {stats['paused_for']:.1f}s)"
+    )
+
+@timed
+async def memstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global admin_id
+    if update.effective_user.id != admin_id:
+        await update.message.reply_text("❌ Admin only command")
+        return
+
+    msg = ["🧠 Session state"]
+    total_bytes = 0
+    for stats in get_store_stats():
+        total_bytes += stats['bytes']
+        msg.append(
+            f"{stats['name']}: {stats['entries']}/{stats['max_entries']} entries, ~{stats['bytes'] / 1024:.1f} KiB "
+            f"(evicted: {stats['expired']} expired, {stats['lru']} lru)"
+        )
+    msg.append(f"Ingest buckets: {len(ingest_buckets)}")
+    msg.append(f"Total: ~{total_bytes / 1024:.1f} KiB")
+    await update.message.reply_text("\n".join(msg))
+
+@timed
+async def risk(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global admin_id, current_working_date
+    try:
+        if update.effective_user.id != admin_id:
+            await update.message.reply_text("❌ Admin only command")
+            return
+            
+        date_key = current_working_date if current_working_date else get_current_date_key()
+        bind_log_fields(date_key=date_key)
+        summary = (await load_risk_book(date_key)).summary()
+        if not summary['bets']:
+            await update.message.reply_text(f"ℹ️ {date_key} အတွက် လောင်းကြေးမရှိပါ")
+            return
+            
+        msg = [
+            f"⚖️ {date_key} Risk ({summary['users']} users, {summary['bets']} bets)",
+            f"💵 စုစုပေါင်း: {summary['total']} (Com ပြီး {summary['after_com']})",
+            f"🚨 အများဆုံးအရှုံး: {summary['exposure']} ({summary['losing_numbers']} ဂဏန်း ရှုံးမည်)",
+            "\n🔻 အဆိုးဆုံးဂဏန်းများ:",
+        ]
+        msg.extend(f"{num:02d} ➤ {net:+}" for num, net in summary['worst'])
+        msg.append("\n📊 ဂဏန်းတိုင်းအတွက် ဒိုင်ရလဒ်:")
+        net = summary['net']
+        for row in range(0, 100, 4):
+            msg.append("  ".join(f"{num:02d}:{net[num]:+}" for num in range(row, row + 4)))
+        await reply_lines(update.message, msg)
+    except Exception as e:
+        logger.error("Error in risk: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
+
+@timed
+async def breakopt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global admin_id, current_working_date
+    try:
+        if update.effective_user.id != admin_id:
+            await update.message.reply_text("❌ Admin only command")
+            return
+            
+        # /breakopt [dealer] [max loss]: overbuys go to the dealer named as in /overbuy
+        dealer, max_loss = None, None
+        for arg in context.args:
+            if arg.isdigit():
+                max_loss = int(arg)
+            else:
+                dealer = arg
+        
+        date_key = current_working_date if current_working_date else get_current_date_key()
+        bind_log_fields(date_key=date_key)
+        book = await load_risk_book(date_key)
+        if not book.bets:
+            await update.message.reply_text(f"ℹ️ {date_key} အတွက် လောင်းကြေးမရှိပါ")
+            return
+            
+        current = await session_break_limit(date_key)
+        dealer_rates = await get_user_com_za(dealer) if dealer else DEFAULT_COM_ZA
+        if max_loss is None:
+            max_loss = BREAKOPT_MAX_LOSS
+        
+        start = perf_counter()
+        limits = candidate_limits(book, extra=[current] if current is not None else [])
+        result = evaluate_limits(book, limits, dealer, dealer_rates)
+        best = suggest_limit(result, max_loss)
+        elapsed_ms = (perf_counter() - start) * 1000
+        
+        def line(i):
+            return (f"{result['limits'][i]} ➤ overbuy {result['overbuy'][i]}, "
+                    f"အများဆုံးအရှုံး {result['worst_loss'][i]}, margin {result['margin'][i]:+.0f}")
+        
+        msg = [
+            f"🎯 {date_key} Break limit ({len(limits)} limits, {elapsed_ms:.1f}ms)",
+            f"Overbuy: {dealer or 'default'} (Com {dealer_rates[0]}%, Za {dealer_rates[1]}), အရှုံးခံနိုင်မှု {max_loss}",
+            f"\n✅ အကြံပြု: {line(best)}",
+        ]
+        if current is not None:
+            msg.append(f"📌 လက်ရှိ: {line(result['limits'].tolist().index(current))}")
+        msg.append("")
+        for i in sorted({round(k * (len(limits) - 1) / 11) for k in range(12)}):
+            msg.append(line(i))
+        msg.append(f"\nℹ️ /break {result['limits'][best]}")
+        await reply_lines(update.message, msg)
+    except Exception as e:
+        logger.error("Error in breakopt: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
+
+export_tasks = set()  # Running /export jobs, kept referenced until they finish
+
+@timed
+async def export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global admin_id
+    try:
+        if update.effective_user.id != admin_id:
+            await update.message.reply_text("❌ Admin only command")
+            return
+            
+        # /export [all | dd/mm/yyyy [AM|PM] ... | user NAME] [csv|parquet]
+        fmt, username, date_keys, everything = "csv", None, [], False
+        args = list(context.args)
+        while args:
+            arg = args.pop(0)
+            if arg.lower() in EXPORT_FORMATS:
+                fmt = arg.lower()
+            elif arg.lower() == "all":
+                everything = True
+            elif arg.lower() == "user" and args:
+                username = args.pop(0)
+            elif re.fullmatch(r"\d{2}/\d{2}/\d{4}", arg):
+                if args and args[0].upper() in ("AM", "PM"):
+                    date_keys.append(f"{arg} {args.pop(0).upper()}")
+                else:
+                    date_keys.extend((f"{arg} AM", f"{arg} PM"))
+            else:
+                await update.message.reply_text(
+                    "⚠️ ဥပမာ: /export 01/06/2024 AM csv\n"
+                    "ℹ️ Usage: /export [all | dd/mm/yyyy [AM|PM] ... | user NAME] [csv|parquet]"
+                )
+                return
+        if not date_keys and not username and not everything:
+            date_keys = [current_working_date if current_working_date else get_current_date_key()]
+        
+        if username:
+            name = f"export {username}" + (f" {date_keys[0]}" if len(date_keys) == 1 else "")
+        else:
+            name = f"export {date_keys[0]}" if len(date_keys) == 1 else "export all" if not date_keys else "export sessions"
+        scope = username or (", ".join(date_keys) if date_keys else "all sessions")
+        chat_id = update.effective_chat.id
+        bot = context.bot
+        
+        # Runs as its own task so a large export does not hold up other updates
+        async def run():
+            try:
+                if journal.journal is not None:
+                    await journal.journal.barrier()
+                result = await asyncio.get_running_loop().run_in_executor(
+                    None, export_bets, fmt, name, date_keys or None, username)
+            except Exception as e:
+                logger.error("Error in export: %s", e)
+                await send_message(bot, chat_id, f"❌ Export failed: {e}")
+                return
+            try:
+                caption = f"📦 {scope}: {result['rows']} rows ({result['bytes'] / 1024:.0f} KB, {result['seconds']:.1f}s)"
+                if result['bytes'] > EXPORT_MAX_SEND_BYTES:
+                    note = f"\n💾 {result['path']}" if result['kept'] else " (set EXPORT_DIR to keep large exports)"
+                    await send_message(bot, chat_id, f"{caption}\n⚠️ Too large to send{note}")
+                    return
+                with open(result['path'], 'rb') as f:
+                    await bot.send_document(chat_id, f, filename=result['filename'], caption=caption)
+            except Exception as e:
+                logger.error("Error sending export: %s", e)
+            finally:
+                discard_export(result)
+        
+        task = asyncio.get_running_loop().create_task(run(), context=contextvars.Context())
+        export_tasks.add(task)
+        task.add_done_callback(export_tasks.discard)
+        await update.message.reply_text(f"📦 Exporting {scope} as {fmt}...")
+    except Exception as e:
+        logger.error("Error in export: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
+
+@timed
+async def limits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global admin_id, INGEST_USER_RATE, INGEST_USER_BURST
+    if update.effective_user.id != admin_id:
+        await update.message.reply_text("❌ Admin only command")
+        return
+
+    if context.args:
+        try:
+            rate = float(context.args[0])
+            burst = float(context.args[1]) if len(context.args) > 1 else INGEST_USER_BURST
+            if rate <= 0 or burst < 1:
+                raise ValueError
+        except ValueError:
+            await update.message.reply_text("⚠️ ဥပမာ: /limits 2 60 (တစ်စက္ကန့်လျှင် line 2 ကြောင်း, burst 60)")
+            return
+        INGEST_USER_RATE, INGEST_USER_BURST = rate, burst
+        for bucket in ingest_buckets.values():
+            bucket.rate, bucket.capacity = rate, burst
+            bucket.tokens = min(bucket.tokens, burst)
+
+    queue_depth = ingest_queue.qsize() if ingest_queue else 0
+    msg = [
+        "🚦 Slip ingestion limits",
+        f"Per user: {INGEST_USER_RATE:g} lines/s, burst {INGEST_USER_BURST:g} (admin exempt)",
+        f"Queue: {queue_depth}/{INGEST_QUEUE_SIZE}",
+        f"Accepted: {ingest_stats['accepted']}",
+        f"Rate limited: {ingest_stats['rate_limited']}",
+        f"Shed (queue full): {ingest_stats['shed']}",
+    ]
+    if ingest_rejections:
+        msg.append("\nMost limited users:")
+        top = sorted(ingest_rejections.items(), key=lambda item: item[1], reverse=True)[:10]
+        msg.extend(f"👤 {name} ➤ {count}" for name, count in top)
+    await update.message.reply_text("\n".join(msg))
+
+@timed
+async def dbstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global admin_id
+    try:
+        if update.effective_user.id != admin_id:
+            await update.message.reply_text("❌ Admin only command")
+            return
+            
+        mode = context.args[0].lower() if context.args else "summary"
+        
+        if mode == "reset":
+            reset_query_stats()
+            await update.message.reply_text("✅ Query statistics cleared")
+            return
+            
+        if mode == "slow":
+            slow = get_slow_queries()
+            if not slow:
+                await update.message.reply_text(f"ℹ️ No queries slower than {SLOW_QUERY_MS:g}ms")
+                return
+            msg = [f"🐢 Slow queries (≥ {SLOW_QUERY_MS:g}ms)"]
+            for q in reversed(slow):
+                msg.append(
+                    f"\n{q['time']} {q['function']} ← {q['handler']}\n"
+                    f"{q['statement']}\n"
+                    f"⏱ {q['total_ms']:.1f}ms (connect {q['connect_ms']:.1f} / execute {q['execute_ms']:.1f} / fetch {q['fetch_ms']:.1f}), rows {q['rows']}"
+                )
+            await reply_lines(update.message, msg)
+            return
+            
+        if mode == "journal":
+            if journal.journal is None:
+                await update.message.reply_text("ℹ️ Journal is off (set JOURNAL_PATH to enable)")
+                return
+            st = journal.journal.get_stats()
+            msg = [
+                "📒 Bet journal",
+                f"Pending: {st['pending_bets']} bets in {st['pending_entries']} slips (oldest {st['oldest_pending_s']:.1f}s)",
+                f"Journaled slips: {st['appended']} ({st['fsyncs']} fsyncs), replayed at start: {st['replayed']}",
+                f"Flushed: {st['flushed']} bets in {st['batches']} batches, last {st['last_flush_ms']:.1f}ms",
+                f"File: {st['file_bytes'] / 1024:.0f} KB, failed flushes: {st['failures']}",
+            ]
+            if st['last_error']:
+                msg.append(f"Last error: {st['last_error']}")
+            await reply_lines(update.message, msg)
+            return
+            
+        if mode == "explain":
+            plans = get_explain_plans()
+            if not plans:
+                await update.message.reply_text("ℹ️ No plans captured (set EXPLAIN_SAMPLE_RATE to sample SELECTs)")
+                return
+            msg = ["🔍 Sampled query plans"]
+            for p in reversed(plans):
+                msg.append(f"\n{p['time']} {p['function']}\n{p['statement']}\n{p['plan']}")
+            await reply_lines(update.message, msg)
+            return
+            
+        stats = get_query_stats()
+        if not stats:
+            await update.message.reply_text("ℹ️ No queries recorded yet")
+            return
+        msg = ["🗄 Query timings (avg ms: connect / execute / fetch)"]
+        for (function, statement), st in stats:
+            calls = st['calls']
+            msg.append(
+                f"\n{function}: {statement}\n"
+                f"calls {calls}, rows {st['rows']}, "
+                f"{st['connect_ms'] / calls:.1f} / {st['execute_ms'] / calls:.1f} / {st['fetch_ms'] / calls:.1f}, max {st['max_ms']:.1f}"
+            )
+        msg.append("\nℹ️ /dbstats slow | explain | journal | reset")
+        await reply_lines(update.message, msg)
+    except Exception as e:
+        logger.error("Error in dbstats: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
+
+@timed
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global admin_id
+    try:
+        if update.effective_user.id != admin_id:
+            await update.message.reply_text("❌ Admin only command")
+            return
+            
+        if context.args and context.args[0].lower() == "stop":
+            if profile_running():
+                stop_profile()
+                await update.message.reply_text("⏹ Profile ကိုရပ်နေပါသည်...")
+            else:
+                await update.message.reply_text("ℹ️ No profile running")
+            return
+            
+        if profile_running():
+            await update.message.reply_text("⚠️ Profile တစ်ခု run နေပါသည် (/profile stop)")
+            return
+            
+        # /profile [30s | 200] [handler ...]: T seconds or the next N updates, optionally per handler
+        seconds, updates, handlers = 30, None, []
+        for arg in context.args:
+            if arg[:-1].isdigit() and arg[-1].lower() == "s":
+                seconds, updates = int(arg[:-1]), None
+            elif arg.isdigit():
+                seconds, updates = None, int(arg)
+            elif arg in timed_handlers:
+                handlers.append(arg)
+            else:
+                await update.message.reply_text(
+                    f"⚠️ Unknown handler: {arg}\nℹ️ Usage: /profile [30s|200] [process_message dateall_view ...]"
+                )
+                return
+        
+        chat_id = update.effective_chat.id
+        bot = context.bot
+        
+        async def report(result):
+            try:
+                if 'error' in result:
+                    await send_message(bot, chat_id, f"❌ Profile failed: {result['error']}")
+                    return
+                msg = [
+                    f"🔬 Profile finished: {result['seconds']:.1f}s, "
+                    f"{result['kept']}/{result['samples']} samples"
+                    + (f" in {', '.join(result['handlers'])}" if result['handlers'] else "")
+                ]
+                if result['kept']:
+                    msg.append("\nTop (self):")
+                    msg.extend(f"{pct:5.1f}% {count:>6} {label}" for label, count, pct in result['self'])
+                    msg.append("\nTop (total):")
+                    msg.extend(f"{pct:5.1f}% {count:>6} {label}" for label, count, pct in result['total'])
+                for chunk in iter_chunks(msg):
+                    await send_message(bot, chat_id, chunk)
+                with open(result['path'], 'rb') as f:
+                    await bot.send_document(chat_id, f, filename=os.path.basename(result['path']),
+                                            caption="Collapsed stacks (flamegraph.pl / speedscope)")
+            except Exception as e:
+                logger.error("Error sending profile report: %s", e)
+        
+        start_profile(report, seconds=seconds, updates=updates, handlers=handlers)
+        scope = ", ".join(handlers) if handlers else "event loop"
+        span_text = f"{seconds}s" if seconds else f"next {updates} updates"
+        await update.message.reply_text(f"🔬 Profiling {scope} for {span_text}")
+    except Exception as e:
+        logger.error("Error in profile: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
+
+async def count_profiled_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    note_update()
+
+# Session state a replay starts from (written once, ahead of the first recorded update); the
+# users and their com/za let replay accept the admin's "@name" slips on a scratch database
+async def recording_state():
+    users = await get_all_users()
+    com_za = await get_users_com_za(users)
+    return {
+        'admin_id': admin_id,
+        'date_control': date_control,
+        'closed_numbers': sorted(closed_numbers),
+        'stake_caps': {kind: [[key, amount] for key, amount in table.items()] for kind, table in stake_caps.tables.items()},
+        'current_working_date': current_working_date,
+        'date_key': get_current_date_key(),
+        'users': [[username, *com_za.get(username, DEFAULT_COM_ZA)] for username in users],
+    }
+
+async def record_incoming_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        is_admin = update.effective_user is not None and update.effective_user.id == admin_id
+        state = await recording_state() if header_pending() else None
+        record_update(update, admin=is_admin, state=state)
+    except Exception as e:
+        logger.error("Error recording update: %s", e)
+
+@timed
 async def reset_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global admin_id, date_control, overbuy_list, overbuy_selections, current_working_date, closed_numbers
+    global admin_id, date_control, current_working_date, closed_numbers
     
     try:
         if update.effective_user.id != admin_id:
@@ -1291,16 +2107,80 @@ async def reset_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Clear non-persistent data
         date_control = {}
-        overbuy_list = {}
-        overbuy_selections = {}
+        overbuy_list.clear()
+        overbuy_selections.clear()
         closed_numbers = set()
+        stake_caps.clear()
+        live_ledger.mark_all()
         current_working_date = get_current_date_key()
         
         await update.message.reply_text("✅ မှတ်ဉာဏ်အတွင်းရှိ ဒေတာများကို ပြန်လည်သုတ်သင်ပြီး လက်ရှိနေ့သို့ပြန်လည်သတ်မှတ်ပြီးပါပြီ\n\nℹ️ Database ထဲက data တွေကိုတော့ မဖျက်ပါ")
     except Exception as e:
-        logger.error(f"Error in reset_data: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
-        
+        logger.error("Error in reset_data: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
+        
+def history_document(username, date_bets, power_numbers, fmt):
+    if fmt == "csv":
+        return csv_document(
+            ["username", "date", "number", "amount", "power_number"],
+            (
+                (username, date_key, f"{num:02d}", amt, "yes" if num == power_numbers.get(date_key) else "")
+                for date_key, rows in date_bets.items() for num, amt in rows
+            )
+        )
+    return text_document(
+        (
+            f"📅 {date_key}" + (f" [P: {power_numbers[date_key]:02d}]" if power_numbers.get(date_key) is not None else ""),
+            ["Number", "Amount", ""],
+            ((f"{num:02d}", amt, "🔴" if num == power_numbers.get(date_key) else "") for num, amt in rows),
+            f"💵 စုစုပေါင်း: {sum(amt for _, amt in rows)}"
+        )
+        for date_key, rows in date_bets.items()
+    )
+
+# One page of a user's history (see get_user_history_page) as (text, reply_markup);
+# (None, None) when there is nothing on that page
+async def history_page(username, before=None, after=None):
+    page = await get_user_history_page(username, before=before, after=after, limit=POSTHIS_PAGE_SESSIONS)
+    sessions = page['sessions']
+    if not sessions:
+        return None, None
+    power_numbers = await get_power_numbers([date_key for date_key, _ in sessions])
+    
+    msg = [f"📊 {username} ရဲ့လောင်းကြေးမှတ်တမ်း"]
+    total_amount = 0
+    for date_key, bets in sessions:
+        pnum = power_numbers.get(date_key)
+        pnum_str = f" [P: {pnum:02d}]" if pnum is not None else ""
+        groups = {}
+        for num, amt in bets:
+            groups.setdefault(amt, bytearray()).append(num)
+        session_total = sum(amt for _, amt in bets)
+        total_amount += session_total
+        
+        msg.append(f"\n📅 {date_key}{pnum_str}:")
+        msg.extend(format_bet_groups(groups))
+        pnumber_amount = sum(amt for num, amt in bets if num == pnum)
+        if pnumber_amount:
+            msg.append(f"🔴 {pnum:02d} ➤ {pnumber_amount} 🔴")
+        msg.append(f"💵 {session_total} ({len(bets)} ဂဏန်း)")
+    if len(sessions) > 1:
+        msg.append(f"\n💵 စုစုပေါင်း: {total_amount}")
+    
+    text = "\n".join(msg)
+    if len(text) > MAX_MESSAGE_LENGTH:
+        text = text[:text.rindex("\n", 0, MAX_MESSAGE_LENGTH - 2)] + "\n…"
+    
+    # Paging forward implies there is a page behind, and vice versa
+    has_newer, has_older = (page['more'], True) if after is not None else (before is not None, page['more'])
+    buttons = []
+    if has_newer:
+        buttons.append(InlineKeyboardButton("⬅️ Newer", callback_data=f"posthis_page:n:{session_order(sessions[0][0])}:{username}"))
+    if has_older:
+        buttons.append(InlineKeyboardButton("Older ➡️", callback_data=f"posthis_page:o:{session_order(sessions[-1][0])}:{username}"))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+@timed
 async def posthis(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user = update.effective_user
@@ -1333,32 +2213,37 @@ async def posthis(update: Update, context: ContextTypes.DEFAULT_TYPE):
         pnumber_total = 0
         
         if is_admin:
-            # Admin can see all dates - get all bets for this user
-            bets = await get_user_bets(username=username)
-            if not bets:
-                await update.message.reply_text(f"ℹ️ {username} အတွက် စာရင်းမရှိပါ")
-                return
+            # /posthis <user> csv|file sends the whole history as one document
+            fmt = DOCUMENT_FORMATS.get(context.args[1].lower()) if len(context.args) > 1 else None
+            if fmt:
+                bets = await get_user_bets(username=username)
+                if not bets:
+                    await update.message.reply_text(f"ℹ️ {username} အတွက် စာရင်းမရှိပါ")
+                    return
+                    
+                # Group by date
+                date_bets = {}
+                for bet in bets:
+                    date_key = bet['date_key']
+                    if date_key not in date_bets:
+                        date_bets[date_key] = []
+                    date_bets[date_key].append((bet['number'], bet['amount']))
                 
-            # Group by date
-            date_bets = {}
-            for bet in bets:
-                date_key = bet['date_key']
-                if date_key not in date_bets:
-                    date_bets[date_key] = []
-                date_bets[date_key].append((bet['number'], bet['amount']))
+                power_numbers = await get_power_numbers(list(date_bets))
+                await update.message.reply_document(
+                    history_document(username, date_bets, power_numbers, fmt),
+                    filename=document_filename(f"history {username}", fmt),
+                    caption=f"📊 {username} ရဲ့လောင်းကြေးမှတ်တမ်း"
+                )
+                return
             
-            for date_key, bets in date_bets.items():
-                pnum = await get_power_number(date_key)
-                pnum_str = f" [P: {pnum:02d}]" if pnum is not None else ""
-                
-                msg.append(f"\n📅 {date_key}{pnum_str}:")
-                for num, amt in bets:
-                    if pnum is not None and num == pnum:
-                        msg.append(f"🔴 {num:02d} ➤ {amt} 🔴")
-                        pnumber_total += amt
-                    else:
-                        msg.append(f"{num:02d} ➤ {amt}")
-                    total_amount += amt
+            # Admin can see all dates, a page of sessions at a time
+            text, reply_markup = await history_page(username)
+            if text is None:
+                await update.message.reply_text(f"ℹ️ {username} အတွက် စာရင်းမရှိပါ")
+                return
+            await update.message.reply_text(text, reply_markup=reply_markup)
+            return
         else:
             # Non-admin only sees current date
             bets = await get_user_bets(username=username, date_key=date_key)
@@ -1381,62 +2266,53 @@ async def posthis(update: Update, context: ContextTypes.DEFAULT_TYPE):
             msg.append(f"\n💵 စုစုပေါင်း: {total_amount}")
             if pnumber_total > 0:
                 msg.append(f"🔴 Power Number စုစုပေါင်း: {pnumber_total}")
-            await update.message.reply_text("\n".join(msg))
+            await reply_lines(update.message, msg)
         else:
             await update.message.reply_text(f"ℹ️ {username} အတွက် စာရင်းမရှိပါ")
         
     except Exception as e:
-        logger.error(f"Error in posthis: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in posthis: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def posthis_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     try:
         _, username = query.data.split(':')
-        msg = [f"📊 {username} ရဲ့လောင်းကြေးမှတ်တမ်း"]
-        total_amount = 0
-        pnumber_total = 0
-        
-        # Get all bets for this user
-        bets = await get_user_bets(username=username)
-        if bets:
-            # Group by date
-            date_bets = {}
-            for bet in bets:
-                date_key = bet['date_key']
-                if date_key not in date_bets:
-                    date_bets[date_key] = []
-                date_bets[date_key].append((bet['number'], bet['amount']))
-            
-            for date_key, bets in date_bets.items():
-                pnum = await get_power_number(date_key)
-                pnum_str = f" [P: {pnum:02d}]" if pnum is not None else ""
-                
-                msg.append(f"\n📅 {date_key}{pnum_str}:")
-                for num, amt in bets:
-                    if pnum is not None and num == pnum:
-                        msg.append(f"🔴 {num:02d} ➤ {amt} 🔴")
-                        pnumber_total += amt
-                    else:
-                        msg.append(f"{num:02d} ➤ {amt}")
-                    total_amount += amt
+        text, reply_markup = await history_page(username)
+        if text is None:
+            await query.edit_message_text(f"ℹ️ {username} အတွက် စာရင်းမရှိပါ")
+            return
+        await query.edit_message_text(text, reply_markup=reply_markup)
             
-            if len(msg) > 1:
-                msg.append(f"\n💵 စုစုပေါင်း: {total_amount}")
-                if pnumber_total > 0:
-                    msg.append(f"🔴 Power Number စုစုပေါင်း: {pnumber_total}")
-                await query.edit_message_text("\n".join(msg))
-            else:
-                await query.edit_message_text(f"ℹ️ {username} အတွက် စာရင်းမရှိပါ")
+    except Exception as e:
+        logger.error("Error in posthis_callback: %s", e)
+        await query.edit_message_text("❌ Error occurred")
+
+# Next/previous page buttons: posthis_page:o:<session>:<username> for older, :n: for newer
+@timed
+async def posthis_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    try:
+        _, direction, session, username = query.data.split(':', 3)
+        if direction == "o":
+            text, reply_markup = await history_page(username, before=session)
         else:
+            text, reply_markup = await history_page(username, after=session)
+        if text is None:
             await query.edit_message_text(f"ℹ️ {username} အတွက် စာရင်းမရှိပါ")
+            return
+        await query.edit_message_text(text, reply_markup=reply_markup)
             
     except Exception as e:
-        logger.error(f"Error in posthis_callback: {str(e)}")
+        logger.error("Error in posthis_page: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def dateall(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id
     try:
@@ -1453,7 +2329,7 @@ async def dateall(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Initialize selection dictionary
         dateall_selections = {date: False for date in all_dates}
-        context.user_data['dateall_selections'] = dateall_selections
+        selection_store[(update.effective_user.id, 'dateall')] = dateall_selections
         
         # Build message with checkboxes
         msg = ["📅 စာရင်းရှိသည့်နေ့ရက်များကို ရွေးချယ်ပါ:"]
@@ -1473,16 +2349,17 @@ async def dateall(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("\n".join(msg), reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Error in dateall: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in dateall: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def dateall_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     try:
         _, date_key = query.data.split(':')
-        dateall_selections = context.user_data.get('dateall_selections', {})
+        dateall_selections = selection_store.get((update.effective_user.id, 'dateall'), {})
         
         if date_key not in dateall_selections:
             await query.edit_message_text("❌ Error: Date not found")
@@ -1490,7 +2367,6 @@ async def dateall_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Toggle selection status
         dateall_selections[date_key] = not dateall_selections[date_key]
-        context.user_data['dateall_selections'] = dateall_selections
         
         # Rebuild the message with updated selections
         msg = ["📅 စာရင်းရှိသည့်နေ့ရက်များကို ရွေးချယ်ပါ:"]
@@ -1510,85 +2386,49 @@ async def dateall_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("\n".join(msg), reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Error in dateall_toggle: {str(e)}")
+        logger.error("Error in dateall_toggle: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def dateall_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     try:
         # 1. Get selected dates
-        dateall_selections = context.user_data.get('dateall_selections', {})
+        dateall_selections = selection_store.get((update.effective_user.id, 'dateall'), {})
         selected_dates = [date for date, selected in dateall_selections.items() if selected]
         
         if not selected_dates:
             await query.edit_message_text("⚠️ မည်သည့်နေ့ရက်ကိုမှ မရွေးချယ်ထားပါ")
             return
 
-        # 2. Initialize data storage
-        user_reports = {}  # {username: {'total_bet': 0, 'power_bet': 0, 'com': X, 'za': Y}}
-        grand_totals = {
-            'total_bet': 0,
-            'power_bet': 0,
-            'commission': 0,
-            'win_amount': 0,
-            'net_result': 0
-        }
+        # 2. Load every selected session at once
+        bets = await get_session_bets(selected_dates)
+        power_numbers = await get_power_numbers(selected_dates)
+        frame = build_frame(bets, selected_dates)
 
-        # 3. Process bets WITHOUT overbuy adjustment
-        for date_key in selected_dates:
-            bets = await get_user_bets(date_key=date_key)
-            if not bets:
-                continue
-                
-            pnum = await get_power_number(date_key)
-            
-            for bet in bets:
-                username = bet['username']
-                num = bet['number']
-                amt = bet['amount']
-                
-                if username not in user_reports:
-                    com, za = await get_user_com_za(username)
-                    user_reports[username] = {
-                        'total_bet': 0,
-                        'power_bet': 0,
-                        'com': com,
-                        'za': za
-                    }
-                
-                # Track total bets (ignore negative amounts which are overbuys)
-                if amt > 0:
-                    user_reports[username]['total_bet'] += amt
-                    
-                # Track power number bets
-                if pnum is not None and num == pnum and amt > 0:
-                    user_reports[username]['power_bet'] += amt
+        # 3. Settle WITHOUT overbuy adjustment (negative amounts are overbuys)
+        result = settle(frame, power_numbers, await get_users_com_za(frame['users']), positive_only=True)
+        grand_totals = settlement_totals(result)
 
-        # 4. Calculate financials
+        # 4. Build per-user reports
         messages = ["📊 ရွေးချယ်ထားသော နေ့ရက်များ စုစုပေါင်းရလဒ် (Overbuy မပါ)"]
         messages.append(f"📅 ရက်စွဲများ: {', '.join(selected_dates)}\n")
         
-        for username, report in user_reports.items():
-            # Calculate values
-            commission = (report['total_bet'] * report['com']) // 100
-            after_com = report['total_bet'] - commission
-            win_amount = report['power_bet'] * report['za']
-            net_result = after_com - win_amount
-            
-            # Build user message
+        for row in settlement_rows(result):
+            net_result = row['net']
             user_msg = [
-                f"👤 {username}",
-                f"💵 စုစုပေါင်းလောင်းကြေး: {report['total_bet']}",
-                f"📊 Com ({report['com']}%): {commission}",
-                f"💰 Com ပြီး: {after_com}"
+                f"👤 {row['username']}",
+                f"💵 စုစုပေါင်းလောင်းကြေး: {row['total']}",
+                f"📊 Com ({row['com']}%): {row['commission']}",
+                f"💰 Com ပြီး: {row['after_com']}"
             ]
             
-            if report['power_bet'] > 0:
+            if row['power'] > 0:
                 user_msg.extend([
-                    f"🔴 Power Number: {report['power_bet']}",
-                    f"🎯 Za ({report['za']}): {win_amount}"
+                    f"🔴 Power Number: {row['power']}",
+                    f"🎯 Za ({row['za']}): {row['win']}"
                 ])
             
             user_msg.append(
@@ -1597,44 +2437,29 @@ async def dateall_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             messages.append("\n".join(user_msg))
             messages.append("⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯")
-            
-            # Update grand totals
-            grand_totals['total_bet'] += report['total_bet']
-            grand_totals['power_bet'] += report['power_bet']
-            grand_totals['commission'] += commission
-            grand_totals['win_amount'] += win_amount
-            grand_totals['net_result'] += net_result
 
         # 5. Add grand totals
         messages.append("\n📌 စုစုပေါင်းရလဒ်:")
-        messages.append(f"💵 စုစုပေါင်းလောင်းကြေး: {grand_totals['total_bet']}")
+        messages.append(f"💵 စုစုပေါင်းလောင်းကြေး: {grand_totals['total']}")
         messages.append(f"📊 Com စုစုပေါင်း: {grand_totals['commission']}")
         
-        if grand_totals['power_bet'] > 0:
-            messages.append(f"🔴 Power Number စုစုပေါင်း: {grand_totals['power_bet']}")
-            messages.append(f"🎯 Win Amount စုစုပေါင်း: {grand_totals['win_amount']}")
+        if grand_totals['power'] > 0:
+            messages.append(f"🔴 Power Number စုစုပေါင်း: {grand_totals['power']}")
+            messages.append(f"🎯 Win Amount စုစုပေါင်း: {grand_totals['win']}")
         
         messages.append(
-            f"📊 စုစုပေါင်းရလဒ်: {abs(grand_totals['net_result'])} "
-            f"({'ဒိုင်အရှုံး' if grand_totals['net_result'] < 0 else 'ဒိုင်အမြတ်'})"
+            f"📊 စုစုပေါင်းရလဒ်: {abs(grand_totals['net'])} "
+            f"({'ဒိုင်အရှုံး' if grand_totals['net'] < 0 else 'ဒိုင်အမြတ်'})"
         )
 
-        # 6. Send message (split if too long)
-        full_message = "\n".join(messages)
-        if len(full_message) > 4000:
-            half = len(messages) // 2
-            await query.edit_message_text("\n".join(messages[:half]))
-            await context.bot.send_message(
-                chat_id=query.message.chat_id,
-                text="\n".join(messages[half:])
-            )
-        else:
-            await query.edit_message_text(full_message)
+        # 6. Send message (split at line boundaries if too long)
+        await edit_lines(query, messages)
 
     except Exception as e:
-        logger.error(f"Error in dateall_view: {str(e)}")
+        logger.error("Error in dateall_view: %s", e)
         await query.edit_message_text("❌ တွက်ချက်မှုအမှားဖြစ်နေပါသည်")
         
+@timed
 async def change_working_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id
     try:
@@ -1659,9 +2484,10 @@ async def change_working_date(update: Update, context: ContextTypes.DEFAULT_TYPE
             reply_markup=reply_markup
         )
     except Exception as e:
-        logger.error(f"Error in change_working_date: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in change_working_date: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def show_calendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -1701,9 +2527,10 @@ async def show_calendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("🗓 နေ့ရက်ရွေးရန် ပြက္ခဒိန်", reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Error in show_calendar: {str(e)}")
+        logger.error("Error in show_calendar: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def handle_day_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -1725,9 +2552,10 @@ async def handle_day_selection(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         
     except Exception as e:
-        logger.error(f"Error in handle_day_selection: {str(e)}")
+        logger.error("Error in handle_day_selection: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def set_am_pm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -1745,9 +2573,10 @@ async def set_am_pm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(f"✅ လက်ရှိ အလုပ်လုပ်ရမည့်နေ့ရက်ကို {current_working_date} အဖြစ်ပြောင်းလိုက်ပါပြီ")
         
     except Exception as e:
-        logger.error(f"Error in set_am_pm: {str(e)}")
+        logger.error("Error in set_am_pm: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def set_am(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global current_working_date
     try:
@@ -1758,9 +2587,10 @@ async def set_am(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await update.callback_query.edit_message_text("❌ လက်ရှိနေ့ရက် သတ်မှတ်ထားခြင်းမရှိပါ")
     except Exception as e:
-        logger.error(f"Error in set_am: {str(e)}")
+        logger.error("Error in set_am: %s", e)
         await update.callback_query.edit_message_text("❌ Error occurred")
 
+@timed
 async def set_pm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global current_working_date
     try:
@@ -1771,9 +2601,10 @@ async def set_pm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await update.callback_query.edit_message_text("❌ လက်ရှိနေ့ရက် သတ်မှတ်ထားခြင်းမရှိပါ")
     except Exception as e:
-        logger.error(f"Error in set_pm: {str(e)}")
+        logger.error("Error in set_pm: %s", e)
         await update.callback_query.edit_message_text("❌ Error occurred")
 
+@timed
 async def open_current_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -1783,19 +2614,22 @@ async def open_current_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         current_working_date = get_current_date_key()
         await query.edit_message_text(f"✅ လက်ရှိ အလုပ်လုပ်ရမည့်နေ့ရက်ကို {current_working_date} အဖြစ်ပြောင်းလိုက်ပါပြီ")
     except Exception as e:
-        logger.error(f"Error in open_current_date: {str(e)}")
+        logger.error("Error in open_current_date: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def navigate_month(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Placeholder for month navigation
     await update.callback_query.answer()
     await update.callback_query.edit_message_text("ℹ️ လများလှန်ကြည့်ခြင်းအား နောက်ထပ်ဗားရှင်းတွင် ထည့်သွင်းပါမည်")
 
+@timed
 async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     await change_working_date(update, context)
 
+@timed
 async def delete_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global admin_id
     try:
@@ -1812,7 +2646,7 @@ async def delete_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Initialize selection dictionary
         datedelete_selections = {date: False for date in available_dates}
-        context.user_data['datedelete_selections'] = datedelete_selections
+        selection_store[(update.effective_user.id, 'datedelete')] = datedelete_selections
         
         # Build message with checkboxes
         msg = ["🗑 ဖျက်လိုသောနေ့ရက်များကို ရွေးချယ်ပါ:"]
@@ -1832,16 +2666,17 @@ async def delete_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("\n".join(msg), reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Error in delete_date: {str(e)}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.error("Error in delete_date: %s", e)
+        await update.message.reply_text(f"❌ Error: {e}")
 
+@timed
 async def datedelete_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     try:
         _, date_key = query.data.split(':')
-        datedelete_selections = context.user_data.get('datedelete_selections', {})
+        datedelete_selections = selection_store.get((update.effective_user.id, 'datedelete'), {})
         
         if date_key not in datedelete_selections:
             await query.edit_message_text("❌ Error: Date not found")
@@ -1849,7 +2684,6 @@ async def datedelete_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Toggle selection status
         datedelete_selections[date_key] = not datedelete_selections[date_key]
-        context.user_data['datedelete_selections'] = datedelete_selections
         
         # Rebuild the message with updated selections
         msg = ["🗑 ဖျက်လိုသောနေ့ရက်များကို ရွေးချယ်ပါ:"]
@@ -1869,15 +2703,16 @@ async def datedelete_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("\n".join(msg), reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Error in datedelete_toggle: {str(e)}")
+        logger.error("Error in datedelete_toggle: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
+@timed
 async def datedelete_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     try:
-        datedelete_selections = context.user_data.get('datedelete_selections', {})
+        datedelete_selections = selection_store.get((update.effective_user.id, 'datedelete'), {})
         
         # Get selected dates
         selected_dates = [date for date, selected in datedelete_selections.items() if selected]
@@ -1889,6 +2724,14 @@ async def datedelete_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Delete data for selected dates
         for date_key in selected_dates:
             await delete_date_data(date_key)
+            risk_books.pop(date_key)
+            break_limit_cache.pop(date_key)
+            power_number_cache.pop(date_key)
+            breach_alerts.discard(date_key)
+            live_ledger.mark(date_key)
+            overbuy_list.pop(date_key)
+            overbuy_selections.pop(date_key)
+        selection_store.pop((update.effective_user.id, 'datedelete'))
         
         # Clear current working date if it was deleted
         global current_working_date
@@ -1898,14 +2741,40 @@ async def datedelete_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.edit_message_text(f"✅ အောက်ပါနေ့ရက်များ ဖျက်ပြီးပါပြီ:\n{', '.join(selected_dates)}")
         
     except Exception as e:
-        logger.error(f"Error in datedelete_confirm: {str(e)}")
+        logger.error("Error in datedelete_confirm: %s", e)
         await query.edit_message_text("❌ Error occurred")
 
-if __name__ == "__main__":
-    if not TOKEN:
-        raise ValueError("❌ BOT_TOKEN environment variable is not set")
-        
-    app = ApplicationBuilder().token(TOKEN).build()
+async def on_startup(application):
+    register_gauge("bot_ingest_queue_depth", "Slips waiting for the ingest worker",
+                   lambda: ingest_queue.qsize() if ingest_queue else 0)
+    if JOURNAL_PATH:
+        init_db()
+        await open_journal()
+        register_gauge("bot_journal_pending_bets", "Journaled bets not yet written to the database",
+                       lambda: journal.journal.pending_count if journal.journal else 0)
+        register_gauge("bot_journal_oldest_pending_seconds", "Age of the oldest unflushed journal entry",
+                       lambda: journal.journal.get_stats()['oldest_pending_s'] if journal.journal else 0)
+    if METRICS_PORT:
+        await start_metrics_server()
+
+async def on_shutdown(application):
+    await close_journal()
+
+# Build the application with every handler registered; `request` replaces the Bot API transport
+# and `base_url` points the bot at another Bot API server (e.g. a local stand-in)
+def build_application(token=TOKEN, request=None, base_url=BOT_API_BASE_URL):
+    global alert_bot
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .request(request or TracingRequest(connection_pool_size=256))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    app = builder.build()
+    alert_bot = app.bot
 
     # ================= Command Handlers =================
     app.add_handler(CommandHandler("start", start))
@@ -1913,6 +2782,7 @@ if __name__ == "__main__":
     app.add_handler(CommandHandler("dateopen", dateopen))
     app.add_handler(CommandHandler("dateclose", dateclose))
     app.add_handler(CommandHandler("ledger", ledger_summary))
+    app.add_handler(CommandHandler("liveledger", liveledger))
     app.add_handler(CommandHandler("break", break_command))
     app.add_handler(CommandHandler("overbuy", overbuy))
     app.add_handler(CommandHandler("pnumber", pnumber))
@@ -1926,17 +2796,31 @@ if __name__ == "__main__":
     app.add_handler(CommandHandler("Cdate", change_working_date))
     app.add_handler(CommandHandler("Ddate", delete_date))
     app.add_handler(CommandHandler("numclose", numclose))
+    app.add_handler(CommandHandler("caps", caps))
+    app.add_handler(CommandHandler("sendstats", sendstats))
+    app.add_handler(CommandHandler("limits", limits))
+    app.add_handler(CommandHandler("memstats", memstats))
+    app.add_handler(CommandHandler("dbstats", dbstats))
+    app.add_handler(CommandHandler("export", export))
+    app.add_handler(CommandHandler("risk", risk))
+    app.add_handler(CommandHandler("breakopt", breakopt))
+    app.add_handler(CommandHandler("profile", profile))
+    app.add_handler(TypeHandler(Update, count_profiled_update), group=-1)
+    if RECORD_UPDATES_PATH:
+        app.add_handler(TypeHandler(Update, record_incoming_update), group=-2)
 
     # ================= Callback Handlers =================
     app.add_handler(CallbackQueryHandler(comza_input, pattern=r"^comza:"))
     app.add_handler(CallbackQueryHandler(delete_bet, pattern=r"^delete:"))
     app.add_handler(CallbackQueryHandler(confirm_delete, pattern=r"^confirm_delete:"))
     app.add_handler(CallbackQueryHandler(cancel_delete, pattern=r"^cancel_delete:"))
+    app.add_handler(CallbackQueryHandler(show_bets, pattern=r"^bets_view:"))
     app.add_handler(CallbackQueryHandler(overbuy_select, pattern=r"^overbuy_select:"))
     app.add_handler(CallbackQueryHandler(overbuy_select_all, pattern=r"^overbuy_select_all$"))
     app.add_handler(CallbackQueryHandler(overbuy_unselect_all, pattern=r"^overbuy_unselect_all$"))
     app.add_handler(CallbackQueryHandler(overbuy_confirm, pattern=r"^overbuy_confirm$"))
     app.add_handler(CallbackQueryHandler(posthis_callback, pattern=r"^posthis:"))
+    app.add_handler(CallbackQueryHandler(posthis_page, pattern=r"^posthis_page:"))
     app.add_handler(CallbackQueryHandler(dateall_toggle, pattern=r"^dateall_toggle:"))
     app.add_handler(CallbackQueryHandler(dateall_view, pattern=r"^dateall_view$"))
     app.add_handler(CallbackQueryHandler(numclose_delete_all, pattern=r"^numclose_delete_all$"))
@@ -1961,5 +2845,13 @@ if __name__ == "__main__":
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, comza_text))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
+    return app
+
+if __name__ == "__main__":
+    if not TOKEN:
+        raise ValueError("❌ BOT_TOKEN environment variable is not set")
+
+    app = build_application()
+
     logger.info("🚀 Bot is starting...")
     app.run_polling()
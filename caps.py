@@ -0,0 +1,67 @@
+# Stake caps enforced at ingest, checked against the session's running totals (risk.RiskBook):
+#   user        - total one user may stake in a session
+#   number      - total a number may take in a session, across users
+#   user_number - what one user may stake on any single number
+# Each table maps a username (or number) to a cap, with '*' as the default for the rest.
+CAP_KINDS = ("user", "number", "user_number")
+CAP_STEP = 100  # A cut-back amount is rounded down to this, the smallest stake a slip line takes
+
+class StakeCaps:
+    def __init__(self):
+        self.tables = {kind: {} for kind in CAP_KINDS}
+
+    def active(self):
+        return any(self.tables.values())
+
+    def set(self, kind, key, amount):
+        if amount is None:
+            self.tables[kind].pop(key, None)
+        else:
+            self.tables[kind][key] = amount
+
+    def clear(self):
+        for table in self.tables.values():
+            table.clear()
+
+    def _cap(self, kind, key):
+        table = self.tables[kind]
+        return table.get(key, table.get('*'))
+
+    # Split a slip's [(number, amount)] into what fits under the caps and what does not:
+    # (accepted [(number, amount)], capped [(number, asked, accepted)]). Bets are taken in
+    # order, so earlier lines of a slip use up room first; each check is O(1). A bet that does
+    # not fit is cut to a multiple of CAP_STEP, so less than CAP_STEP of room takes nothing.
+    def apply(self, book, username, bets):
+        user_cap = self._cap("user", username)
+        user_number_cap = self._cap("user_number", username)
+        stakes = book.stakes.get(username)
+        user_total = book.totals.get(username, 0)
+        slip_numbers = {}  # This slip's accepted amount per number so far
+        accepted, capped = [], []
+        for num, amt in bets:
+            room = amt
+            if user_cap is not None:
+                room = min(room, user_cap - user_total)
+            number_cap = self._cap("number", num)
+            if number_cap is not None:
+                room = min(room, number_cap - int(book.numbers[num]) - slip_numbers.get(num, 0))
+            if user_number_cap is not None:
+                staked = int(stakes[num]) if stakes is not None else 0
+                room = min(room, user_number_cap - staked - slip_numbers.get(num, 0))
+            room = max(room, 0)
+            if room < amt:
+                room = room // CAP_STEP * CAP_STEP
+                capped.append((num, amt, room))
+            if room:
+                accepted.append((num, room))
+                user_total += room
+                slip_numbers[num] = slip_numbers.get(num, 0) + room
+        return accepted, capped
+
+    def describe(self):
+        lines = []
+        for kind in CAP_KINDS:
+            for key, amount in sorted(self.tables[kind].items(), key=lambda item: str(item[0])):
+                label = f"{key:02d}" if isinstance(key, int) else key
+                lines.append(f"{kind} {label}: {amount}")
+        return lines
@@ -1,349 +1,618 @@
 import os
+import random
 import logging
-import psycopg2
-from psycopg2 import sql
-from psycopg2.extras import DictCursor
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
 from datetime import datetime
 import pytz
+from metrics import counted, current_handler
+from tracing import start_span, end_span
+from storage import get_backend
 
 MYANMAR_TIMEZONE = pytz.timezone('Asia/Yangon')
 
-# Database connection
+# Query instrumentation settings
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+EXPLAIN_SAMPLE_RATE = float(os.getenv("EXPLAIN_SAMPLE_RATE", "0"))  # Fraction of SELECTs to EXPLAIN ANALYZE
+QUERY_LOG_SIZE = int(os.getenv("QUERY_LOG_SIZE", "50"))
+
+# date_key ("dd/mm/yyyy AM") rewritten as "yyyymmddAM", which sorts sessions in time order
+SESSION_ORDER = "substr(date_key, 7, 4) || substr(date_key, 4, 2) || substr(date_key, 1, 2) || substr(date_key, 12, 2)"
+
+query_stats = {}  # {(function, statement): {'calls', 'rows', 'connect_ms', 'execute_ms', 'fetch_ms', 'max_ms'}}
+slow_queries = deque(maxlen=QUERY_LOG_SIZE)
+explain_plans = deque(maxlen=QUERY_LOG_SIZE)
+
+# Database connection (Postgres or SQLite, see storage.py)
 def get_db_connection():
-    return psycopg2.connect(
-        dbname=os.getenv("PGDATABASE"),
-        user=os.getenv("PGUSER"),
-        password=os.getenv("PGPASSWORD"),
-        host=os.getenv("PGHOST"),
-        port=os.getenv("PGPORT")
-    )
+    return get_backend().connect()
+
+# First words of a statement, used to group timings without the whitespace of the SQL text
+def _statement_name(query):
+    words = query.split()
+    return " ".join(words[:6]) + (" ..." if len(words) > 6 else "")
+
+def _record_query(record):
+    key = (record['function'], record['statement'])
+    stats = query_stats.get(key)
+    if stats is None:
+        stats = query_stats[key] = {'calls': 0, 'rows': 0, 'connect_ms': 0.0, 'execute_ms': 0.0, 'fetch_ms': 0.0, 'max_ms': 0.0}
+    stats['calls'] += 1
+    stats['rows'] += record['rows']
+    stats['connect_ms'] += record['connect_ms']
+    stats['execute_ms'] += record['execute_ms']
+    stats['fetch_ms'] += record['fetch_ms']
+    stats['max_ms'] = max(stats['max_ms'], record['total_ms'])
+
+    if record['total_ms'] >= SLOW_QUERY_MS:
+        slow_queries.append(record)
+        logging.warning(
+            "Slow query in %s: connect %.1f / execute %.1f / fetch %.1f ms, rows=%s %s",
+            record['function'], record['connect_ms'], record['execute_ms'], record['fetch_ms'],
+            record['rows'], record['statement'],
+            extra={'duration_ms': round(record['total_ms'], 1)}
+        )
+
+# One connection per database function; every statement runs through execute() so it is timed
+class QuerySession:
+    def __init__(self, function, conn, connect_ms, backend):
+        self.function = function
+        self.conn = conn
+        self.backend = backend
+        self.connect_ms = connect_ms
+        self.cur = None
+
+    def execute(self, query, params=None, fetch=None, dict_rows=False):
+        if self.cur:
+            self.cur.close()
+        self.cur = self.backend.cursor(self.conn, dict_rows)
+        span = start_span("sql")
+        start = perf_counter()
+        if params is None:
+            self.cur.execute(self.backend.sql(query))
+        else:
+            self.cur.execute(self.backend.sql(query), params)
+        executed = perf_counter()
+        if fetch == "all":
+            result = self.cur.fetchall()
+            rows = len(result)
+        elif fetch == "one":
+            result = self.cur.fetchone()
+            rows = 1 if result else 0
+        else:
+            result = None
+            rows = max(self.cur.rowcount, 0)
+        fetched = perf_counter()
+
+        record = {
+            'time': datetime.now(MYANMAR_TIMEZONE).strftime('%d/%m/%Y %H:%M:%S'),
+            'function': self.function,
+            'handler': current_handler() or "-",
+            'statement': _statement_name(query),
+            'connect_ms': self.connect_ms,
+            'execute_ms': (executed - start) * 1000,
+            'fetch_ms': (fetched - executed) * 1000,
+            'rows': rows,
+        }
+        record['total_ms'] = record['connect_ms'] + record['execute_ms'] + record['fetch_ms']
+        # The connection cost belongs to the first statement of the session only
+        self.connect_ms = 0.0
+        _record_query(record)
+        end_span(span, statement=record['statement'], rows=rows, connect_ms=round(record['connect_ms'], 3),
+                 execute_ms=round(record['execute_ms'], 3), fetch_ms=round(record['fetch_ms'], 3))
+
+        if fetch and EXPLAIN_SAMPLE_RATE > 0 and query.lstrip().upper().startswith("SELECT") and random.random() < EXPLAIN_SAMPLE_RATE:
+            self._explain(query, params)
+        return result
+
+    # One statement for many parameter sets (batched by the backend), timed as a single call
+    def executemany(self, query, rows):
+        if self.cur:
+            self.cur.close()
+        self.cur = self.backend.cursor(self.conn)
+        span = start_span("sql")
+        start = perf_counter()
+        self.backend.executemany(self.cur, query, rows)
+        elapsed = (perf_counter() - start) * 1000
+        record = {
+            'time': datetime.now(MYANMAR_TIMEZONE).strftime('%d/%m/%Y %H:%M:%S'),
+            'function': self.function,
+            'handler': current_handler() or "-",
+            'statement': _statement_name(query),
+            'connect_ms': self.connect_ms,
+            'execute_ms': elapsed,
+            'fetch_ms': 0.0,
+            'rows': len(rows),
+        }
+        record['total_ms'] = record['connect_ms'] + elapsed
+        self.connect_ms = 0.0
+        _record_query(record)
+        end_span(span, statement=record['statement'], rows=len(rows), execute_ms=round(elapsed, 3))
+
+    # EXPLAIN ANALYZE runs the query again, so only read-only statements are sampled
+    def _explain(self, query, params):
+        try:
+            plan = self.backend.explain(self.conn, query, params)
+            explain_plans.append({
+                'time': datetime.now(MYANMAR_TIMEZONE).strftime('%d/%m/%Y %H:%M:%S'),
+                'function': self.function,
+                'statement': _statement_name(query),
+                'plan': plan,
+            })
+        except Exception as e:
+            logging.error("Error capturing query plan: %s", e)
+
+    @property
+    def rowcount(self):
+        return self.cur.rowcount if self.cur else 0
+
+    def commit(self):
+        start = perf_counter()
+        self.conn.commit()
+        elapsed = (perf_counter() - start) * 1000
+        _record_query({
+            'time': datetime.now(MYANMAR_TIMEZONE).strftime('%d/%m/%Y %H:%M:%S'),
+            'function': self.function, 'handler': current_handler() or "-", 'statement': "COMMIT",
+            'connect_ms': 0.0, 'execute_ms': elapsed, 'fetch_ms': 0.0, 'rows': 0, 'total_ms': elapsed,
+        })
+
+    def close(self):
+        if self.cur:
+            self.cur.close()
+        self.backend.release(self.conn)
+
+@contextmanager
+def db_session(function):
+    span = start_span("db." + function)
+    try:
+        backend = get_backend()
+        start = perf_counter()
+        conn = backend.connect()
+        session = QuerySession(function, conn, (perf_counter() - start) * 1000, backend)
+        try:
+            yield session
+        finally:
+            session.close()
+    finally:
+        end_span(span)
+
+def get_query_stats():
+    return sorted(query_stats.items(), key=lambda item: item[1]['execute_ms'] + item[1]['fetch_ms'], reverse=True)
+
+def get_slow_queries():
+    return list(slow_queries)
+
+def get_explain_plans():
+    return list(explain_plans)
+
+def reset_query_stats():
+    query_stats.clear()
+    slow_queries.clear()
+    explain_plans.clear()
 
 # Initialize database tables
 def init_db():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Create user_data table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_data (
-                id SERIAL PRIMARY KEY,
-                username TEXT NOT NULL,
-                date_key TEXT NOT NULL,
-                number INTEGER NOT NULL,
-                amount INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create break_limits table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS break_limits (
-                id SERIAL PRIMARY KEY,
-                date_key TEXT NOT NULL UNIQUE,
-                limit_amount INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create pnumber_per_date table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS pnumber_per_date (
-                id SERIAL PRIMARY KEY,
-                date_key TEXT NOT NULL UNIQUE,
-                power_number INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create all_data table (for com and za)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS all_data (
-                id SERIAL PRIMARY KEY,
-                username TEXT NOT NULL UNIQUE,
-                com INTEGER NOT NULL,
-                za INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        conn.commit()
+        with db_session("init_db") as db:
+            # Create user_data table
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS user_data (
+                    id SERIAL PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    date_key TEXT NOT NULL,
+                    number INTEGER NOT NULL,
+                    amount INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # A user's history is read by username, then session: the session's bets by date_key,
+            # and the keyset pages in SESSION_ORDER, which this expression index keeps in order
+            db.execute("CREATE INDEX IF NOT EXISTS user_data_username_date_key ON user_data (username, date_key)")
+            db.execute(f"CREATE INDEX IF NOT EXISTS user_data_username_session ON user_data (username, ({SESSION_ORDER}), date_key)")
+
+            # Create break_limits table
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS break_limits (
+                    id SERIAL PRIMARY KEY,
+                    date_key TEXT NOT NULL UNIQUE,
+                    limit_amount INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Create pnumber_per_date table
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS pnumber_per_date (
+                    id SERIAL PRIMARY KEY,
+                    date_key TEXT NOT NULL UNIQUE,
+                    power_number INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Create journal_checkpoint table (last journal entry written to user_data, see journal.py)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS journal_checkpoint (
+                    id INTEGER PRIMARY KEY,
+                    seq BIGINT NOT NULL
+                )
+            """)
+
+            # Create all_data table (for com and za)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS all_data (
+                    id SERIAL PRIMARY KEY,
+                    username TEXT NOT NULL UNIQUE,
+                    com INTEGER NOT NULL,
+                    za INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            db.commit()
         logging.info("Database tables initialized successfully")
     except Exception as e:
-        logging.error(f"Error initializing database: {str(e)}")
+        logging.error("Error initializing database: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
 # User data operations
+@counted
 async def save_user_bet(username, date_key, number, amount):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            "INSERT INTO user_data (username, date_key, number, amount) VALUES (%s, %s, %s, %s)",
-            (username, date_key, number, amount)
-        )
-        
-        conn.commit()
+        with db_session("save_user_bet") as db:
+            db.execute(
+                "INSERT INTO user_data (username, date_key, number, amount) VALUES (%s, %s, %s, %s)",
+                (username, date_key, number, amount)
+            )
+            db.commit()
     except Exception as e:
-        logging.error(f"Error saving user bet: {str(e)}")
+        logging.error("Error saving user bet: %s", e)
+        raise
+
+# Write journaled bets and advance the journal checkpoint in one transaction, so a batch
+# is applied exactly once even if the bot stops between the commit and the journal update
+@counted
+async def save_bets_batch(rows, journal_seq):
+    try:
+        with db_session("save_bets_batch") as db:
+            db.executemany(
+                "INSERT INTO user_data (username, date_key, number, amount) VALUES (%s, %s, %s, %s)",
+                rows
+            )
+            db.execute(
+                """
+                INSERT INTO journal_checkpoint (id, seq)
+                VALUES (1, %s)
+                ON CONFLICT (id)
+                DO UPDATE SET seq = EXCLUDED.seq
+                """,
+                (journal_seq,)
+            )
+            db.commit()
+    except Exception as e:
+        logging.error("Error saving bet batch: %s", e)
+        raise
+
+@counted
+async def get_journal_checkpoint():
+    try:
+        with db_session("get_journal_checkpoint") as db:
+            result = db.execute("SELECT seq FROM journal_checkpoint WHERE id = 1", fetch="one")
+            return result[0] if result else 0
+    except Exception as e:
+        logging.error("Error getting journal checkpoint: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
+@counted
 async def get_user_bets(username=None, date_key=None):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
         query = "SELECT * FROM user_data"
         conditions = []
         params = []
-        
+
         if username:
             conditions.append("username = %s")
             params.append(username)
         if date_key:
             conditions.append("date_key = %s")
             params.append(date_key)
-            
+
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
-            
-        cur.execute(query, params)
-        return cur.fetchall()
+
+        with db_session("get_user_bets") as db:
+            return db.execute(query, params, fetch="all", dict_rows=True)
     except Exception as e:
-        logging.error(f"Error getting user bets: {str(e)}")
+        logging.error("Error getting user bets: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
+# Bets for an export, oldest first, in chunks of `size` rows (blocking; run it in a thread)
+def stream_user_data(date_keys=None, username=None, size=5000):
+    query = "SELECT username, date_key, number, amount, created_at FROM user_data"
+    conditions = []
+    params = []
+
+    if date_keys:
+        conditions.append("date_key IN (" + ", ".join(["%s"] * len(date_keys)) + ")")
+        params.extend(date_keys)
+    if username:
+        conditions.append("username = %s")
+        params.append(username)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY id"
+
+    start = perf_counter()
+    rows = 0
+    for chunk in get_backend().stream(query, params, size):
+        rows += len(chunk)
+        yield chunk
+    logging.info("Streamed %s user_data rows for export in %.1fs", rows, perf_counter() - start)
+
+# Every bet of the given sessions as (username, date_key, number, amount) tuples, in the
+# order they were placed (the settlement engine loads these into arrays, see settlement.py)
+@counted
+async def get_session_bets(date_keys):
+    if not date_keys:
+        return []
+    try:
+        with db_session("get_session_bets") as db:
+            return db.execute(
+                f"""
+                SELECT username, date_key, number, amount FROM user_data
+                WHERE date_key IN ({", ".join(["%s"] * len(date_keys))})
+                ORDER BY id
+                """,
+                list(date_keys),
+                fetch="all"
+            )
+    except Exception as e:
+        logging.error("Error getting session bets: %s", e)
+        raise
+
+def session_order(date_key):
+    return date_key[6:10] + date_key[3:5] + date_key[0:2] + date_key[11:13]
+
+# One page of a user's history, newest session first, with bets summed per number:
+# {'sessions': [(date_key, [(number, amount)])], 'more': bool}. Keyset pagination on
+# SESSION_ORDER: `before` pages to older sessions and `after` to newer ones, and `more`
+# says whether further sessions exist in that direction. The sessions are read in the order
+# of the user_data_username_session index, so a page stops after limit + 1 sessions.
+@counted
+async def get_user_history_page(username, before=None, after=None, limit=3):
+    try:
+        query = f"SELECT DISTINCT {SESSION_ORDER} AS session, date_key FROM user_data WHERE username = %s"
+        params = [username]
+        if after is not None:
+            query += f" AND {SESSION_ORDER} > %s ORDER BY session, date_key LIMIT %s"
+            params += [after, limit + 1]
+        else:
+            if before is not None:
+                query += f" AND {SESSION_ORDER} < %s"
+                params.append(before)
+            query += " ORDER BY session DESC, date_key DESC LIMIT %s"
+            params.append(limit + 1)
+
+        with db_session("get_user_history_page") as db:
+            date_keys = [row[1] for row in db.execute(query, params, fetch="all")]
+            more = len(date_keys) > limit
+            date_keys = date_keys[:limit]
+            if after is not None:
+                date_keys.reverse()
+            if not date_keys:
+                return {'sessions': [], 'more': False}
+
+            sessions = {date_key: [] for date_key in date_keys}
+            rows = db.execute(
+                f"""
+                SELECT date_key, number, SUM(amount) FROM user_data
+                WHERE username = %s AND date_key IN ({", ".join(["%s"] * len(date_keys))})
+                GROUP BY date_key, number
+                ORDER BY number
+                """,
+                [username] + date_keys,
+                fetch="all"
+            )
+            for date_key, number, amount in rows:
+                sessions[date_key].append((number, amount))
+            return {'sessions': list(sessions.items()), 'more': more}
+    except Exception as e:
+        logging.error("Error getting user history page: %s", e)
+        raise
+
+@counted
 async def delete_user_bet(username, date_key, number, amount):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            """
-            DELETE FROM user_data 
-            WHERE username = %s AND date_key = %s AND number = %s AND amount = %s
-            """,
-            (username, date_key, number, amount)
-        )
-        
-        conn.commit()
-        return cur.rowcount > 0
+        with db_session("delete_user_bet") as db:
+            db.execute(
+                """
+                DELETE FROM user_data
+                WHERE username = %s AND date_key = %s AND number = %s AND amount = %s
+                """,
+                (username, date_key, number, amount)
+            )
+            db.commit()
+            return db.rowcount > 0
     except Exception as e:
-        logging.error(f"Error deleting user bet: {str(e)}")
+        logging.error("Error deleting user bet: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
 # Break limits operations
+@counted
 async def save_break_limit(date_key, limit_amount):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            """
-            INSERT INTO break_limits (date_key, limit_amount) 
-            VALUES (%s, %s)
-            ON CONFLICT (date_key) 
-            DO UPDATE SET limit_amount = EXCLUDED.limit_amount
-            """,
-            (date_key, limit_amount)
-        )
-        
-        conn.commit()
+        with db_session("save_break_limit") as db:
+            db.execute(
+                """
+                INSERT INTO break_limits (date_key, limit_amount)
+                VALUES (%s, %s)
+                ON CONFLICT (date_key)
+                DO UPDATE SET limit_amount = EXCLUDED.limit_amount
+                """,
+                (date_key, limit_amount)
+            )
+            db.commit()
     except Exception as e:
-        logging.error(f"Error saving break limit: {str(e)}")
+        logging.error("Error saving break limit: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
+@counted
 async def get_break_limit(date_key):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            "SELECT limit_amount FROM break_limits WHERE date_key = %s",
-            (date_key,)
-        )
-        
-        result = cur.fetchone()
-        return result[0] if result else None
+        with db_session("get_break_limit") as db:
+            result = db.execute(
+                "SELECT limit_amount FROM break_limits WHERE date_key = %s",
+                (date_key,),
+                fetch="one"
+            )
+            return result[0] if result else None
     except Exception as e:
-        logging.error(f"Error getting break limit: {str(e)}")
+        logging.error("Error getting break limit: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
 # Power number operations
+@counted
 async def save_power_number(date_key, power_number):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            """
-            INSERT INTO pnumber_per_date (date_key, power_number) 
-            VALUES (%s, %s)
-            ON CONFLICT (date_key) 
-            DO UPDATE SET power_number = EXCLUDED.power_number
-            """,
-            (date_key, power_number)
-        )
-        
-        conn.commit()
+        with db_session("save_power_number") as db:
+            db.execute(
+                """
+                INSERT INTO pnumber_per_date (date_key, power_number)
+                VALUES (%s, %s)
+                ON CONFLICT (date_key)
+                DO UPDATE SET power_number = EXCLUDED.power_number
+                """,
+                (date_key, power_number)
+            )
+            db.commit()
     except Exception as e:
-        logging.error(f"Error saving power number: {str(e)}")
+        logging.error("Error saving power number: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
+@counted
 async def get_power_number(date_key):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            "SELECT power_number FROM pnumber_per_date WHERE date_key = %s",
-            (date_key,)
-        )
-        
-        result = cur.fetchone()
-        return result[0] if result else None
+        with db_session("get_power_number") as db:
+            result = db.execute(
+                "SELECT power_number FROM pnumber_per_date WHERE date_key = %s",
+                (date_key,),
+                fetch="one"
+            )
+            return result[0] if result else None
     except Exception as e:
-        logging.error(f"Error getting power number: {str(e)}")
+        logging.error("Error getting power number: %s", e)
+        raise
+
+# Power numbers of several dates in one query: {date_key: power_number}
+@counted
+async def get_power_numbers(date_keys):
+    if not date_keys:
+        return {}
+    try:
+        with db_session("get_power_numbers") as db:
+            rows = db.execute(
+                f"SELECT date_key, power_number FROM pnumber_per_date WHERE date_key IN ({', '.join(['%s'] * len(date_keys))})",
+                list(date_keys),
+                fetch="all"
+            )
+            return {date_key: power_number for date_key, power_number in rows}
+    except Exception as e:
+        logging.error("Error getting power numbers: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
 # All data operations (com and za)
+@counted
 async def save_user_com_za(username, com, za):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            """
-            INSERT INTO all_data (username, com, za) 
-            VALUES (%s, %s, %s)
-            ON CONFLICT (username) 
-            DO UPDATE SET com = EXCLUDED.com, za = EXCLUDED.za
-            """,
-            (username, com, za)
-        )
-        
-        conn.commit()
+        with db_session("save_user_com_za") as db:
+            db.execute(
+                """
+                INSERT INTO all_data (username, com, za)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (username)
+                DO UPDATE SET com = EXCLUDED.com, za = EXCLUDED.za
+                """,
+                (username, com, za)
+            )
+            db.commit()
     except Exception as e:
-        logging.error(f"Error saving user com/za: {str(e)}")
+        logging.error("Error saving user com/za: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
+@counted
 async def get_user_com_za(username):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            "SELECT com, za FROM all_data WHERE username = %s",
-            (username,)
-        )
-        
-        result = cur.fetchone()
-        return result if result else (0, 80)  # Default values
+        with db_session("get_user_com_za") as db:
+            result = db.execute(
+                "SELECT com, za FROM all_data WHERE username = %s",
+                (username,),
+                fetch="one"
+            )
+            return result if result else (0, 80)  # Default values
     except Exception as e:
-        logging.error(f"Error getting user com/za: {str(e)}")
+        logging.error("Error getting user com/za: %s", e)
+        raise
+
+# com/za of several users in one query: {username: (com, za)}; users without settings are left out
+@counted
+async def get_users_com_za(usernames):
+    if not usernames:
+        return {}
+    try:
+        with db_session("get_users_com_za") as db:
+            rows = db.execute(
+                f"SELECT username, com, za FROM all_data WHERE username IN ({', '.join(['%s'] * len(usernames))})",
+                list(usernames),
+                fetch="all"
+            )
+            return {username: (com, za) for username, com, za in rows}
+    except Exception as e:
+        logging.error("Error getting users com/za: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
+@counted
 async def get_all_users():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT username FROM all_data")
-        return [row[0] for row in cur.fetchall()]
+        with db_session("get_all_users") as db:
+            return [row[0] for row in db.execute("SELECT username FROM all_data", fetch="all")]
     except Exception as e:
-        logging.error(f"Error getting all users: {str(e)}")
+        logging.error("Error getting all users: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
 # Date operations
+@counted
 async def get_available_dates():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Get dates from user_data
-        cur.execute("SELECT DISTINCT date_key FROM user_data ORDER BY date_key DESC")
-        user_dates = [row[0] for row in cur.fetchall()]
-        
-        # Get dates from break_limits
-        cur.execute("SELECT DISTINCT date_key FROM break_limits ORDER BY date_key DESC")
-        break_dates = [row[0] for row in cur.fetchall()]
-        
-        # Get dates from pnumber_per_date
-        cur.execute("SELECT DISTINCT date_key FROM pnumber_per_date ORDER BY date_key DESC")
-        pnumber_dates = [row[0] for row in cur.fetchall()]
-        
+        with db_session("get_available_dates") as db:
+            # Get dates from user_data
+            user_dates = [row[0] for row in db.execute("SELECT DISTINCT date_key FROM user_data ORDER BY date_key DESC", fetch="all")]
+
+            # Get dates from break_limits
+            break_dates = [row[0] for row in db.execute("SELECT DISTINCT date_key FROM break_limits ORDER BY date_key DESC", fetch="all")]
+
+            # Get dates from pnumber_per_date
+            pnumber_dates = [row[0] for row in db.execute("SELECT DISTINCT date_key FROM pnumber_per_date ORDER BY date_key DESC", fetch="all")]
+
         # Combine and deduplicate
         all_dates = list(set(user_dates + break_dates + pnumber_dates))
         return sorted(all_dates, reverse=True)
     except Exception as e:
-        logging.error(f"Error getting available dates: {str(e)}")
+        logging.error("Error getting available dates: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
+@counted
 async def delete_date_data(date_key):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Delete from all tables
-        cur.execute("DELETE FROM user_data WHERE date_key = %s", (date_key,))
-        cur.execute("DELETE FROM break_limits WHERE date_key = %s", (date_key,))
-        cur.execute("DELETE FROM pnumber_per_date WHERE date_key = %s", (date_key,))
-        
-        conn.commit()
+        with db_session("delete_date_data") as db:
+            # Delete from all tables
+            db.execute("DELETE FROM user_data WHERE date_key = %s", (date_key,))
+            db.execute("DELETE FROM break_limits WHERE date_key = %s", (date_key,))
+            db.execute("DELETE FROM pnumber_per_date WHERE date_key = %s", (date_key,))
+            db.commit()
         return True
     except Exception as e:
-        logging.error(f"Error deleting date data: {str(e)}")
+        logging.error("Error deleting date data: %s", e)
         raise
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
@@ -0,0 +1,90 @@
+import os
+import csv
+import logging
+import tempfile
+from time import perf_counter
+from database import stream_user_data
+from reports import document_filename
+
+# Bulk export of user_data to CSV or Parquet. Rows are streamed from the database in chunks
+# and written straight to a file, so memory use does not grow with the size of the export.
+EXPORT_DIR = os.getenv("EXPORT_DIR", "")  # Also keep a copy of every export here; empty keeps none
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))  # Rows fetched (and one Parquet row group) at a time
+EXPORT_MAX_SEND_BYTES = int(os.getenv("EXPORT_MAX_SEND_BYTES", str(50 * 1024 * 1024)))  # Bot API upload limit
+
+EXPORT_FORMATS = ("csv", "parquet")
+EXPORT_COLUMNS = ["username", "date_key", "number", "amount", "created_at"]
+
+logger = logging.getLogger(__name__)
+
+def _write_csv(path, chunks):
+    rows = 0
+    # utf-8-sig so spreadsheet apps detect the Myanmar text correctly (as in reports.py)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_COLUMNS)
+        for chunk in chunks:
+            writer.writerows((username, date_key, f"{number:02d}", amount, created_at)
+                             for username, date_key, number, amount, created_at in chunk)
+            rows += len(chunk)
+    return rows
+
+def _write_parquet(path, chunks):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([
+        ("username", pa.string()),
+        ("date_key", pa.string()),
+        ("number", pa.int16()),
+        ("amount", pa.int64()),
+        ("created_at", pa.string()),
+    ])
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            columns[4] = [str(value) if value is not None else None for value in columns[4]]
+            writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type)
+                                                     for column, field in zip(columns, schema)], schema=schema))
+            rows += len(chunk)
+    return rows
+
+WRITERS = {"csv": _write_csv, "parquet": _write_parquet}
+
+# Write the selected bets to a file (blocking; run it in a thread). The file lands in
+# EXPORT_DIR when set, else in a temporary file the caller removes once it is sent.
+def export_bets(fmt, name, date_keys=None, username=None):
+    start = perf_counter()
+    if EXPORT_DIR:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        path = os.path.join(EXPORT_DIR, document_filename(name, fmt))
+    else:
+        handle, path = tempfile.mkstemp(suffix=f".{fmt}", prefix="export-")
+        os.close(handle)
+    try:
+        rows = WRITERS[fmt](path, stream_user_data(date_keys, username, EXPORT_CHUNK_ROWS))
+    except Exception:
+        os.remove(path)
+        raise
+    result = {
+        'path': path,
+        'filename': document_filename(name, fmt),
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+        'seconds': perf_counter() - start,
+        'kept': bool(EXPORT_DIR),
+    }
+    logger.info("Exported %s rows (%s bytes) to %s in %.1fs", rows, result['bytes'], path, result['seconds'])
+    return result
+
+# Remove the temporary file of an export that is not kept in EXPORT_DIR
+def discard_export(result):
+    if not result['kept']:
+        try:
+            os.remove(result['path'])
+        except OSError as e:
+            logger.warning("Could not remove export file %s: %s", result['path'], e)
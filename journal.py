@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import functools
+import contextvars
+from database import save_bets_batch, get_journal_checkpoint
+
+# Local write-ahead journal for bets: a slip is acknowledged once its bets are fsync'd to
+# JOURNAL_PATH, and a background task writes them to the database in batches.
+# Entries the database has not confirmed (journal_checkpoint) are replayed on restart.
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "")  # Empty writes bets straight to the database
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.2"))  # Seconds between batches
+JOURNAL_BATCH_SIZE = int(os.getenv("JOURNAL_BATCH_SIZE", "1000"))  # Bets per database transaction
+JOURNAL_MAX_BYTES = int(os.getenv("JOURNAL_MAX_BYTES", str(64 * 1024 * 1024)))  # Compact once fully flushed and larger
+JOURNAL_RETRY_MAX = float(os.getenv("JOURNAL_RETRY_MAX", "30"))  # Longest wait between retries while the database is down
+
+logger = logging.getLogger(__name__)
+
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.next_seq = 1
+        self.pending = []  # Entries on disk but not yet in the database, oldest first
+        self.pending_count = 0  # Bets in self.pending
+        self.write_buffer = []  # (line, future) waiting for the next fsync
+        self.syncing = False
+        self.write_lock = asyncio.Lock()
+        self.flush_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.flusher = None
+        self.stats = {
+            'appended': 0, 'flushed': 0, 'batches': 0, 'failures': 0, 'fsyncs': 0, 'replayed': 0,
+            'last_flush_ms': 0.0, 'last_error': None,
+        }
+
+    # Load unflushed entries (after a restart) and start the background flusher
+    async def open(self):
+        checkpoint = await get_journal_checkpoint()
+        last_seq = checkpoint
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logger.warning("Skipping torn journal line")
+                        continue
+                    last_seq = max(last_seq, entry['seq'])
+                    if entry['seq'] > checkpoint:
+                        self.pending.append(entry)
+                        self.pending_count += len(entry['bets'])
+        self.next_seq = last_seq + 1
+        self.stats['replayed'] = len(self.pending)
+        if self.pending:
+            logger.info("Replaying %s journal entries not yet in the database", len(self.pending))
+        self.file = open(self.path, 'a', encoding='utf-8')
+        # A fresh context keeps the flusher out of the caller's trace
+        self.flusher = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+        self.wakeup.set()
+
+    # Journal a slip's bets; returns once they are durable on local disk
+    async def append(self, username, date_key, bets):
+        entry = {'seq': self.next_seq, 't': round(time.time(), 3), 'username': username,
+                 'date_key': date_key, 'bets': [[num, amt] for num, amt in bets]}
+        self.next_seq += 1
+        future = asyncio.get_running_loop().create_future()
+        self.write_buffer.append((json.dumps(entry, ensure_ascii=False) + "\n", future))
+        if not self.syncing:
+            self.syncing = True
+            asyncio.get_running_loop().create_task(self._sync(), context=contextvars.Context())
+        await future
+        self.pending.append(entry)
+        self.pending_count += len(entry['bets'])
+        self.stats['appended'] += 1
+        if self.pending_count >= JOURNAL_BATCH_SIZE:
+            self.wakeup.set()
+        return entry['seq']
+
+    # Group commit on disk: everything buffered while the previous fsync ran shares the next one
+    async def _sync(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self.write_buffer:
+                batch, self.write_buffer = self.write_buffer, []
+                async with self.write_lock:
+                    try:
+                        self.file.write("".join(line for line, _ in batch))
+                        self.file.flush()
+                        await loop.run_in_executor(None, os.fsync, self.file.fileno())
+                        self.stats['fsyncs'] += 1
+                    except Exception as e:
+                        logger.error("Error writing journal: %s", e)
+                        for _, future in batch:
+                            if not future.done():
+                                future.set_exception(e)
+                        continue
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+        finally:
+            self.syncing = False
+
+    # Write pending entries to the database, one transaction per batch
+    async def flush(self):
+        async with self.flush_lock:
+            while self.pending:
+                batch, bets = [], 0
+                for entry in self.pending:
+                    batch.append(entry)
+                    bets += len(entry['bets'])
+                    if bets >= JOURNAL_BATCH_SIZE:
+                        break
+                rows = [(e['username'], e['date_key'], num, amt) for e in batch for num, amt in e['bets']]
+                start = time.perf_counter()
+                await save_bets_batch(rows, batch[-1]['seq'])
+                self.stats['last_flush_ms'] = (time.perf_counter() - start) * 1000
+                self.stats['flushed'] += len(rows)
+                self.stats['batches'] += 1
+                del self.pending[:len(batch)]
+                self.pending_count -= len(rows)
+            await self._compact()
+
+    # Start the file over once everything in it is in the database
+    async def _compact(self):
+        if self.pending or self.write_buffer or self.file.tell() < JOURNAL_MAX_BYTES:
+            return
+        async with self.write_lock:
+            if self.pending or self.write_buffer:
+                return
+            self.file.truncate(0)
+            self.file.seek(0)
+            os.fsync(self.file.fileno())
+            logger.info("Journal compacted")
+
+    # Reads and deletes must see every acknowledged bet: flush before them
+    async def barrier(self):
+        if self.pending:
+            await self.flush()
+
+    async def _run(self):
+        delay = JOURNAL_FLUSH_INTERVAL
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+                delay = JOURNAL_FLUSH_INTERVAL
+                self.stats['last_error'] = None
+            except Exception as e:
+                # Keep the entries and back off while the database is unavailable
+                self.stats['failures'] += 1
+                self.stats['last_error'] = str(e)
+                delay = min(JOURNAL_RETRY_MAX, max(delay * 2, 1.0))
+                logger.warning("Journal flush failed, retrying in %.0fs: %s", delay, e)
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'pending_entries': len(self.pending),
+            'pending_bets': self.pending_count,
+            'oldest_pending_s': time.time() - self.pending[0]['t'] if self.pending else 0.0,
+            'file_bytes': self.file.tell() if self.file else 0,
+        }
+
+    async def close(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error("Journal entries left for the next start: %s", e)
+        if self.file is not None:
+            self.file.close()
+
+journal = None  # The open Journal when JOURNAL_PATH is set
+
+async def open_journal():
+    global journal
+    if JOURNAL_PATH and journal is None:
+        journal = Journal(JOURNAL_PATH)
+        await journal.open()
+    return journal
+
+async def close_journal():
+    global journal
+    if journal is not None:
+        await journal.close()
+        journal = None
+
+# Wrap a database read or delete so it runs after every journaled bet has reached the database
+def after_flush(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if journal is not None:
+            await journal.barrier()
+        return await func(*args, **kwargs)
+    return wrapper
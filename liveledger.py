@@ -0,0 +1,93 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from telegram.error import RetryAfter, BadRequest
+from state import SessionStore
+
+# Live ledger: a pinned message per session that is edited in place as slips, deletes and
+# overbuys come in. Changes only mark the session dirty; one edit per LIVE_LEDGER_DEBOUNCE
+# seconds covers everything marked in between, so a busy session stays well inside
+# Telegram's edit limits (about 20 per minute per chat), and an edit that would not change
+# the text is skipped.
+LIVE_LEDGER_DEBOUNCE = float(os.getenv("LIVE_LEDGER_DEBOUNCE", "3"))  # Seconds between edits
+LIVE_LEDGER_MAX = int(os.getenv("LIVE_LEDGER_MAX", "8"))  # Sessions with a live ledger
+
+logger = logging.getLogger(__name__)
+
+class LiveLedger:
+    def __init__(self, render, edit):
+        self.render = render  # async render(date_key) -> text
+        self.edit = edit  # async edit(chat_id, message_id, text)
+        self.messages = SessionStore("live_ledgers", LIVE_LEDGER_MAX, lambda date_key, _: date_key)  # {date_key: {'chat_id', 'message_id', 'text'}}
+        self.dirty = set()
+        self.flusher = None
+        self.paused_until = 0.0
+        self.stats = {'marks': 0, 'edits': 0, 'unchanged': 0, 'failed': 0, 'retry_after': 0}
+
+    def start(self, date_key, chat_id, message_id, text):
+        self.messages[date_key] = {'chat_id': chat_id, 'message_id': message_id, 'text': text}
+        self.dirty.discard(date_key)
+
+    # Stop editing a session's message; returns its (chat_id, message_id), or None
+    def stop(self, date_key):
+        self.dirty.discard(date_key)
+        entry = self.messages.pop(date_key)
+        return (entry['chat_id'], entry['message_id']) if entry else None
+
+    def mark(self, date_key):
+        if date_key not in self.messages:
+            return
+        self.stats['marks'] += 1
+        self.dirty.add(date_key)
+        if self.flusher is None:
+            # A fresh context keeps the delayed edits out of the slip's trace
+            self.flusher = asyncio.get_running_loop().create_task(self._flush_later(), context=contextvars.Context())
+
+    # Something every ledger shows changed (e.g. the closed numbers)
+    def mark_all(self):
+        for date_key in self.messages.keys():
+            self.mark(date_key)
+
+    async def _flush_later(self):
+        try:
+            while self.dirty:
+                await asyncio.sleep(max(LIVE_LEDGER_DEBOUNCE, self.paused_until - time.monotonic()))
+                dirty, self.dirty = sorted(self.dirty), set()
+                for i, date_key in enumerate(dirty):
+                    if not await self._update(date_key):
+                        # Flood limit: the rest wait for the next round
+                        self.dirty.update(dirty[i:])
+                        break
+        finally:
+            self.flusher = None
+
+    # Edit one session's message; False when Telegram asked us to back off
+    async def _update(self, date_key):
+        entry = self.messages.get(date_key)
+        if entry is None:
+            return True
+        try:
+            text = await self.render(date_key)
+            if text == entry['text']:
+                self.stats['unchanged'] += 1
+                return True
+            await self.edit(entry['chat_id'], entry['message_id'], text)
+        except RetryAfter as e:
+            self.stats['retry_after'] += 1
+            logger.warning("Flood limit hit, pausing live ledger edits for %ss", e.retry_after)
+            self.paused_until = time.monotonic() + e.retry_after
+            return False
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                self.stats['failed'] += 1
+                logger.error("Error editing live ledger for %s: %s", date_key, e)
+                return True
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.error("Error editing live ledger for %s: %s", date_key, e)
+            return True
+        entry['text'] = text
+        self.stats['edits'] += 1
+        return True
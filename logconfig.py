@@ -0,0 +1,103 @@
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+# Log records are queued on the event loop and formatted/written by a background thread
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# INFO lines from these loggers are kept at LOG_INFO_SAMPLE_RATE (httpx logs every Bot API call)
+LOG_INFO_SAMPLE_RATE = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1"))
+LOG_SAMPLED_LOGGERS = tuple(name for name in os.getenv("LOG_SAMPLED_LOGGERS", "httpx").split(",") if name)
+
+STRUCTURED_FIELDS = ('handler', 'user', 'date_key', 'duration_ms')
+
+# Structured fields for log lines written by the current task
+log_fields = contextvars.ContextVar('log_fields', default=None)
+
+listeners = []
+dropped = {'count': 0}
+
+# Attach fields (handler, user, date_key, ...) to every log line of the current call
+def bind(**fields):
+    current = log_fields.get()
+    log_fields.set({**current, **fields} if current else fields)
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        fields = log_fields.get()
+        if fields:
+            for key, value in fields.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record):
+        if LOG_INFO_SAMPLE_RATE >= 1 or record.levelno != logging.INFO:
+            return True
+        if not record.name.startswith(LOG_SAMPLED_LOGGERS):
+            return True
+        return random.random() < LOG_INFO_SAMPLE_RATE
+
+# Queue the record as-is so message formatting happens on the listener thread,
+# and drop (and count) records instead of blocking when the queue is full
+class BackgroundQueueHandler(QueueHandler):
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped['count'] += 1
+
+class StructuredFormatter(logging.Formatter):
+    def format(self, record):
+        fields = {key: getattr(record, key) for key in STRUCTURED_FIELDS if getattr(record, key, None) is not None}
+        if LOG_FORMAT == "json":
+            entry = {
+                'time': self.formatTime(record),
+                'logger': record.name,
+                'level': record.levelname,
+                'message': record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                entry['exc_info'] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        text = super().format(record)
+        if fields:
+            text += " [" + " ".join(f"{key}={value}" for key, value in fields.items()) + "]"
+        return text
+
+# Wrap `handler` so records are written by its own background thread
+def background_handler(handler):
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    listeners.append(listener)
+    return BackgroundQueueHandler(log_queue)
+
+def stop_logging():
+    while listeners:
+        listeners.pop().stop()
+
+def setup_logging(extra_handlers=()):
+    stream = logging.StreamHandler()
+    stream.setFormatter(StructuredFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    handler = background_handler(stream)
+    handler.addFilter(SamplingFilter())
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+    for extra in extra_handlers:
+        root.addHandler(extra)
+    atexit.register(stop_logging)
@@ -0,0 +1,188 @@
+import os
+import time
+import bisect
+import asyncio
+import logging
+import functools
+import contextvars
+from sender import get_send_stats
+from tracing import start_span, end_span, TRACING_ENABLED
+from profiler import note_handler
+from logconfig import log_fields
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 disables the HTTP endpoint
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+handler_latency = {}  # {handler: [bucket counts..., +Inf count]}
+handler_latency_sum = {}  # {handler: seconds}
+handler_updates = {}  # {handler: count}
+handler_errors = {}  # {handler: count}
+timed_handlers = set()  # Names of every @timed handler (what /profile can narrow to)
+bets_parsed = {'accepted': 0, 'blocked': 0}
+db_calls = {}  # {function: count}
+gauges = {}  # {name: (help, callback)}
+handler_samples = None  # {handler: [seconds]} while raw latencies are being collected (benchmarks)
+
+# State of the handler call currently running in this task: {'handler': name, 'error': bool}
+current_call = contextvars.ContextVar('current_call', default=None)
+
+def current_handler():
+    call = current_call.get()
+    return call['handler'] if call else None
+
+def observe_handler(name, seconds, failed):
+    counts = handler_latency.get(name)
+    if counts is None:
+        counts = handler_latency[name] = [0] * (len(LATENCY_BUCKETS) + 1)
+    counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    handler_latency_sum[name] = handler_latency_sum.get(name, 0.0) + seconds
+    handler_updates[name] = handler_updates.get(name, 0) + 1
+    if failed:
+        handler_errors[name] = handler_errors.get(name, 0) + 1
+    if handler_samples is not None:
+        handler_samples.setdefault(name, []).append(seconds)
+
+# Start keeping every handler latency (for percentiles); returns the {handler: [seconds]} dict
+def collect_samples():
+    global handler_samples
+    handler_samples = {}
+    return handler_samples
+
+def _update_attrs(args):
+    user = getattr(args[0], 'effective_user', None) if args else None
+    return {'user': user.username or user.id} if user else {}
+
+# Time a handler (and trace it) and count it as failed when it raises or logs an error
+def timed(func):
+    name = func.__name__
+    timed_handlers.add(name)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        call = {'handler': name, 'error': False}
+        token = current_call.set(call)
+        attrs = _update_attrs(args)
+        fields_token = log_fields.set({'handler': name, **attrs})
+        span = start_span(name, root=True, **attrs) if TRACING_ENABLED else None
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            call['error'] = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            current_call.reset(token)
+            observe_handler(name, seconds, call['error'])
+            end_span(span, **({'error': True} if call['error'] else {}))
+            note_handler(name)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("%s finished", name, extra={'duration_ms': round(seconds * 1000, 1)})
+            log_fields.reset(fields_token)
+    return wrapper
+
+# Count calls to a database function
+def counted(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        db_calls[name] = db_calls.get(name, 0) + 1
+        return await func(*args, **kwargs)
+    return wrapper
+
+def count_bets(accepted, blocked):
+    bets_parsed['accepted'] += accepted
+    bets_parsed['blocked'] += blocked
+
+def register_gauge(name, help_text, callback):
+    gauges[name] = (help_text, callback)
+
+# Handlers catch their own exceptions and log them, so error logs mark the current call as failed
+class ErrorLogCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record):
+        call = current_call.get()
+        if call is not None:
+            call['error'] = True
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_metrics():
+    lines = [
+        "# HELP bot_handler_latency_seconds Handler latency",
+        "# TYPE bot_handler_latency_seconds histogram",
+    ]
+    for name, counts in handler_latency.items():
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f'bot_handler_latency_seconds_bucket{{handler="{_label(name)}",le="{bound}"}} {cumulative}')
+        lines.append(f'bot_handler_latency_seconds_sum{{handler="{_label(name)}"}} {handler_latency_sum[name]:.6f}')
+        lines.append(f'bot_handler_latency_seconds_count{{handler="{_label(name)}"}} {cumulative}')
+
+    lines += ["# HELP bot_handler_updates_total Updates handled", "# TYPE bot_handler_updates_total counter"]
+    lines += [f'bot_handler_updates_total{{handler="{_label(n)}"}} {c}' for n, c in handler_updates.items()]
+    lines += ["# HELP bot_handler_errors_total Failed handler calls", "# TYPE bot_handler_errors_total counter"]
+    lines += [f'bot_handler_errors_total{{handler="{_label(n)}"}} {c}' for n, c in handler_errors.items()]
+    lines += ["# HELP bot_bets_parsed_total Bets parsed from slips", "# TYPE bot_bets_parsed_total counter"]
+    lines += [f'bot_bets_parsed_total{{status="{s}"}} {c}' for s, c in bets_parsed.items()]
+    lines += ["# HELP bot_db_calls_total Database function calls", "# TYPE bot_db_calls_total counter"]
+    lines += [f'bot_db_calls_total{{function="{_label(n)}"}} {c}' for n, c in db_calls.items()]
+
+    send = get_send_stats()
+    lines += [
+        "# HELP bot_send_queue_depth Messages waiting in the send queue",
+        "# TYPE bot_send_queue_depth gauge",
+        f"bot_send_queue_depth {send['queued_messages']}",
+        "# HELP bot_send_delay_seconds Time from queueing to sending",
+        "# TYPE bot_send_delay_seconds summary",
+        f"bot_send_delay_seconds_sum {send['delay_total']:.6f}",
+        f"bot_send_delay_seconds_count {send['sent']}",
+        "# HELP bot_send_retry_after_total Flood-limit responses from Telegram",
+        "# TYPE bot_send_retry_after_total counter",
+        f"bot_send_retry_after_total {send['retry_after']}",
+    ]
+
+    for name, (help_text, callback) in gauges.items():
+        try:
+            value = callback()
+        except Exception as e:
+            logger.error("Error reading gauge %s: %s", name, e)
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+async def _serve(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split('?')[0] == "/metrics":
+            status, body = "200 OK", render_metrics().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.error("Error serving metrics: %s", e)
+    finally:
+        writer.close()
+
+# Serve Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    server = await asyncio.start_server(_serve, host, port)
+    logger.info("Metrics endpoint listening on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+# Sampling profiler for the event loop thread, started on demand by an admin command
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "15"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "600"))  # Upper bound for update-count profiles
+
+logger = logging.getLogger(__name__)
+
+session = None  # The running profile, if any
+
+def is_running():
+    return session is not None
+
+# Sample the calling (event loop) thread for `seconds`, or until `updates` more updates were
+# handled; with `handlers`, only samples taken inside those handlers are kept.
+# `on_done(result)` is awaited on the loop when the profile stops.
+def start_profile(on_done, seconds=None, updates=None, handlers=None):
+    global session
+    if session is not None:
+        raise RuntimeError("A profile is already running")
+    session = {
+        'thread_id': threading.get_ident(),
+        'loop': asyncio.get_running_loop(),
+        'on_done': on_done,
+        'deadline': time.monotonic() + (seconds or PROFILE_MAX_SECONDS),
+        'updates_left': updates,
+        'handlers': set(handlers) if handlers else None,
+        'stop': threading.Event(),
+        'stacks': Counter(),
+        'samples': 0,
+        'started': datetime.now(),
+    }
+    threading.Thread(target=_sample, args=(session,), name="profiler", daemon=True).start()
+    return session
+
+def stop_profile():
+    if session is not None:
+        session['stop'].set()
+
+def _count(handler=None):
+    sess = session
+    if sess is None or sess['updates_left'] is None:
+        return
+    if (handler is None) != (sess['handlers'] is None):
+        return
+    if handler is not None and handler not in sess['handlers']:
+        return
+    sess['updates_left'] -= 1
+    if sess['updates_left'] <= 0:
+        sess['stop'].set()
+
+# Called for every incoming update (counts towards whole-loop profiles)
+def note_update():
+    _count()
+
+# Called when a handler finishes (counts towards handler-filtered profiles)
+def note_handler(name):
+    _count(name)
+
+def _sample(sess):
+    handlers = sess['handlers']
+    while not sess['stop'].wait(PROFILE_INTERVAL):
+        if time.monotonic() >= sess['deadline']:
+            break
+        frame = sys._current_frames().get(sess['thread_id'])
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        sess['samples'] += 1
+        if handlers:
+            start = next((i for i, code in enumerate(stack) if code.co_name in handlers), None)
+            if start is None:
+                continue
+            stack = stack[start:]
+        if stack:
+            sess['stacks'][tuple(stack)] += 1
+
+    try:
+        result = _finish(sess)
+    except Exception as e:
+        logger.error("Error writing profile: %s", e)
+        result = {'error': str(e)}
+    _clear(sess)
+    sess['loop'].call_soon_threadsafe(lambda: asyncio.ensure_future(sess['on_done'](result)))
+
+def _clear(sess):
+    global session
+    if session is sess:
+        session = None
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+# Write collapsed stacks (flamegraph.pl / speedscope format) and build a top-N summary
+def _finish(sess):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"profile-{sess['started'].strftime('%Y%m%d-%H%M%S')}.folded")
+    own = Counter()
+    inclusive = Counter()
+    kept = 0
+    with open(path, 'w', encoding='utf-8') as out:
+        for stack, count in sess['stacks'].most_common():
+            out.write(";".join(_label(code).replace(";", ",") for code in stack) + f" {count}\n")
+            own[stack[-1]] += count
+            for code in set(stack):
+                inclusive[code] += count
+            kept += count
+
+    def top(counter):
+        return [(_label(code), count, 100.0 * count / kept) for code, count in counter.most_common(PROFILE_TOP_N)]
+
+    return {
+        'path': path,
+        'samples': sess['samples'],
+        'kept': kept,
+        'seconds': (datetime.now() - sess['started']).total_seconds(),
+        'handlers': sorted(sess['handlers']) if sess['handlers'] else None,
+        'self': top(own) if kept else [],
+        'total': top(inclusive) if kept else [],
+    }
@@ -0,0 +1,40 @@
+import time
+
+
+# Token bucket: `rate` tokens per second, bursts of up to `capacity`
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    # Seconds until `cost` tokens are available (0 when they already are)
+    def wait_time(self, cost=1, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= cost:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (cost - self.tokens) / self.rate
+
+    def try_take(self, cost=1, now=None):
+        if self.wait_time(cost, now) > 0:
+            return False
+        self.tokens -= cost
+        return True
+
+    # Tokens currently available, used for admin reports
+    def available(self, now=None):
+        self._refill(time.monotonic() if now is None else now)
+        return self.tokens
+
+    # A bucket that has refilled completely carries no state worth keeping
+    def is_idle(self, now=None):
+        return self.available(now) >= self.capacity
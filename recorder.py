@@ -0,0 +1,142 @@
+import os
+import re
+import hmac
+import json
+import time
+import hashlib
+import logging
+from logging.handlers import RotatingFileHandler
+from logconfig import background_handler
+
+# Opt-in recording of incoming updates (anonymized) for replay with tools/replay.py
+RECORD_UPDATES_PATH = os.getenv("RECORD_UPDATES_PATH", "")  # Empty disables recording
+RECORD_SALT = os.getenv("RECORD_SALT", "") or os.urandom(16).hex()  # Set it to keep ids stable across restarts
+RECORD_MAX_BYTES = int(os.getenv("RECORD_MAX_BYTES", str(100 * 1024 * 1024)))
+RECORD_BACKUPS = int(os.getenv("RECORD_BACKUPS", "5"))
+
+record_logger = logging.getLogger("updates")
+record_logger.propagate = False
+_sink_ready = False
+_header_written = False
+known_names = {}  # {real username: anonymized username}
+known_ids = {}  # {real user/chat id: anonymized id}
+
+MENTION = re.compile(r'@([^\s@:]+)')
+ADD_USER = re.compile(r'^([^@]+)@(\d+)@(\d+)$')  # "<name>@<com>@<za>", as handle_new_user accepts it
+TOKEN = re.compile(r'[^\s:]+')  # Usernames are whole tokens, in any script and of any length
+PERSONAL_FIELDS = ('first_name', 'last_name', 'language_code', 'title')
+
+def _sink():
+    global _sink_ready
+    if not _sink_ready:
+        handler = RotatingFileHandler(RECORD_UPDATES_PATH, maxBytes=RECORD_MAX_BYTES, backupCount=RECORD_BACKUPS, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        record_logger.addHandler(background_handler(handler))
+        record_logger.setLevel(logging.INFO)
+        _sink_ready = True
+    return record_logger
+
+def _digest(value):
+    return hmac.new(RECORD_SALT.encode(), str(value).encode(), hashlib.sha256).hexdigest()
+
+def anon_id(value):
+    value = int(value)
+    if value not in known_ids:
+        # Keep the sign (group chats are negative) and stay within Telegram's id range
+        anonymized = int(_digest(value)[:12], 16) % 10**12 + 1
+        known_ids[value] = -anonymized if value < 0 else anonymized
+    return known_ids[value]
+
+def anon_name(name):
+    if name not in known_names:
+        known_names[name] = "u" + _digest(name.lower())[:10]
+    return known_names[name]
+
+# Replace @mentions and bare words that are known usernames (e.g. "/posthis alice"). In an
+# add-user message only the name is replaced, so it still parses as one on replay.
+def anon_text(text):
+    add_user = ADD_USER.search(text)
+    if add_user:
+        name, com, za = add_user.groups()
+        return f"{anon_name(name)}@{com}@{za}"
+    text = MENTION.sub(lambda m: m.group(0) if m.group(1).isdigit() else "@" + anon_name(m.group(1)), text)
+    if not known_names:
+        return text
+    return TOKEN.sub(lambda m: known_names.get(m.group(0), m.group(0)), text)
+
+# Callback data is ":"-separated and may carry user ids and usernames
+def anon_callback_data(data):
+    parts = data.split(':')
+    for i, part in enumerate(parts):
+        if part.isdigit() and int(part) in known_ids:
+            parts[i] = str(known_ids[int(part)])
+        elif part in known_names:
+            parts[i] = known_names[part]
+    return ":".join(parts)
+
+def _anonymize(obj):
+    if isinstance(obj, list):
+        return [_anonymize(item) for item in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if 'username' in obj:
+        anon_name(obj['username'])
+    result = {}
+    for key, value in obj.items():
+        if key in PERSONAL_FIELDS:
+            continue
+        if key == 'id' and isinstance(value, int) and ('is_bot' in obj or 'type' in obj):
+            result[key] = anon_id(value)
+        elif key in ('user_id', 'chat_id') and isinstance(value, int):
+            result[key] = anon_id(value)
+        elif key == 'username':
+            result[key] = anon_name(value)
+        elif key in ('text', 'caption') and isinstance(value, str):
+            result[key] = anon_text(value)
+        elif key == 'data' and isinstance(value, str):
+            result[key] = anon_callback_data(value)
+        else:
+            result[key] = _anonymize(value)
+    if 'is_bot' in result and 'username' in result:
+        result['first_name'] = result['username']
+    elif 'is_bot' in result:
+        result['first_name'] = "user"
+    return result
+
+def anonymize_update(update_dict):
+    # Register every sender first so ids and names inside text and callback data are mapped too
+    for key in ('message', 'edited_message', 'callback_query'):
+        sender = (update_dict.get(key) or {}).get('from')
+        if sender:
+            anon_id(sender['id'])
+            if sender.get('username'):
+                anon_name(sender['username'])
+    return _anonymize(update_dict)
+
+# Stake caps ({kind: [[key, amount]]}) keyed by username are keyed by the anonymized name;
+# number caps and the '*' defaults stay as they are
+def _anon_caps(caps):
+    return {kind: [[key if kind == "number" or key == '*' else anon_name(key), amount] for key, amount in entries]
+            for kind, entries in caps.items()}
+
+# True until the header line has been written (the caller then passes `state`)
+def header_pending():
+    return not _header_written
+
+# Append one update; `state` is the session state replay starts from, written once as the header
+def record_update(update, admin=False, state=None):
+    global _header_written
+    sink = _sink()
+    if not _header_written:
+        header = dict(state or {})
+        if header.get('admin_id') is not None:
+            header['admin_id'] = anon_id(header['admin_id'])
+        if header.get('stake_caps'):
+            header['stake_caps'] = _anon_caps(header['stake_caps'])
+        if header.get('users'):
+            # Registers every known user, so their names are replaced in text from the first update
+            header['users'] = [[anon_name(username), com, za] for username, com, za in header['users']]
+        sink.info("%s", json.dumps({'header': header}, ensure_ascii=False, separators=(',', ':'), default=str))
+        _header_written = True
+    record = {'t': round(time.time(), 3), 'admin': admin, 'update': anonymize_update(update.to_dict())}
+    sink.info("%s", json.dumps(record, ensure_ascii=False, separators=(',', ':')))
@@ -0,0 +1,39 @@
+import io
+import csv
+from tabulate import tabulate
+
+# Report formats that can be sent as a single document instead of chat messages
+DOCUMENT_FORMATS = {"csv": "csv", "txt": "txt", "file": "txt"}
+
+def document_filename(name, fmt):
+    safe = name.replace('/', '-').replace(' ', '_')
+    return f"{safe}.{fmt}"
+
+def _open():
+    buf = io.BytesIO()
+    # utf-8-sig so spreadsheet apps detect the Myanmar text correctly
+    return buf, io.TextIOWrapper(buf, encoding='utf-8-sig', newline='')
+
+def _finish(buf, out):
+    out.flush()
+    out.detach()
+    buf.seek(0)
+    return buf
+
+# Write rows one at a time straight into an in-memory CSV file
+def csv_document(header, rows):
+    buf, out = _open()
+    writer = csv.writer(out)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+    return _finish(buf, out)
+
+# Write each (title, headers, rows, footer) section as an aligned table, one section at a time
+def text_document(sections):
+    buf, out = _open()
+    for title, headers, rows, footer in sections:
+        out.write(f"{title}\n")
+        out.write(tabulate(rows, headers=headers, tablefmt="simple", disable_numparse=True))
+        out.write(f"\n{footer}\n\n")
+    return _finish(buf, out)
@@ -0,0 +1,129 @@
+import os
+import numpy as np
+from settlement import DEFAULT_COM_ZA
+
+# Outcome risk: for each of the 100 possible results, the dealer's net for the session if
+# that number wins, with every user's com/za applied and overbuys (negative amounts) netted
+# in. Books are built once from the database and then kept up to date bet by bet.
+RISK_BOOK_MAX = int(os.getenv("RISK_BOOK_MAX", "8"))  # Sessions kept in memory
+RISK_TOP_N = int(os.getenv("RISK_TOP_N", "10"))  # Worst outcomes listed in /risk
+BREAKOPT_CANDIDATES = int(os.getenv("BREAKOPT_CANDIDATES", "400"))  # Limits from 0 to the largest number total
+BREAKOPT_STEP = int(os.getenv("BREAKOPT_STEP", "100"))  # Candidate limits are multiples of this
+BREAKOPT_MAX_LOSS = int(os.getenv("BREAKOPT_MAX_LOSS", "0"))  # Worst-case loss the suggested limit may leave
+
+class RiskBook:
+    def __init__(self, date_key):
+        self.date_key = date_key
+        self.stakes = {}  # {username: int64[100]}, amount on each number
+        self.totals = {}  # {username: total amount}
+        self.rates = {}  # {username: (com, za)}
+        self.numbers = np.zeros(100, dtype=np.int64)  # Session total on each number (what /break compares)
+        self.liability = np.zeros(100, dtype=np.int64)  # Sum of za * stake on each number
+        self.after_com = 0  # Sum of every user's total after commission
+        self.bets = 0
+
+    # Book for a session from its settlement frame (settlement.build_frame)
+    @classmethod
+    def from_frame(cls, date_key, frame, com_za):
+        book = cls(date_key)
+        stakes = np.zeros((len(frame['users']), 100), dtype=np.int64)
+        np.add.at(stakes, (frame['user'], frame['number']), frame['amount'])
+        for i, username in enumerate(frame['users']):
+            book.stakes[username] = stakes[i]
+            book.totals[username] = int(stakes[i].sum())
+            book.rates[username] = com_za.get(username, DEFAULT_COM_ZA)
+            book.liability += book.rates[username][1] * stakes[i]
+            book.after_com += book._after_com(username)
+        book.numbers = stakes.sum(axis=0)
+        book.bets = len(frame['amount'])
+        return book
+
+    def _after_com(self, username):
+        return self._after_com_of(self.totals[username], self.rates[username][0])
+
+    @staticmethod
+    def _after_com_of(total, com):
+        return total - (total * com) // 100
+
+    # Apply one slip's [(number, amount)]; `rates` is needed only for users new to the book
+    def add(self, username, bets, rates=None):
+        if username not in self.stakes:
+            self.stakes[username] = np.zeros(100, dtype=np.int64)
+            self.totals[username] = 0
+            self.rates[username] = rates or DEFAULT_COM_ZA
+        self.after_com -= self._after_com(username)
+        za = self.rates[username][1]
+        row = self.stakes[username]
+        for num, amt in bets:
+            row[num] += amt
+            self.numbers[num] += amt
+            self.liability[num] += za * amt
+            self.totals[username] += amt
+        self.after_com += self._after_com(username)
+        self.bets += len(bets)
+
+    def set_rates(self, username, com, za):
+        if username not in self.stakes:
+            return
+        self.after_com -= self._after_com(username)
+        self.liability += (za - self.rates[username][1]) * self.stakes[username]
+        self.rates[username] = (com, za)
+        self.after_com += self._after_com(username)
+
+    # Dealer net for the session if each number wins (negative is a loss)
+    def outcomes(self):
+        return self.after_com - self.liability
+
+    def summary(self, top_n=RISK_TOP_N):
+        net = self.outcomes()
+        worst = np.argsort(net, kind='stable')[:top_n]
+        return {
+            'date_key': self.date_key,
+            'users': len(self.stakes),
+            'bets': self.bets,
+            'total': sum(self.totals.values()),
+            'after_com': self.after_com,
+            'net': net.tolist(),
+            'worst': [(int(num), int(net[num])) for num in worst],
+            'exposure': max(0, -int(net.min())),  # Largest loss over all outcomes
+            'losing_numbers': int((net < 0).sum()),
+        }
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self.numbers.nbytes + self.liability.nbytes + sum(row.nbytes for row in self.stakes.values())
+
+# Candidate break limits, plus any `extra` ones (e.g. the current limit)
+def candidate_limits(book, extra=(), count=BREAKOPT_CANDIDATES, step=BREAKOPT_STEP):
+    top = max(int(book.numbers.max()), 0)
+    limits = np.linspace(0, top, count) // step * step
+    return np.unique(np.concatenate([limits, [top], list(extra)])).astype(np.int64)
+
+# What each break limit would do if everything over it were overbought from `dealer` (whose
+# com/za come from the book when the dealer already has bets there, else `dealer_rates`),
+# all candidates at once: a candidates x 100 matrix of outcome nets.
+def evaluate_limits(book, limits, dealer, dealer_rates=DEFAULT_COM_ZA):
+    limits = np.asarray(limits, dtype=np.int64)
+    over = np.maximum(book.numbers[None, :] - limits[:, None], 0)
+    overbuy = over.sum(axis=1)
+
+    com, za = book.rates.get(dealer, dealer_rates)
+    existing = book.totals.get(dealer, 0)
+    after_com = RiskBook._after_com_of(existing - overbuy, com)
+    # Overbuys are negative bets under the dealer's name: the commission-adjusted intake falls,
+    # and the dealer pays back za times the overbought amount of whichever number wins
+    outcomes = book.outcomes()[None, :] + (after_com - RiskBook._after_com_of(existing, com))[:, None] + za * over
+    return {
+        'limits': limits,
+        'overbuy': overbuy,
+        'worst_loss': np.maximum(-outcomes.min(axis=1), 0),
+        'margin': outcomes.mean(axis=1),  # Expected dealer result with every number equally likely
+    }
+
+# Index of the suggested limit: best expected margin with a worst-case loss within max_loss
+# (ties go to the higher limit, which overbuys less), else the smallest worst-case loss
+def suggest_limit(result, max_loss):
+    within = np.flatnonzero(result['worst_loss'] <= max_loss)
+    if not len(within):
+        return int(np.argmin(result['worst_loss']))
+    best = result['margin'][within].max()
+    return int(within[result['margin'][within] >= best - 1e-9][-1])
@@ -0,0 +1,218 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from telegram.error import RetryAfter
+from ratelimit import TokenBucket
+
+# Telegram allows ~30 messages/s overall and ~1 message/s per chat (short bursts are tolerated)
+GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+GLOBAL_BURST = float(os.getenv("SEND_GLOBAL_BURST", "25"))
+CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+MAX_MESSAGE_LENGTH = 4096
+MAX_IDLE_BUCKETS = 1000
+
+logger = logging.getLogger(__name__)
+
+global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+chat_buckets = {}  # {chat_id: TokenBucket}
+pending = deque()  # [{'bot', 'chat_id', 'text', 'kwargs', 'futures', 'enqueued_at'}]
+send_stats = {
+    'enqueued': 0,
+    'sent': 0,
+    'coalesced': 0,
+    'failed': 0,
+    'retry_after': 0,
+    'delay_total': 0.0,
+    'delay_max': 0.0,
+    'delay_last': 0.0,
+}
+paused_until = 0.0
+_worker = None
+_wakeup = None
+
+def _chat_bucket(chat_id):
+    bucket = chat_buckets.get(chat_id)
+    if bucket is None:
+        if len(chat_buckets) >= MAX_IDLE_BUCKETS:
+            for cid in [c for c, b in chat_buckets.items() if b.is_idle()]:
+                del chat_buckets[cid]
+        bucket = chat_buckets[chat_id] = TokenBucket(CHAT_RATE, CHAT_BURST)
+    return bucket
+
+def _ensure_worker():
+    global _worker, _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    if _worker is None or _worker.done():
+        # A fresh context keeps the worker from inheriting the caller's trace
+        _worker = asyncio.get_running_loop().create_task(_run(), context=contextvars.Context())
+    _wakeup.set()
+
+# Queue a message and return a future resolving to the sent Message.
+# Plain text messages queued back-to-back for the same chat are merged into one.
+def enqueue_message(bot, chat_id, text, **kwargs):
+    future = asyncio.get_running_loop().create_future()
+    last = pending[-1] if pending else None
+    if (
+        last is not None
+        and not kwargs and not last['kwargs']
+        and last['bot'] is bot and last['chat_id'] == chat_id
+        and len(last['text']) + 1 + len(text) <= MAX_MESSAGE_LENGTH
+    ):
+        last['text'] += "\n" + text
+        last['futures'].append(future)
+        send_stats['coalesced'] += 1
+    else:
+        pending.append({
+            'bot': bot,
+            'chat_id': chat_id,
+            'text': text,
+            'kwargs': kwargs,
+            'futures': [future],
+            'enqueued_at': time.monotonic(),
+        })
+    send_stats['enqueued'] += 1
+    _ensure_worker()
+    return future
+
+async def send_message(bot, chat_id, text, **kwargs):
+    return await enqueue_message(bot, chat_id, text, **kwargs)
+
+# Oldest entry whose chat has a token, keeping per-chat order; otherwise the shortest wait
+def _next_ready(now):
+    seen = set()
+    wait = None
+    for entry in pending:
+        chat_id = entry['chat_id']
+        if chat_id in seen:
+            continue
+        seen.add(chat_id)
+        chat_wait = _chat_bucket(chat_id).wait_time(now=now)
+        if chat_wait == 0:
+            return entry, 0.0
+        wait = chat_wait if wait is None else min(wait, chat_wait)
+    return None, wait
+
+async def _sleep_or_wakeup(delay):
+    _wakeup.clear()
+    try:
+        await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+    except asyncio.TimeoutError:
+        pass
+
+async def _run():
+    global paused_until
+    while True:
+        if not pending:
+            _wakeup.clear()
+            await _wakeup.wait()
+            continue
+
+        now = time.monotonic()
+        if now < paused_until:
+            await asyncio.sleep(paused_until - now)
+            continue
+
+        entry, wait = _next_ready(now)
+        if entry is None:
+            await _sleep_or_wakeup(wait)
+            continue
+
+        global_wait = global_bucket.wait_time(now=now)
+        if global_wait > 0:
+            await asyncio.sleep(global_wait)
+            continue
+
+        global_bucket.try_take(now=now)
+        _chat_bucket(entry['chat_id']).try_take(now=now)
+        pending.remove(entry)
+
+        try:
+            message = await entry['bot'].send_message(entry['chat_id'], entry['text'], **entry['kwargs'])
+        except RetryAfter as e:
+            send_stats['retry_after'] += 1
+            logger.warning("Flood limit hit, pausing sends for %ss", e.retry_after)
+            paused_until = time.monotonic() + e.retry_after
+            pending.appendleft(entry)
+            continue
+        except Exception as e:
+            send_stats['failed'] += 1
+            logger.error("Error sending message to %s: %s", entry['chat_id'], e)
+            for future in entry['futures']:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        delay = time.monotonic() - entry['enqueued_at']
+        send_stats['sent'] += 1
+        send_stats['delay_total'] += delay
+        send_stats['delay_max'] = max(send_stats['delay_max'], delay)
+        send_stats['delay_last'] = delay
+        for future in entry['futures']:
+            if not future.done():
+                future.set_result(message)
+
+def get_send_stats():
+    stats = dict(send_stats)
+    stats['queue_depth'] = len(pending)
+    stats['queued_messages'] = sum(len(entry['futures']) for entry in pending)
+    stats['oldest_wait'] = time.monotonic() - pending[0]['enqueued_at'] if pending else 0.0
+    stats['delay_avg'] = stats['delay_total'] / stats['sent'] if stats['sent'] else 0.0
+    stats['paused_for'] = max(0.0, paused_until - time.monotonic())
+    return stats
+
+# Pack report lines greedily into messages of at most `limit` characters,
+# breaking only at line boundaries (a single oversized line is cut as a last resort)
+def iter_chunks(lines, limit=MAX_MESSAGE_LENGTH):
+    chunk = []
+    size = 0
+    for item in lines:
+        for line in item.split("\n"):
+            while len(line) > limit:
+                if chunk:
+                    yield "\n".join(chunk)
+                    chunk, size = [], 0
+                yield line[:limit]
+                line = line[limit:]
+            extra = len(line) + (1 if chunk else 0)
+            if chunk and size + extra > limit:
+                yield "\n".join(chunk)
+                chunk, size = [], 0
+                extra = len(line)
+            chunk.append(line)
+            size += extra
+    if chunk:
+        yield "\n".join(chunk)
+
+# Telegram rejects blank messages, so chunks holding only spacing lines are dropped
+def _message_chunks(lines):
+    return [chunk for chunk in iter_chunks(lines) if chunk.strip()]
+
+# Reply to `message` with the first chunk and queue the rest; extra kwargs go on the last chunk
+async def reply_lines(message, lines, **kwargs):
+    chunks = _message_chunks(lines)
+    if not chunks:
+        return
+    first = await message.reply_text(chunks[0], **(kwargs if len(chunks) == 1 else {}))
+    await _send_rest(message.get_bot(), first.chat_id, chunks[1:], kwargs)
+
+# Edit the callback query's message with the first chunk and queue the rest; the edited
+# message keeps the reply markup, so its buttons stay where they were
+async def edit_lines(query, lines, **kwargs):
+    chunks = _message_chunks(lines)
+    if not chunks:
+        return
+    await query.edit_message_text(chunks[0], **kwargs)
+    await _send_rest(query.get_bot(), query.message.chat_id, chunks[1:], {})
+
+async def _send_rest(bot, chat_id, chunks, kwargs):
+    sends = [
+        enqueue_message(bot, chat_id, chunk, **(kwargs if i == len(chunks) - 1 else {}))
+        for i, chunk in enumerate(chunks)
+    ]
+    if sends:
+        await asyncio.gather(*sends)
@@ -0,0 +1,90 @@
+import numpy as np
+
+# Settlement of one or more sessions in columnar form: bets are loaded once into NumPy arrays
+# (user index, session index, number, amount) and every user's figures come from a few
+# vectorized passes instead of a Python loop per bet and a database call per user.
+# Integer arithmetic throughout, so results match the scalar code to the kyat
+# (including floor division of commission on negative totals).
+
+DEFAULT_COM_ZA = (0, 80)  # What get_user_com_za returns for users without settings
+
+# Columnar frame from (username, date_key, number, amount) rows. Users are indexed in the
+# order they first appear, session by session in date_keys order, which is the order the
+# reports list them in.
+def build_frame(rows, date_keys):
+    if not rows:
+        return {
+            'users': [], 'date_keys': list(date_keys),
+            'user': np.zeros(0, dtype=np.int32), 'session': np.zeros(0, dtype=np.int32),
+            'number': np.zeros(0, dtype=np.int16), 'amount': np.zeros(0, dtype=np.int64),
+        }
+    usernames, row_dates, numbers, amounts = zip(*rows)
+    session_index = {date_key: i for i, date_key in enumerate(date_keys)}
+    session = np.fromiter((session_index[date_key] for date_key in row_dates), dtype=np.int32, count=len(rows))
+
+    names, inverse = np.unique(np.array(usernames, dtype=object), return_inverse=True)
+    inverse = inverse.ravel()
+    _, first = np.unique(inverse[np.argsort(session, kind='stable')], return_index=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+
+    return {
+        'users': [str(name) for name in names[order]],
+        'date_keys': list(date_keys),
+        'user': rank[inverse],
+        'session': session,
+        'number': np.array(numbers, dtype=np.int16),
+        'amount': np.array(amounts, dtype=np.int64),
+    }
+
+def _per_user(frame, values):
+    sums = np.zeros(len(frame['users']), dtype=np.int64)
+    np.add.at(sums, frame['user'], values)
+    return sums
+
+# Every user's total, power-number stake, commission, win and net. `power_numbers` maps
+# date_key to that session's power number (None when not set); `com_za` maps username to
+# (com, za). positive_only leaves out overbuys (negative amounts), as /dateall does.
+def settle(frame, power_numbers, com_za, positive_only=False):
+    amount = frame['amount']
+    if positive_only:
+        amount = np.where(amount > 0, amount, 0)
+
+    # -1 never matches a number, so sessions without a power number add no stake
+    session_power = np.array([-1 if power_numbers.get(date_key) is None else power_numbers[date_key]
+                              for date_key in frame['date_keys']], dtype=np.int16)
+    is_power = frame['number'] == session_power[frame['session']] if len(amount) else np.zeros(0, dtype=bool)
+
+    rates = [com_za.get(user, DEFAULT_COM_ZA) for user in frame['users']]
+    com = np.array([c for c, _ in rates], dtype=np.int64)
+    za = np.array([z for _, z in rates], dtype=np.int64)
+
+    total = _per_user(frame, amount)
+    power = _per_user(frame, np.where(is_power, amount, 0))
+    commission = total * com // 100
+    after_com = total - commission
+    win = power * za
+    return {
+        'users': frame['users'],
+        'total': total,
+        'power': power,
+        'com': com,
+        'za': za,
+        'commission': commission,
+        'after_com': after_com,
+        'win': win,
+        'net': after_com - win,
+    }
+
+SETTLEMENT_FIELDS = ('total', 'power', 'com', 'za', 'commission', 'after_com', 'win', 'net')
+
+# One dict of plain ints per user, in report order
+def settlement_rows(result):
+    columns = {field: result[field].tolist() for field in SETTLEMENT_FIELDS}
+    for i, username in enumerate(result['users']):
+        yield {'username': username, **{field: columns[field][i] for field in SETTLEMENT_FIELDS}}
+
+# Column sums across all users, as plain ints
+def settlement_totals(result):
+    return {field: int(result[field].sum()) for field in ('total', 'power', 'commission', 'after_com', 'win', 'net')}
@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import functools
+from collections import OrderedDict
+from datetime import datetime
+import pytz
+
+# In-memory session state is bounded: entries expire SESSION_TTL_HOURS after their session
+# started or after they were last used (whichever is later), and each store keeps at most
+# max_entries, evicting the least recently used first.
+SESSION_TTL_HOURS = float(os.getenv("SESSION_TTL_HOURS", "72"))
+SWEEP_INTERVAL = 60  # Seconds between full expiry scans of a store
+
+MYANMAR_TIMEZONE = pytz.timezone('Asia/Yangon')
+
+stores = []  # Every SessionStore, for /memstats
+
+# Start of a "dd/mm/YYYY AM|PM" session as a timestamp (AM sessions start at midnight, PM at noon)
+@functools.lru_cache(maxsize=1024)
+def session_start(date_key):
+    try:
+        day, segment = date_key.split(' ')
+        start = datetime.strptime(day, '%d/%m/%Y').replace(hour=12 if segment == "PM" else 0)
+    except (ValueError, AttributeError):
+        return None
+    return MYANMAR_TIMEZONE.localize(start).timestamp()
+
+# Approximate deep size of a container in bytes (shared objects are counted once)
+def approx_size(obj, seen=None):
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, seen) for item in obj)
+    return size
+
+class SessionStore:
+    """Dict-like store with a size cap and TTL/LRU eviction.
+
+    `session_of(key, value)` returns the entry's date key (or None when the entry
+    has no session, in which case only its last use counts).
+    """
+
+    def __init__(self, name, max_entries, session_of=None, ttl_hours=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = (SESSION_TTL_HOURS if ttl_hours is None else ttl_hours) * 3600
+        self.session_of = session_of or (lambda key, value: None)
+        self.entries = OrderedDict()  # {key: [value, born, touched]}, least recently used first
+        self.evicted = {'expired': 0, 'lru': 0}
+        self.next_sweep = 0.0
+        stores.append(self)
+
+    def _expired(self, entry, now):
+        return max(entry[1], entry[2]) + self.ttl <= now
+
+    def _sweep(self, now):
+        self.next_sweep = now + SWEEP_INTERVAL
+        expired = [key for key, entry in self.entries.items() if self._expired(entry, now)]
+        for key in expired:
+            del self.entries[key]
+        self.evicted['expired'] += len(expired)
+
+    def _lookup(self, key, touch):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        if self._expired(entry, now):
+            del self.entries[key]
+            self.evicted['expired'] += 1
+            return None
+        if touch:
+            entry[2] = now
+            self.entries.move_to_end(key)
+        return entry
+
+    def __setitem__(self, key, value):
+        now = time.time()
+        if now >= self.next_sweep:
+            self._sweep(now)
+        session = self.session_of(key, value)
+        born = (session_start(session) if session else None) or now
+        self.entries[key] = [value, born, now]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evicted['lru'] += 1
+
+    def __getitem__(self, key):
+        entry = self._lookup(key, touch=True)
+        if entry is None:
+            raise KeyError(key)
+        return entry[0]
+
+    def __contains__(self, key):
+        return self._lookup(key, touch=False) is not None
+
+    def __delitem__(self, key):
+        del self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        entry = self._lookup(key, touch=True)
+        return default if entry is None else entry[0]
+
+    def pop(self, key, default=None):
+        entry = self.entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def setdefault(self, key, default):
+        entry = self._lookup(key, touch=True)
+        if entry is None:
+            self[key] = default
+            return default
+        return entry[0]
+
+    def clear(self):
+        self.entries.clear()
+
+    def keys(self):
+        return list(self.entries.keys())
+
+    def values(self):
+        return [entry[0] for entry in self.entries.values()]
+
+    def stats(self):
+        self._sweep(time.time())
+        return {
+            'name': self.name,
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'bytes': approx_size(self.entries),
+            'expired': self.evicted['expired'],
+            'lru': self.evicted['lru'],
+        }
+
+def get_store_stats():
+    return [store.stats() for store in stores]
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import logging
+import functools
+
+# Storage backend behind database.py: "postgres" (psycopg2, PG* environment) or "sqlite"
+# (one embedded file in WAL mode, for single-node deployments, tests and benchmarks)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "bot.db")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is durable across app crashes in WAL mode
+
+logger = logging.getLogger(__name__)
+
+class PostgresBackend:
+    name = "postgres"
+
+    def connect(self):
+        import psycopg2
+        return psycopg2.connect(
+            dbname=os.getenv("PGDATABASE"),
+            user=os.getenv("PGUSER"),
+            password=os.getenv("PGPASSWORD"),
+            host=os.getenv("PGHOST"),
+            port=os.getenv("PGPORT")
+        )
+
+    # Called when a session ends; Postgres connections are not reused
+    def release(self, conn):
+        conn.close()
+
+    def cursor(self, conn, dict_rows=False):
+        if dict_rows:
+            from psycopg2.extras import DictCursor
+            return conn.cursor(cursor_factory=DictCursor)
+        return conn.cursor()
+
+    def sql(self, query):
+        return query
+
+    # Many parameter sets in a few round trips
+    def executemany(self, cur, query, rows):
+        from psycopg2.extras import execute_batch
+        execute_batch(cur, query, rows, page_size=500)
+
+    # Rows of a large read, `size` at a time, through a server-side cursor on its own
+    # connection so memory stays flat and it can run off the event loop thread
+    def stream(self, query, params, size):
+        conn = self.connect()
+        try:
+            cur = conn.cursor(name="stream")
+            cur.itersize = size
+            cur.execute(query, params)
+            while rows := cur.fetchmany(size):
+                yield rows
+            cur.close()
+        finally:
+            conn.close()
+
+    def explain(self, conn, query, params):
+        cur = conn.cursor()
+        try:
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+            return "\n".join(row[0] for row in cur.fetchall())
+        finally:
+            cur.close()
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.conn = None
+
+    # One connection for the whole process: the bot runs every query on the event loop thread
+    def connect(self):
+        if self.conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self.conn = conn
+            logger.info("Using SQLite storage at %s", self.path)
+        return self.conn
+
+    # Sessions that end without committing must not leave their writes in the shared connection
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+
+    def cursor(self, conn, dict_rows=False):
+        cur = conn.cursor()
+        if dict_rows:
+            cur.row_factory = sqlite3.Row
+        return cur
+
+    # Queries are written for Postgres; translate the few differences once per statement
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def sql(query):
+        query = query.replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+        return query.replace("%s", "?")
+
+    def executemany(self, cur, query, rows):
+        cur.executemany(self.sql(query), rows)
+
+    # A separate read connection: WAL lets it read a consistent snapshot while the bot writes
+    def stream(self, query, params, size):
+        conn = sqlite3.connect(self.path)
+        try:
+            cur = conn.execute(self.sql(query), params)
+            while rows := cur.fetchmany(size):
+                yield rows
+        finally:
+            conn.close()
+
+    def explain(self, conn, query, params):
+        cur = conn.cursor()
+        try:
+            cur.execute("EXPLAIN QUERY PLAN " + self.sql(query), params if params is not None else ())
+            return "\n".join(row[-1] for row in cur.fetchall())
+        finally:
+            cur.close()
+
+BACKENDS = {"postgres": PostgresBackend, "sqlite": SQLiteBackend}
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if STORAGE_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+        _backend = BACKENDS[STORAGE_BACKEND]()
+    return _backend
+
+# Switch backends at runtime (tools and benchmarks); returns the new backend
+def use_backend(name, **options):
+    global _backend
+    _backend = BACKENDS[name](**options)
+    return _backend
@@ -0,0 +1,132 @@
+# Time every database.py function, plus the ledger and settlement aggregations bot.py builds
+# on them, against synthetic history of increasing size (PG* environment; tables are emptied).
+#
+#   python tools/bench_db.py --sizes 10000,1000000,10000000 --repeat 5 --json db.json
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+from statistics import median
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import database
+from gen_history import generate
+
+SCRATCH_DATE_KEY = "01/01/2000 AM"  # Session created and deleted by the write benchmarks
+
+# bot.py's /ledger: one session's bets, summed per number
+async def ledger(date_key):
+    totals = {}
+    for bet in await database.get_user_bets(date_key=date_key):
+        totals[bet['number']] = totals.get(bet['number'], 0) + bet['amount']
+    return totals
+
+# bot.py's /dateall view: every bet of the selected sessions, settled per user with com/za
+async def settlement(date_keys):
+    reports = {}
+    for date_key in date_keys:
+        bets = await database.get_user_bets(date_key=date_key)
+        pnum = await database.get_power_number(date_key)
+        for bet in bets:
+            report = reports.get(bet['username'])
+            if report is None:
+                com, za = await database.get_user_com_za(bet['username'])
+                report = reports[bet['username']] = {'total': 0, 'power': 0, 'com': com, 'za': za}
+            if bet['amount'] > 0:
+                report['total'] += bet['amount']
+                if bet['number'] == pnum:
+                    report['power'] += bet['amount']
+    return {name: r['total'] - r['total'] * r['com'] // 100 - r['power'] * r['za'] for name, r in reports.items()}
+
+async def fill_scratch_session(rows, username):
+    for i in range(rows):
+        await database.save_user_bet(username, SCRATCH_DATE_KEY, i % 100, 100)
+
+def cases(summary, rng, args):
+    sessions, users = summary['sessions'], summary['users']
+    latest, busiest_user = sessions[-1], users[0]
+    return [
+        ("get_user_bets(date_key)", lambda: database.get_user_bets(date_key=rng.choice(sessions))),
+        ("get_user_bets(username, date_key)", lambda: database.get_user_bets(username=rng.choice(users), date_key=latest)),
+        ("get_user_bets(username)", lambda: database.get_user_bets(username=busiest_user)),
+        ("get_available_dates", database.get_available_dates),
+        ("get_break_limit", lambda: database.get_break_limit(rng.choice(sessions))),
+        ("get_power_number", lambda: database.get_power_number(rng.choice(sessions))),
+        ("get_user_com_za", lambda: database.get_user_com_za(rng.choice(users))),
+        ("get_all_users", database.get_all_users),
+        ("save_user_bet", lambda: database.save_user_bet(busiest_user, SCRATCH_DATE_KEY, rng.randrange(100), 100)),
+        ("delete_user_bet", lambda: database.delete_user_bet(busiest_user, SCRATCH_DATE_KEY, rng.randrange(100), 100)),
+        ("save_break_limit", lambda: database.save_break_limit(SCRATCH_DATE_KEY, 100000)),
+        ("save_power_number", lambda: database.save_power_number(SCRATCH_DATE_KEY, rng.randrange(100))),
+        ("save_user_com_za", lambda: database.save_user_com_za(busiest_user, 10, 80)),
+        ("ledger (latest session)", lambda: ledger(latest)),
+        (f"settlement ({args.settle_sessions} sessions)", lambda: settlement(sessions[-args.settle_sessions:])),
+    ]
+
+async def time_call(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        await call()
+        timings.append((perf_counter() - start) * 1000)
+    timings.sort()
+    return {'median_ms': median(timings), 'max_ms': timings[-1]}
+
+async def bench_size(rows, args):
+    start = perf_counter()
+    summary = generate(rows, args.days, args.users, args.seed, clear=True)
+    load_s = perf_counter() - start
+    print(f"\n== {rows:,} rows ({len(summary['sessions'])} sessions, {args.users} users), loaded in {load_s:.1f}s", flush=True)
+
+    rng = random.Random(args.seed)
+    database.reset_query_stats()
+    results = {}
+    for name, call in cases(summary, rng, args):
+        results[name] = await time_call(call, args.repeat)
+        print(f"{name:<40}{results[name]['median_ms']:>12.2f} ms{results[name]['max_ms']:>12.2f} ms max", flush=True)
+
+    # delete_date_data on a scratch session of typical size (it runs once; the session is gone after)
+    await fill_scratch_session(min(rows // len(summary['sessions']), args.scratch_rows), summary['users'][1])
+    results["delete_date_data"] = await time_call(lambda: database.delete_date_data(SCRATCH_DATE_KEY), 1)
+    print(f"{'delete_date_data':<40}{results['delete_date_data']['median_ms']:>12.2f} ms", flush=True)
+
+    statements = [
+        {'function': function, 'statement': statement, **stats}
+        for (function, statement), stats in database.get_query_stats()[:args.top]
+    ]
+    return {'rows': rows, 'load_seconds': load_s, 'functions': results, 'statements': statements}
+
+def print_summary(all_results):
+    names = list(all_results[0]['functions'])
+    header = "".join(f"{result['rows']:>14,}" for result in all_results)
+    print(f"\nMedian ms by table size\n{'':<40}{header}")
+    for name in names:
+        cells = "".join(f"{result['functions'][name]['median_ms']:>14.2f}" for result in all_results)
+        print(f"{name:<40}{cells}")
+
+async def main(args):
+    all_results = []
+    for rows in args.sizes:
+        all_results.append(await bench_size(rows, args))
+    print_summary(all_results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as out:
+            json.dump(all_results, out, indent=2, default=str)
+        print(f"\nResults written to {args.json}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="database.py benchmark at increasing history sizes")
+    parser.add_argument("--sizes", type=lambda text: [int(v) for v in text.split(',')], default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls per function")
+    parser.add_argument("--settle-sessions", type=int, default=14, help="Sessions in the settlement aggregation")
+    parser.add_argument("--scratch-rows", type=int, default=5000, help="Most rows in the session delete_date_data removes")
+    parser.add_argument("--top", type=int, default=10, help="Slowest statements to keep per size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the results to this file")
+    asyncio.run(main(parser.parse_args()))
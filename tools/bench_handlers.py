@@ -0,0 +1,179 @@
+# Push synthetic updates (slips, deletes, ledger queries, overbuy toggles) through bot.py's
+# handlers with a stubbed Bot API, and report throughput and per-handler latency percentiles.
+#
+#   python tools/bench_handlers.py --updates 5000 --users 10,100 --session 0,20000
+#   python tools/bench_handlers.py --storage postgres   # uses PG* env, bets go to BENCH_DATE_KEY
+import json
+import random
+import asyncio
+import argparse
+from time import perf_counter
+
+from harness import (
+    StubRequest, MemoryStorage, install_storage, prepare_bot, message_update, callback_update,
+    percentile, ADMIN_ID, BENCH_DATE_KEY,
+)
+import bot
+import database
+from storage import use_backend
+import metrics
+
+SLIP_LINES = [
+    "12 34 56 1000",
+    "07-500",
+    "25r1000",
+    "18r500 300",
+    "45/54/67 200",
+    "ထိပ်5 200",
+    "ပိတ်3 300",
+    "အပူး 500",
+    "123အခွေ 100",
+]
+
+# Share of each kind of update in the workload
+DEFAULT_MIX = {"slip": 0.80, "delete": 0.08, "ledger": 0.04, "overbuy": 0.08}
+
+def parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, text.split(',')):
+        kind, share = part.split('=')
+        if kind not in mix:
+            raise SystemExit(f"Unknown update kind: {kind}")
+        mix[kind] = float(share)
+    return mix
+
+def random_slip(rng, max_lines):
+    return "\n".join(rng.choice(SLIP_LINES) for _ in range(rng.randint(1, max_lines)))
+
+async def seed_session(storage_module, users, bets, rng):
+    for i in range(bets):
+        await storage_module.save_user_bet(f"user{10000 + i % users}", BENCH_DATE_KEY, rng.randrange(100), rng.choice((100, 200, 500, 1000)))
+
+# Yield the updates of one run; deletes pick slips the bot has already confirmed
+def workload(app, rng, count, users, mix, max_lines):
+    kinds, weights = zip(*mix.items())
+    user_ids = [10000 + i for i in range(users)]
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "delete" and len(bot.message_store):
+            user_id, message_id = rng.choice(list(bot.message_store.entries))
+            username = bot.message_store.entries[(user_id, message_id)][0][4]
+            suffix = f"{user_id}:{message_id}:{BENCH_DATE_KEY}:{username}"
+            yield kind, [callback_update(app.bot, ADMIN_ID, f"delete:{suffix}"),
+                         callback_update(app.bot, ADMIN_ID, f"confirm_delete:{suffix}")]
+        elif kind == "ledger":
+            yield kind, [message_update(app.bot, ADMIN_ID, "/ledger")]
+        elif kind == "overbuy":
+            updates = [message_update(app.bot, ADMIN_ID, f"/overbuy user{rng.choice(user_ids)}")]
+            updates += [callback_update(app.bot, ADMIN_ID, f"overbuy_select:{rng.randrange(100)}") for _ in range(3)]
+            yield kind, updates
+        else:
+            yield "slip", [message_update(app.bot, rng.choice(user_ids), random_slip(rng, max_lines))]
+
+async def run_once(app, storage, args, users, session_bets):
+    rng = random.Random(args.seed)
+    storage_module = storage or database
+    if storage:
+        storage.reset()
+    else:
+        await database.delete_date_data(BENCH_DATE_KEY)
+    prepare_bot(bot)
+    await storage_module.save_break_limit(BENCH_DATE_KEY, args.break_limit)
+    await seed_session(storage_module, users, session_bets, rng)
+
+    samples = metrics.collect_samples()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    sent = 0
+
+    async def feed(updates):
+        async with semaphore:
+            for update in updates:
+                await app.process_update(update)
+
+    start = perf_counter()
+    pending = set()
+    for kind, updates in workload(app, rng, args.updates, users, parse_mix(args.mix), args.max_lines):
+        sent += len(updates)
+        pending.add(asyncio.ensure_future(feed(updates)))
+        if len(pending) >= args.concurrency:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    if pending:
+        await asyncio.wait(pending)
+    if bot.ingest_queue is not None:
+        await bot.ingest_queue.join()
+    elapsed = perf_counter() - start
+
+    handlers = {}
+    for name, values in samples.items():
+        values.sort()
+        handlers[name] = {
+            'count': len(values),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000,
+        }
+    if not storage:
+        await database.delete_date_data(BENCH_DATE_KEY)
+    return {
+        'users': users,
+        'session_bets': session_bets,
+        'updates': sent,
+        'seconds': elapsed,
+        'updates_per_second': sent / elapsed if elapsed else 0.0,
+        'handlers': handlers,
+    }
+
+def print_result(result):
+    print(f"\n== users={result['users']} session_bets={result['session_bets']}: "
+          f"{result['updates']} updates in {result['seconds']:.2f}s ({result['updates_per_second']:.0f}/s)")
+    print(f"{'handler':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in sorted(result['handlers'].items(), key=lambda item: -item[1]['p99_ms']):
+        print(f"{name:<24}{stats['count']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+
+async def main(args):
+    storage = None
+    if args.storage == "memory":
+        storage = MemoryStorage()
+        install_storage(bot, storage)
+    else:
+        if args.storage == "sqlite":
+            use_backend("sqlite", path=args.sqlite_path)
+        database.init_db()
+
+    app = bot.build_application(token="0:bench", request=StubRequest(args.api_latency / 1000))
+    await app.initialize()
+    results = []
+    try:
+        for users in args.users:
+            for session_bets in args.session:
+                result = await run_once(app, storage, args, users, session_bets)
+                print_result(result)
+                results.append(result)
+    finally:
+        await app.shutdown()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as out:
+            json.dump(results, out, indent=2)
+        print(f"\nResults written to {args.json}")
+
+def int_list(text):
+    return [int(value) for value in text.split(',')]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process handler throughput benchmark")
+    parser.add_argument("--updates", type=int, default=2000, help="Workload items per run (a delete or overbuy item is several updates)")
+    parser.add_argument("--users", type=int_list, default=[10, 100], help="Comma-separated user counts")
+    parser.add_argument("--session", type=int_list, default=[0, 10000], help="Comma-separated bets pre-loaded into the session")
+    parser.add_argument("--mix", default="", help="Workload shares, e.g. slip=0.7,delete=0.1,ledger=0.1,overbuy=0.1")
+    parser.add_argument("--max-lines", type=int, default=5, help="Most lines in one slip")
+    parser.add_argument("--concurrency", type=int, default=1, help="Workload items processed at once")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Simulated Bot API latency in ms")
+    parser.add_argument("--break-limit", type=int, default=5000, help="Break limit for the session (drives overbuy)")
+    parser.add_argument("--storage", choices=("memory", "sqlite", "postgres"), default="memory")
+    parser.add_argument("--sqlite-path", default="bench.db", help="Database file for --storage sqlite")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the results to this file")
+    asyncio.run(main(parser.parse_args()))
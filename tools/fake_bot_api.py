@@ -0,0 +1,184 @@
+# Local stand-in for the Telegram Bot API, for soak tests without network access.
+# Serves /bot<token>/<method> over plain HTTP: getMe, getUpdates (long polling), setWebhook /
+# deleteWebhook (updates are then POSTed to the webhook), sendMessage, sendDocument,
+# editMessageText, editMessageReplyMarkup, answerCallbackQuery and deleteMessage.
+import re
+import json
+import time
+import random
+import asyncio
+import itertools
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+OUTGOING_METHODS = ("sendMessage", "sendDocument", "editMessageText", "editMessageReplyMarkup")
+
+class FakeBotAPI:
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None):
+        self.latency = latency  # Seconds added to every response
+        self.error_rate = error_rate  # Share of outgoing calls answered with a 429 flood wait
+        self.random = random.Random(seed)
+        self.server = None
+        self.port = None
+        self.updates = []  # Pending updates for getUpdates
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.new_update = asyncio.Event()
+        self.webhook_url = None
+        self.deliveries = set()  # Webhook POSTs in flight
+        self.closing = False
+        self.waiters = {}  # {chat_id: [future]} resolved by the next outgoing message to that chat
+        self.stats = {'calls': {}, 'errors': 0, 'flood_waits': 0, 'webhook_failures': 0}
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._serve, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        # Answer pending long polls and let webhook deliveries finish before closing
+        self.closing = True
+        self.new_update.set()
+        if self.deliveries:
+            await asyncio.wait(self.deliveries, timeout=5)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    # Queue an update (a dict without update_id) for the bot
+    def push_update(self, update):
+        update = {"update_id": next(self.update_ids), **update}
+        if self.webhook_url:
+            task = asyncio.ensure_future(self._deliver(update))
+            self.deliveries.add(task)
+            task.add_done_callback(self.deliveries.discard)
+        else:
+            self.updates.append(update)
+            self.new_update.set()
+        return update
+
+    # Future resolved with (method, params) by the bot's next outgoing message to `chat_id`
+    def wait_for_reply(self, chat_id):
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(int(chat_id), []).append(future)
+        return future
+
+    async def _deliver(self, update):
+        url = urlsplit(self.webhook_url)
+        body = json.dumps(update).encode()
+        try:
+            reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+            writer.write(
+                f"POST {url.path or '/'} HTTP/1.1\r\nHost: {url.netloc}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            status = await reader.readline()
+            writer.close()
+            if b" 200 " not in status:
+                self.stats['webhook_failures'] += 1
+        except OSError:
+            self.stats['webhook_failures'] += 1
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                path = request_line.decode('latin-1').split()[1]
+                status, payload = await self._handle(path, headers.get('content-type', ''), body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _params(self, content_type, body):
+        if content_type.startswith('multipart/form-data'):
+            fields = re.findall(rb'name="([^"]+)"\r\n\r\n(.*?)\r\n--', body, re.S)
+            return {name.decode(): value.decode('utf-8', 'replace') for name, value in fields}
+        if content_type.startswith('application/json'):
+            return json.loads(body or b'{}')
+        return dict(parse_qsl(body.decode('utf-8')))
+
+    async def _handle(self, path, content_type, body):
+        method = path.rsplit('/', 1)[-1].split('?')[0]
+        self.stats['calls'][method] = self.stats['calls'].get(method, 0) + 1
+        params = self._params(content_type, body)
+
+        if method == "getUpdates":
+            return "200 OK", {"ok": True, "result": await self._get_updates(params)}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method in OUTGOING_METHODS and self.error_rate and self.random.random() < self.error_rate:
+            self.stats['flood_waits'] += 1
+            return "429 Too Many Requests", {"ok": False, "error_code": 429,
+                                             "description": "Too Many Requests: retry after 1",
+                                             "parameters": {"retry_after": 1}}
+        try:
+            result = self._result(method, params)
+        except (KeyError, ValueError) as e:
+            self.stats['errors'] += 1
+            return "400 Bad Request", {"ok": False, "error_code": 400, "description": f"Bad Request: {e}"}
+        return "200 OK", {"ok": True, "result": result}
+
+    async def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates and not self.closing:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit') or 100)
+        return self.updates[:limit]
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method == "setWebhook":
+            self.webhook_url = params['url']
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url or "", "has_custom_certificate": False, "pending_update_count": len(self.updates)}
+        if method in OUTGOING_METHODS:
+            chat_id = int(params['chat_id'])
+            message = {
+                "message_id": int(params.get('message_id') or next(self.message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get('text', ''),
+            }
+            waiters = self.waiters.get(chat_id)
+            if waiters:
+                future = waiters.pop(0)
+                if not future.done():
+                    future.set_result((method, params))
+            return message
+        return True
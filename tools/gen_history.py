@@ -0,0 +1,116 @@
+# Fill the database pointed to by the PG* environment with synthetic betting history:
+# AM/PM sessions over `--days` days, `--users` agents and `--rows` user_data rows, loaded
+# with COPY. Amounts, numbers and agent activity are skewed like real traffic.
+#
+#   python tools/gen_history.py --rows 1000000 --days 180 --users 300 --truncate
+import os
+import sys
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import get_db_connection, init_db
+
+AMOUNTS = (100, 200, 300, 500, 1000, 2000, 5000, 10000)
+AMOUNT_WEIGHTS = (30, 20, 10, 20, 12, 5, 2, 1)
+HOT_NUMBERS = (0, 11, 22, 33, 44, 55, 66, 77, 88, 99, 12, 21, 25, 52)
+
+def session_keys(days, end_date):
+    keys = []
+    for offset in range(days - 1, -1, -1):
+        day = (end_date - timedelta(days=offset)).strftime('%d/%m/%Y')
+        keys += [(f"{day} AM", end_date - timedelta(days=offset), 9), (f"{day} PM", end_date - timedelta(days=offset), 13)]
+    return keys
+
+def usernames(users):
+    return [f"agent{i:04d}" for i in range(users)]
+
+# File-like CSV stream of user_data rows for COPY, generated on demand
+class RowStream:
+    def __init__(self, rng, rows, sessions, names):
+        self.rng = rng
+        self.rows = rows
+        self.sessions = sessions
+        self.names = names
+        # A few agents carry most of the volume
+        self.name_weights = [1 / (i + 1) ** 0.8 for i in range(len(names))]
+        self.number_weights = [4 if n in HOT_NUMBERS else 1 for n in range(100)]
+        self.buffer = ""
+        self.made = 0
+
+    def _batch(self, count):
+        rng = self.rng
+        per_session = max(1, self.rows // len(self.sessions))
+        names = rng.choices(self.names, self.name_weights, k=count)
+        numbers = rng.choices(range(100), self.number_weights, k=count)
+        amounts = rng.choices(AMOUNTS, AMOUNT_WEIGHTS, k=count)
+        lines = []
+        for i in range(count):
+            index = min(len(self.sessions) - 1, (self.made + i) // per_session)
+            date_key, day, hour = self.sessions[index]
+            created = day.replace(hour=hour) + timedelta(seconds=rng.randrange(3 * 3600))
+            lines.append(f"{names[i]},{date_key},{numbers[i]},{amounts[i]},{created:%Y-%m-%d %H:%M:%S}\n")
+        self.made += count
+        return "".join(lines)
+
+    def read(self, size=-1):
+        size = 65536 if size is None or size < 0 else size
+        while len(self.buffer) < size and self.made < self.rows:
+            self.buffer += self._batch(min(10000, self.rows - self.made))
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+def truncate(conn):
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE user_data, break_limits, pnumber_per_date, all_data RESTART IDENTITY")
+    conn.commit()
+
+# Load `rows` bets plus break limits, power numbers and com/za for every session and agent
+def generate(rows, days=180, users=300, seed=1, end_date=None, clear=False):
+    rng = random.Random(seed)
+    end_date = end_date or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    sessions = session_keys(days, end_date)
+    names = usernames(users)
+
+    init_db()
+    conn = get_db_connection()
+    try:
+        if clear:
+            truncate(conn)
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                "COPY user_data (username, date_key, number, amount, created_at) FROM STDIN WITH (FORMAT csv)",
+                RowStream(rng, rows, sessions, names),
+            )
+            cur.executemany(
+                "INSERT INTO break_limits (date_key, limit_amount) VALUES (%s, %s) ON CONFLICT (date_key) DO NOTHING",
+                [(key, rng.choice((50000, 100000, 200000))) for key, _, _ in sessions],
+            )
+            cur.executemany(
+                "INSERT INTO pnumber_per_date (date_key, power_number) VALUES (%s, %s) ON CONFLICT (date_key) DO NOTHING",
+                [(key, rng.randrange(100)) for key, _, _ in sessions[:-1]],  # The latest session is still open
+            )
+            cur.executemany(
+                "INSERT INTO all_data (username, com, za) VALUES (%s, %s, %s) ON CONFLICT (username) DO NOTHING",
+                [(name, rng.choice((0, 5, 10, 15)), rng.choice((80, 85, 90))) for name in names],
+            )
+            cur.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return {'sessions': [key for key, _, _ in sessions], 'users': names}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic betting history with COPY")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="user_data rows to add")
+    parser.add_argument("--days", type=int, default=180, help="Days of AM/PM sessions, ending today")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--truncate", action="store_true", help="Empty all tables first")
+    args = parser.parse_args()
+    start = datetime.now()
+    summary = generate(args.rows, args.days, args.users, args.seed, clear=args.truncate)
+    print(f"Loaded {args.rows} rows over {len(summary['sessions'])} sessions and {args.users} users "
+          f"in {(datetime.now() - start).total_seconds():.1f}s")
@@ -0,0 +1,226 @@
+# Shared pieces for driving bot.py in-process: a fake Bot API transport, an in-memory
+# storage backend with the same functions as database.py, and synthetic update builders.
+import os
+import sys
+import json
+import time
+import asyncio
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Keep limits and logging from shaping the measurement; set before bot.py is imported
+for name, value in {
+    "INGEST_USER_RATE": "1000000",
+    "INGEST_USER_BURST": "1000000",
+    "INGEST_QUEUE_SIZE": "1000000",
+    "SEND_GLOBAL_RATE": "1000000",
+    "SEND_GLOBAL_BURST": "1000000",
+    "SEND_CHAT_RATE": "1000000",
+    "SEND_CHAT_BURST": "1000000",
+    "LOG_LEVEL": "WARNING",
+}.items():
+    os.environ.setdefault(name, value)
+
+from telegram import Update
+from telegram.request import BaseRequest
+from database import session_order
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+ADMIN_ID = 1000
+BENCH_DATE_KEY = "01/01/2000 AM"  # Kept apart from real sessions when running against Postgres
+
+STORAGE_FUNCTIONS = (
+    "init_db", "save_user_bet", "get_user_bets", "delete_user_bet",
+    "save_break_limit", "get_break_limit", "save_power_number", "get_power_number", "get_power_numbers",
+    "get_user_history_page", "get_session_bets", "get_users_com_za",
+    "save_user_com_za", "get_user_com_za", "get_all_users",
+    "get_available_dates", "delete_date_data",
+)
+
+# Bot API transport that answers every call locally, after `latency` seconds
+class StubRequest(BaseRequest):
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.message_ids = itertools.count(1_000_000)
+        self.calls = {}  # {method: count}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = request_data.parameters if request_data else {}
+        await asyncio.sleep(self.latency)
+        return 200, json.dumps({"ok": True, "result": self.result(api_method, params)}).encode()
+
+    def result(self, api_method, params):
+        if api_method == "getMe":
+            return BOT_USER
+        if api_method in ("sendMessage", "sendDocument", "editMessageText") and "chat_id" in params:
+            message_id = params.get("message_id") or next(self.message_ids)
+            return {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params["chat_id"]), "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
+
+# In-memory stand-in for database.py (same function names, arguments and return shapes)
+class MemoryStorage:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.bets = []  # [{'id', 'username', 'date_key', 'number', 'amount'}]
+        self.break_limits = {}
+        self.power_numbers = {}
+        self.com_za = {}
+        self.next_id = itertools.count(1)
+
+    def init_db(self):
+        pass
+
+    async def save_user_bet(self, username, date_key, number, amount):
+        self.bets.append({'id': next(self.next_id), 'username': username, 'date_key': date_key,
+                          'number': number, 'amount': amount})
+
+    async def get_user_bets(self, username=None, date_key=None):
+        return [dict(bet) for bet in self.bets
+                if (not username or bet['username'] == username) and (not date_key or bet['date_key'] == date_key)]
+
+    async def delete_user_bet(self, username, date_key, number, amount):
+        before = len(self.bets)
+        self.bets = [bet for bet in self.bets
+                     if (bet['username'], bet['date_key'], bet['number'], bet['amount']) != (username, date_key, number, amount)]
+        return len(self.bets) < before
+
+    async def save_break_limit(self, date_key, limit_amount):
+        self.break_limits[date_key] = limit_amount
+
+    async def get_break_limit(self, date_key):
+        return self.break_limits.get(date_key)
+
+    async def save_power_number(self, date_key, power_number):
+        self.power_numbers[date_key] = power_number
+
+    async def get_power_number(self, date_key):
+        return self.power_numbers.get(date_key)
+
+    async def get_power_numbers(self, date_keys):
+        return {date_key: self.power_numbers[date_key] for date_key in date_keys if date_key in self.power_numbers}
+
+    async def get_session_bets(self, date_keys):
+        return [(bet['username'], bet['date_key'], bet['number'], bet['amount'])
+                for bet in self.bets if bet['date_key'] in date_keys]
+
+    async def get_user_history_page(self, username, before=None, after=None, limit=3):
+        sessions = sorted({bet['date_key'] for bet in self.bets if bet['username'] == username}, key=session_order, reverse=True)
+        if after is not None:
+            sessions = [d for d in reversed(sessions) if session_order(d) > after]
+        elif before is not None:
+            sessions = [d for d in sessions if session_order(d) < before]
+        page = sessions[:limit]
+        if after is not None:
+            page.reverse()
+        result = []
+        for date_key in page:
+            numbers = {}
+            for bet in self.bets:
+                if bet['username'] == username and bet['date_key'] == date_key:
+                    numbers[bet['number']] = numbers.get(bet['number'], 0) + bet['amount']
+            result.append((date_key, sorted(numbers.items())))
+        return {'sessions': result, 'more': len(sessions) > limit}
+
+    async def save_user_com_za(self, username, com, za):
+        self.com_za[username] = (com, za)
+
+    async def get_user_com_za(self, username):
+        return self.com_za.get(username, (0, 80))
+
+    async def get_users_com_za(self, usernames):
+        return {username: self.com_za[username] for username in usernames if username in self.com_za}
+
+    async def get_all_users(self):
+        return list(self.com_za)
+
+    async def get_available_dates(self):
+        dates = {bet['date_key'] for bet in self.bets} | set(self.break_limits) | set(self.power_numbers)
+        return sorted(dates, reverse=True)
+
+    async def delete_date_data(self, date_key):
+        self.bets = [bet for bet in self.bets if bet['date_key'] != date_key]
+        self.break_limits.pop(date_key, None)
+        self.power_numbers.pop(date_key, None)
+        return True
+
+# Point bot.py's storage functions at `storage` (bot.py imports them by name)
+def install_storage(bot_module, storage):
+    for name in STORAGE_FUNCTIONS:
+        setattr(bot_module, name, getattr(storage, name))
+
+# Open BENCH_DATE_KEY for betting with ADMIN_ID as admin, and start from empty session state
+def prepare_bot(bot_module):
+    bot_module.admin_id = ADMIN_ID
+    bot_module.get_current_date_key = lambda: BENCH_DATE_KEY
+    bot_module.current_working_date = BENCH_DATE_KEY
+    bot_module.date_control.clear()
+    bot_module.date_control[BENCH_DATE_KEY] = True
+    bot_module.closed_numbers = set()
+    bot_module.stake_caps.clear()
+    for store in (bot_module.message_store, bot_module.overbuy_list, bot_module.overbuy_selections,
+                  bot_module.selection_store, bot_module.risk_books, bot_module.break_limit_cache,
+                  bot_module.power_number_cache, bot_module.live_ledger.messages):
+        store.clear()
+    bot_module.ingest_buckets.clear()
+
+def user_dict(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"}
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+def message_data(user_id, text):
+    data = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user_dict(user_id),
+        "text": text,
+    }
+    if text.startswith('/'):
+        data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return data
+
+def message_update(bot, user_id, text):
+    return Update.de_json({"update_id": next(_update_ids), "message": message_data(user_id, text)}, bot)
+
+def callback_update(bot, user_id, data, chat_id=None):
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": chat_id or user_id, "type": "private"},
+        "from": BOT_USER,
+        "text": "...",
+    }
+    return Update.de_json({
+        "update_id": next(_update_ids),
+        "callback_query": {"id": str(next(_update_ids)), "from": user_dict(user_id),
+                           "chat_instance": "bench", "data": data, "message": message},
+    }, bot)
+
+# Nearest-rank percentile of an already sorted list
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
@@ -0,0 +1,193 @@
+# Replay a recorded update stream (RECORD_UPDATES_PATH, see recorder.py) through bot.py's
+# handlers against a scratch database, then write the resulting ledger and handler timings
+# and diff them against an earlier run.
+#
+#   python tools/replay.py updates.jsonl --speed 0 --out before.json
+#   python tools/replay.py updates.jsonl --speed 10 --out after.json --baseline before.json
+import json
+import asyncio
+import argparse
+from datetime import datetime
+from time import perf_counter, monotonic
+
+from harness import StubRequest, MemoryStorage, install_storage, percentile
+from telegram import Update
+import bot
+import database
+from storage import use_backend
+import metrics
+
+def read_log(paths):
+    header, records = {}, []
+    for path in paths:
+        with open(path, encoding='utf-8') as log:
+            for line in log:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if 'header' in entry:
+                    header = header or entry['header']
+                else:
+                    records.append(entry)
+    return header, records
+
+def date_key_at(timestamp):
+    moment = datetime.fromtimestamp(timestamp, bot.MYANMAR_TIMEZONE)
+    return f"{moment.strftime('%d/%m/%Y')} {'AM' if moment.hour < 12 else 'PM'}"
+
+async def restore_state(header, records):
+    admin_id = header.get('admin_id')
+    if admin_id is None:
+        first_admin = next((r for r in records if r.get('admin')), None)
+        if first_admin:
+            update = first_admin['update']
+            sender = (update.get('message') or update.get('callback_query') or {}).get('from', {})
+            admin_id = sender.get('id')
+    bot.admin_id = admin_id
+    bot.date_control.clear()
+    bot.date_control.update(header.get('date_control') or {})
+    bot.closed_numbers = set(header.get('closed_numbers') or [])
+    bot.stake_caps.clear()
+    for kind, entries in (header.get('stake_caps') or {}).items():
+        for key, amount in entries:
+            bot.stake_caps.set(kind, key, amount)
+    bot.current_working_date = header.get('current_working_date')
+    for store in (bot.message_store, bot.overbuy_list, bot.overbuy_selections, bot.selection_store,
+                  bot.risk_books, bot.break_limit_cache, bot.power_number_cache, bot.live_ledger.messages):
+        store.clear()
+    # Users that existed before the recording started (those added during it are replayed)
+    for username, com, za in header.get('users') or []:
+        await bot.save_user_com_za(username, com, za)
+
+async def replay(app, records, speed):
+    clock = {'t': records[0]['t'] if records else 0.0}
+    bot.get_current_date_key = lambda: date_key_at(clock['t'])
+
+    first_t = clock['t']
+    started = monotonic()
+    max_lag = 0.0
+    for record in records:
+        if speed > 0:
+            due = started + (record['t'] - first_t) / speed
+            delay = due - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        # Slips are processed by the ingest worker; let it catch up before the session changes
+        if date_key_at(record['t']) != date_key_at(clock['t']) and bot.ingest_queue is not None:
+            await bot.ingest_queue.join()
+        clock['t'] = record['t']
+        await app.process_update(Update.de_json(record['update'], app.bot))
+    if bot.ingest_queue is not None:
+        await bot.ingest_queue.join()
+    return max_lag
+
+async def collect_ledger(storage_module):
+    ledger = {}
+    for bet in await storage_module.get_user_bets():
+        numbers = ledger.setdefault(bet['date_key'], {}).setdefault(bet['username'], {})
+        key = f"{bet['number']:02d}"
+        numbers[key] = numbers.get(key, 0) + bet['amount']
+    return ledger
+
+def timing_summary(samples):
+    summary = {}
+    for name, values in samples.items():
+        values.sort()
+        summary[name] = {
+            'count': len(values),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+        }
+    return summary
+
+def diff_ledgers(old, new):
+    lines = []
+    for date_key in sorted(set(old) | set(new)):
+        old_users, new_users = old.get(date_key, {}), new.get(date_key, {})
+        for username in sorted(set(old_users) | set(new_users)):
+            old_numbers, new_numbers = old_users.get(username, {}), new_users.get(username, {})
+            for number in sorted(set(old_numbers) | set(new_numbers)):
+                before, after = old_numbers.get(number, 0), new_numbers.get(number, 0)
+                if before != after:
+                    lines.append(f"  {date_key} {username} {number}: {before} -> {after}")
+    return lines
+
+def print_diff(baseline, result):
+    changes = diff_ledgers(baseline['ledger'], result['ledger'])
+    print(f"\nLedger: {'identical' if not changes else f'{len(changes)} differences'}")
+    for line in changes[:50]:
+        print(line)
+    if len(changes) > 50:
+        print(f"  ... {len(changes) - 50} more")
+
+    print(f"\n{'handler':<24}{'count':>8}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}")
+    old_timings = baseline['timings']
+    for name, stats in sorted(result['timings'].items()):
+        old = old_timings.get(name)
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if old and old[key]:
+                cells.append(f"{stats[key]:.2f} ({stats[key] / old[key]:.2f}x)")
+            else:
+                cells.append(f"{stats[key]:.2f}")
+        print(f"{name:<24}{stats['count']:>8}" + "".join(f"{cell:>16}" for cell in cells))
+
+async def main(args):
+    header, records = read_log(args.logs)
+    if not records:
+        raise SystemExit("No updates in the log")
+
+    storage_module = database
+    if args.storage == "memory":
+        storage_module = MemoryStorage()
+        install_storage(bot, storage_module)
+    else:
+        if args.storage == "sqlite":
+            use_backend("sqlite", path=args.sqlite_path)
+        database.init_db()
+
+    app = bot.build_application(token="0:replay", request=StubRequest(args.api_latency / 1000))
+    await app.initialize()
+    await restore_state(header, records)
+    samples = metrics.collect_samples()
+    start = perf_counter()
+    try:
+        max_lag = await replay(app, records, args.speed)
+    finally:
+        await app.shutdown()
+    elapsed = perf_counter() - start
+
+    result = {
+        'updates': len(records),
+        'recorded_seconds': round(records[-1]['t'] - records[0]['t'], 3),
+        'replay_seconds': round(elapsed, 3),
+        'speed': args.speed,
+        'max_lag_s': round(max_lag, 3),
+        'ledger': await collect_ledger(storage_module),
+        'timings': timing_summary(samples),
+    }
+    print(f"Replayed {result['updates']} updates ({result['recorded_seconds']}s recorded) "
+          f"in {result['replay_seconds']}s, max lag {result['max_lag_s']}s")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as out:
+            json.dump(result, out, indent=2, ensure_ascii=False)
+        print(f"Result written to {args.out}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline:
+            print_diff(json.load(baseline), result)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded updates and diff ledgers and timings")
+    parser.add_argument("logs", nargs='+', help="Recorded JSONL files, oldest first")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up; 0 replays as fast as possible")
+    parser.add_argument("--storage", choices=("memory", "sqlite", "postgres"), default="memory",
+                        help="postgres uses the PG* environment, which should point at a scratch database")
+    parser.add_argument("--sqlite-path", default="replay.db", help="Database file for --storage sqlite")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Simulated Bot API latency in ms")
+    parser.add_argument("--out", help="Write the ledger and timings to this file")
+    parser.add_argument("--baseline", help="Earlier --out file to diff against")
+    asyncio.run(main(parser.parse_args()))
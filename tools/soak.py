@@ -0,0 +1,179 @@
+# Soak test: run the real application against the local stand-in Bot API (fake_bot_api.py)
+# with simulated agents posting slips, and report end-to-end reply latency, memory growth
+# and error rates at a fixed interval.
+#
+#   python tools/soak.py --agents 40 --duration 7200 --think-time 5
+#   python tools/soak.py --mode webhook --duration 600 --json soak.json
+import json
+import random
+import asyncio
+import argparse
+from time import perf_counter, monotonic
+
+from harness import (
+    MemoryStorage, install_storage, prepare_bot, message_data, percentile,
+    ADMIN_ID, BENCH_DATE_KEY,
+)
+from fake_bot_api import FakeBotAPI
+from bench_handlers import random_slip
+from telegram import Update
+import bot
+import database
+from storage import use_backend
+import metrics
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Soak:
+    def __init__(self, api, args):
+        self.api = api
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.window = []  # Reply latencies (seconds) since the last report
+        self.totals = {'sent': 0, 'replies': 0, 'timeouts': 0}
+        self.snapshots = []
+        self.started = monotonic()
+        self.start_rss = rss_mb()
+
+    async def agent(self, user_id, stop_at):
+        while monotonic() < stop_at:
+            await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+            if user_id == ADMIN_ID:
+                text = "/ledger"
+            else:
+                text = random_slip(self.rng, self.args.max_lines)
+            reply = self.api.wait_for_reply(user_id)
+            start = perf_counter()
+            self.api.push_update({"message": message_data(user_id, text)})
+            self.totals['sent'] += 1
+            try:
+                await asyncio.wait_for(reply, self.args.reply_timeout)
+            except asyncio.TimeoutError:
+                self.totals['timeouts'] += 1
+                continue
+            self.totals['replies'] += 1
+            self.window.append(perf_counter() - start)
+
+    def report(self):
+        latencies, self.window = sorted(self.window), []
+        rss = rss_mb()
+        errors = sum(metrics.handler_errors.values())
+        snapshot = {
+            'elapsed_s': round(monotonic() - self.started, 1),
+            **self.totals,
+            'window_replies': len(latencies),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'rss_mb': round(rss, 1),
+            'rss_growth_mb': round(rss - self.start_rss, 1),
+            'handler_errors': errors,
+            'error_rate': round(errors / self.totals['sent'], 5) if self.totals['sent'] else 0.0,
+            'api_errors': self.api.stats['errors'],
+            'flood_waits': self.api.stats['flood_waits'],
+            'message_store': len(bot.message_store),
+            'ingest_queue': bot.ingest_queue.qsize() if bot.ingest_queue else 0,
+        }
+        self.snapshots.append(snapshot)
+        print(f"[{snapshot['elapsed_s']:>8.0f}s] sent={snapshot['sent']} replies={snapshot['replies']} "
+              f"timeouts={snapshot['timeouts']} p50/p95/p99={snapshot['p50_ms']}/{snapshot['p95_ms']}/{snapshot['p99_ms']} ms "
+              f"rss={snapshot['rss_mb']} MB (+{snapshot['rss_growth_mb']}) errors={snapshot['handler_errors']} "
+              f"({snapshot['error_rate']:.3%}) flood_waits={snapshot['flood_waits']} store={snapshot['message_store']}",
+              flush=True)
+
+    async def reporter(self, stop_at):
+        while monotonic() < stop_at:
+            await asyncio.sleep(min(self.args.report_interval, max(0.0, stop_at - monotonic())))
+            self.report()
+
+# Stand-in for the webhook server (PTB's own needs tornado): feed POSTed updates to the app
+async def start_webhook_receiver(app):
+    async def receive(reader, writer):
+        try:
+            await reader.readline()
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            data = json.loads(await reader.readexactly(length))
+            await app.update_queue.put(Update.de_json(data, app.bot))
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(receive, "127.0.0.1", 0)
+    return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/webhook"
+
+async def main(args):
+    if args.storage == "memory":
+        install_storage(bot, MemoryStorage())
+    else:
+        if args.storage == "sqlite":
+            use_backend("sqlite", path=args.sqlite_path)
+        database.init_db()
+        await database.delete_date_data(BENCH_DATE_KEY)
+
+    api = await FakeBotAPI(latency=args.api_latency / 1000, error_rate=args.flood_rate, seed=args.seed).start()
+    app = bot.build_application(token="0:soak", base_url=api.base_url)
+    prepare_bot(bot)
+    receiver = None
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    if args.mode == "polling":
+        await app.updater.start_polling(poll_interval=0, timeout=10)
+    else:
+        receiver, url = await start_webhook_receiver(app)
+        await app.bot.set_webhook(url)
+
+    soak = Soak(api, args)
+    stop_at = monotonic() + args.duration
+    agents = [soak.agent(10000 + i, stop_at) for i in range(args.agents)] + [soak.agent(ADMIN_ID, stop_at)]
+    print(f"Soak: {args.agents} agents for {args.duration:.0f}s via {args.mode} on {api.base_url}", flush=True)
+    try:
+        await asyncio.gather(soak.reporter(stop_at), *agents)
+    finally:
+        if app.updater.running:
+            await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+        if receiver is not None:
+            receiver.close()
+        await api.stop()
+        if args.storage != "memory":
+            await database.delete_date_data(BENCH_DATE_KEY)
+
+    print(f"API calls: {api.stats['calls']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as out:
+            json.dump(soak.snapshots, out, indent=2)
+        print(f"Snapshots written to {args.json}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end soak test against a local fake Bot API")
+    parser.add_argument("--agents", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=600, help="Seconds to run")
+    parser.add_argument("--think-time", type=float, default=5.0, help="Mean seconds between an agent's slips")
+    parser.add_argument("--max-lines", type=int, default=5, help="Most lines in one slip")
+    parser.add_argument("--reply-timeout", type=float, default=30.0)
+    parser.add_argument("--report-interval", type=float, default=60.0)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Simulated Bot API latency in ms")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Share of sends answered with a 429")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--storage", choices=("memory", "sqlite", "postgres"), default="memory")
+    parser.add_argument("--sqlite-path", default="soak.db", help="Database file for --storage sqlite")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the periodic snapshots to this file")
+    asyncio.run(main(parser.parse_args()))
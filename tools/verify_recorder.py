@@ -0,0 +1,41 @@
+# Check that recorder.py's anonymization keeps recorded messages usable for replay: an add-user
+# message must still reach handle_new_user (its real name replaced, com/za untouched), known
+# names are replaced wherever they appear as a word, and numbers after "@" are left alone.
+#
+#   python tools/verify_recorder.py
+import harness
+import recorder
+import bot
+
+def handler_for(app, update):
+    for handler in app.handlers[0]:
+        if handler.check_update(update):
+            return handler.callback
+    return None
+
+def main():
+    app = bot.build_application("1:verify", request=harness.StubRequest())
+    for name in ("alice", "မမ", "Ko Aung"):
+        text = f"{name}@15@80"
+        recorded = recorder.anonymize_update(harness.message_update(app.bot, 2000, text).to_dict())['message']['text']
+        if name in recorded or not recorded.endswith("@15@80"):
+            raise SystemExit(f"add-user {text!r} recorded as {recorded!r}")
+        update = harness.message_update(app.bot, 2000, recorded)
+        if handler_for(app, update) is not bot.handle_new_user:
+            raise SystemExit(f"add-user {text!r} recorded as {recorded!r} no longer reaches handle_new_user")
+    recorded = recorder.anon_text("ask @bob about @15")
+    if "bob" in recorded or not recorded.endswith("@15"):
+        raise SystemExit(f"mention recorded as {recorded!r}")
+    # Known names as bare words (e.g. "/posthis bob") and as the admin's "@name" line, whatever their script or length
+    for name in ("bob", "al", "မမ", "ကိုကို"):
+        recorder.anon_name(name)
+        for text in (f"/posthis {name}", f"@{name}\n12-1000", f"posthis:{name}"):
+            recorded = recorder.anon_text(text)
+            if name in recorded:
+                raise SystemExit(f"{text!r} recorded as {recorded!r}")
+    if any(name.isdigit() for name in recorder.known_names):
+        raise SystemExit(f"numbers taken for usernames: {sorted(recorder.known_names)}")
+    print("recorded messages keep their shape")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Check the vectorized settlement engine (settlement.py) against the scalar per-bet code that
+# /total and /dateall used before it, on random sessions (overbuys, missing power numbers,
+# users without com/za settings) and optionally on real sessions from a database. Risk books
+# (risk.py), loaded at once or built slip by slip, must give /total's net for every outcome,
+# and /breakopt's figures must match actually overbuying everything over each limit.
+#
+#   python tools/verify_settlement.py --rounds 500
+#   python tools/verify_settlement.py --storage postgres --dates "01/06/2024 AM" "01/06/2024 PM"
+import random
+import asyncio
+import argparse
+from time import perf_counter
+
+import harness  # noqa: F401  (puts the repository on sys.path)
+import database
+from storage import use_backend
+from settlement import build_frame, settle, settlement_rows, DEFAULT_COM_ZA
+from risk import RiskBook, candidate_limits, evaluate_limits
+
+# /total before settlement.py: every amount counts, overbuys included
+def total_reference(bets, pnum, com_za):
+    user_totals, user_power = {}, {}
+    for username, _, num, amt in bets:
+        user_totals[username] = user_totals.get(username, 0) + amt
+        if num == pnum:
+            user_power[username] = user_power.get(username, 0) + amt
+    rows = []
+    for username, total_amt in user_totals.items():
+        com, za = com_za.get(username, DEFAULT_COM_ZA)
+        commission = (total_amt * com) // 100
+        after_com = total_amt - commission
+        win = user_power.get(username, 0) * za
+        rows.append({'username': username, 'total': total_amt, 'power': user_power.get(username, 0), 'com': com,
+                     'za': za, 'commission': commission, 'after_com': after_com, 'win': win, 'net': after_com - win})
+    return rows
+
+# /dateall before settlement.py: positive amounts only, power number per session
+def dateall_reference(bets_by_date, power_numbers, com_za):
+    reports = {}
+    for date_key, bets in bets_by_date.items():
+        pnum = power_numbers.get(date_key)
+        for username, _, num, amt in bets:
+            if username not in reports:
+                com, za = com_za.get(username, DEFAULT_COM_ZA)
+                reports[username] = {'total': 0, 'power': 0, 'com': com, 'za': za}
+            if amt > 0:
+                reports[username]['total'] += amt
+            if pnum is not None and num == pnum and amt > 0:
+                reports[username]['power'] += amt
+    rows = []
+    for username, report in reports.items():
+        commission = (report['total'] * report['com']) // 100
+        after_com = report['total'] - commission
+        win = report['power'] * report['za']
+        rows.append({'username': username, **report, 'commission': commission, 'after_com': after_com,
+                     'win': win, 'net': after_com - win})
+    return rows
+
+def random_case(rng):
+    date_keys = [f"{day:02d}/06/2024 {segment}" for day in range(1, 1 + rng.randint(1, 4)) for segment in ("AM", "PM")]
+    users = [f"agent{i}" for i in range(rng.randint(1, 40))]
+    # Sessions interleaved, as rows come back from the database ordered by id
+    bets = []
+    for _ in range(rng.randint(0, 400 * len(date_keys))):
+        amount = rng.choice((100, 200, 500, 1000, 5000, 12345))
+        if rng.random() < 0.05:
+            amount = -amount  # Overbuy
+        bets.append((rng.choice(users), rng.choice(date_keys), rng.randrange(100), amount))
+    power_numbers = {date_key: rng.randrange(100) for date_key in date_keys if rng.random() < 0.8}
+    com_za = {user: (rng.randint(0, 15), rng.choice((70, 80, 85, 90))) for user in users if rng.random() < 0.7}
+    return date_keys, bets, power_numbers, com_za
+
+def compare(name, expected, result):
+    actual = list(settlement_rows(result))
+    if expected != actual:
+        for want, got in zip(expected, actual):
+            if want != got:
+                raise SystemExit(f"{name}: mismatch\n  scalar:     {want}\n  vectorized: {got}")
+        raise SystemExit(f"{name}: {len(expected)} scalar rows vs {len(actual)} vectorized rows")
+
+def check_risk(date_key, session, com_za, rng):
+    expected = [sum(row['net'] for row in total_reference(session, pnum, com_za)) for pnum in range(100)]
+    loaded = RiskBook.from_frame(date_key, build_frame(session, [date_key]), com_za)
+    # Slip by slip, with com/za set late for some users, as the bot keeps a book current
+    live = RiskBook(date_key)
+    late = {user for user in com_za if rng.random() < 0.3}
+    start = 0
+    while start < len(session):
+        end = start + rng.randint(1, 10)
+        for username in dict.fromkeys(bet[0] for bet in session[start:end]):
+            slip = [(num, amt) for user, _, num, amt in session[start:end] if user == username]
+            live.add(username, slip, DEFAULT_COM_ZA if username in late else com_za.get(username, DEFAULT_COM_ZA))
+        start = end
+    for username in late:
+        live.set_rates(username, *com_za[username])
+    for name, book in (("loaded", loaded), ("live", live)):
+        if book.outcomes().tolist() != expected:
+            raise SystemExit(f"risk {date_key} ({name}): outcomes differ from /total")
+
+    dealer = rng.choice([session[0][0], "upstream"])
+    limits = candidate_limits(loaded, count=20)
+    result = evaluate_limits(loaded, limits, dealer, com_za.get(dealer, DEFAULT_COM_ZA))
+    for i, limit in enumerate(limits.tolist()):
+        over = [(num, -(total - limit)) for num, total in enumerate(loaded.numbers.tolist()) if total > limit]
+        overbought = session + [(dealer, date_key, num, amt) for num, amt in over]
+        nets = [sum(row['net'] for row in total_reference(overbought, pnum, com_za)) for pnum in range(100)]
+        if (result['overbuy'][i], result['worst_loss'][i]) != (-sum(amt for _, amt in over), max(0, -min(nets))) \
+                or abs(result['margin'][i] - sum(nets) / 100) > 1e-6:
+            raise SystemExit(f"breakopt {date_key}: limit {limit} differs from overbuying at it")
+
+def check(date_keys, bets, power_numbers, com_za):
+    for date_key in date_keys:
+        session = [bet for bet in bets if bet[1] == date_key]
+        if session:
+            check_risk(date_key, session, com_za, random.Random(len(session)))
+        if session and power_numbers.get(date_key) is not None:
+            pnum = power_numbers[date_key]
+            compare(f"total {date_key}", total_reference(session, pnum, com_za),
+                    settle(build_frame(session, [date_key]), {date_key: pnum}, com_za))
+    # The scalar /dateall walked the selected dates in turn; the engine gets every row at once
+    by_date = {date_key: [bet for bet in bets if bet[1] == date_key] for date_key in date_keys}
+    compare("dateall", dateall_reference(by_date, power_numbers, com_za),
+            settle(build_frame(bets, date_keys), power_numbers, com_za, positive_only=True))
+
+async def check_database(date_keys):
+    bets = await database.get_session_bets(date_keys)
+    power_numbers = await database.get_power_numbers(date_keys)
+    com_za = await database.get_users_com_za(sorted({bet[0] for bet in bets}))
+    start = perf_counter()
+    check(date_keys, bets, power_numbers, com_za)
+    print(f"{len(bets)} bets in {len(date_keys)} sessions match ({perf_counter() - start:.2f}s)")
+
+def main(args):
+    if args.dates:
+        if args.storage == "sqlite":
+            use_backend("sqlite", path=args.sqlite_path)
+        asyncio.run(check_database(args.dates))
+        return
+    rng = random.Random(args.seed)
+    for _ in range(args.rounds):
+        check(*random_case(rng))
+    print(f"{args.rounds} random cases match")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify settlement.py against the scalar settlement code")
+    parser.add_argument("--rounds", type=int, default=200, help="Random cases to check")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dates", nargs='+', help="Check these sessions from the database instead")
+    parser.add_argument("--storage", choices=("sqlite", "postgres"), default="postgres")
+    parser.add_argument("--sqlite-path", default="bot.db", help="Database file for --storage sqlite")
+    main(parser.parse_args())
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import random
+import logging
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from telegram.request import HTTPXRequest
+from logconfig import background_handler
+
+# Traces are kept when sampled by rate or when the whole update took at least TRACE_SLOW_MS
+TRACE_PATH = os.getenv("TRACE_PATH", "traces.jsonl")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))  # 0 disables latency-based sampling
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "5"))
+TRACING_ENABLED = TRACE_SAMPLE_RATE > 0 or TRACE_SLOW_MS > 0
+
+trace_logger = logging.getLogger("traces")
+trace_logger.propagate = False
+_sink_ready = False
+
+# Trace and span being recorded in this task
+current_trace = contextvars.ContextVar('current_trace', default=None)
+current_span = contextvars.ContextVar('current_span', default=None)
+
+def _sink():
+    global _sink_ready
+    if not _sink_ready:
+        handler = RotatingFileHandler(TRACE_PATH, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        # File writes and rotation happen on a background thread, off the event loop
+        trace_logger.addHandler(background_handler(handler))
+        trace_logger.setLevel(logging.INFO)
+        _sink_ready = True
+    return trace_logger
+
+# Serialized lazily, when the background thread formats the log record
+class _TraceRecord:
+    def __init__(self, record):
+        self.record = record
+
+    def __str__(self):
+        return json.dumps(self.record, ensure_ascii=False, default=str)
+
+def _finish_trace(trace):
+    duration_ms = (time.perf_counter() - trace['t0']) * 1000
+    if random.random() >= TRACE_SAMPLE_RATE and not (TRACE_SLOW_MS and duration_ms >= TRACE_SLOW_MS):
+        return
+    record = {
+        'trace_id': trace['trace_id'],
+        'name': trace['name'],
+        'start': trace['start'],
+        'duration_ms': round(duration_ms, 3),
+        **trace['attrs'],
+        'spans': trace['spans'],
+    }
+    _sink().info("%s", _TraceRecord(record))
+
+# Start a span; with no trace running, a root span starts a new trace
+def start_span(name, root=False, **attrs):
+    if not TRACING_ENABLED:
+        return None
+    trace = current_trace.get()
+    if trace is None:
+        if not root:
+            return None
+        trace = {
+            'trace_id': f"{random.getrandbits(64):016x}",
+            'name': name,
+            'start': datetime.now().isoformat(timespec='milliseconds'),
+            't0': time.perf_counter(),
+            'attrs': attrs,
+            'spans': [],
+            'open': 1,
+        }
+        attrs = {}
+        trace_token = current_trace.set(trace)
+    else:
+        trace_token = None
+    parent = current_span.get()
+    span = {
+        'id': len(trace['spans']) + 1,
+        'parent': parent['id'] if parent else None,
+        'name': name,
+        'start_ms': round((time.perf_counter() - trace['t0']) * 1000, 3),
+        **attrs,
+    }
+    trace['spans'].append(span)
+    return (trace, span, trace_token, current_span.set(span), time.perf_counter())
+
+def end_span(handle, **attrs):
+    if handle is None:
+        return
+    trace, span, trace_token, span_token, t0 = handle
+    span['duration_ms'] = round((time.perf_counter() - t0) * 1000, 3)
+    span.update(attrs)
+    current_span.reset(span_token)
+    if trace_token is not None:
+        current_trace.reset(trace_token)
+        release_trace(trace)
+
+# Context manager form of start_span/end_span; yields a dict for extra span attributes
+@contextmanager
+def span(name, root=False, **attrs):
+    handle = start_span(name, root=root, **attrs)
+    try:
+        yield handle[1] if handle else {}
+    except BaseException as e:
+        end_span(handle, error=repr(e))
+        raise
+    else:
+        end_span(handle)
+
+# Keep the current trace open across a hand-off to another task (e.g. the ingest queue)
+def hold_trace():
+    trace = current_trace.get()
+    if trace is not None:
+        trace['open'] += 1
+    return trace, current_span.get()
+
+# Continue a held trace in the current task; pair with release_trace when done
+def resume_trace(held):
+    trace, parent = held
+    current_trace.set(trace)
+    current_span.set(parent)
+    return trace
+
+def release_trace(trace):
+    if trace is None:
+        return
+    trace['open'] -= 1
+    if trace['open'] == 0:
+        _finish_trace(trace)
+
+# Bot API request that records a span for every Telegram call made inside a trace
+class TracingRequest(HTTPXRequest):
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        with span("tg." + url.rsplit('/', 1)[-1]):
+            return await super().do_request(url, method, request_data, *args, **kwargs)